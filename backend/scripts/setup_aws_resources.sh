@@ -76,14 +76,22 @@ echo ""
 # ============================================================================
 echo -e "${GREEN}[2/5] Uploading scripts to S3...${NC}"
 
-# Upload Glue ETL script
+# Upload Glue ETL script and its transformations module
 aws s3 cp src/processing/glue_etl_job.py \
     "s3://${DATA_LAKE_BUCKET}/scripts/glue_etl_job.py" \
     --region "${AWS_REGION}"
+aws s3 cp src/processing/etl_transforms.py \
+    "s3://${DATA_LAKE_BUCKET}/scripts/etl_transforms.py" \
+    --region "${AWS_REGION}"
+
+# Upload shared instrumentation module (Glue --extra-py-files)
+aws s3 cp src/common/instrumentation.py \
+    "s3://${DATA_LAKE_BUCKET}/scripts/instrumentation.py" \
+    --region "${AWS_REGION}"
 
 # Package and upload Lambda function
 cd src/processing
-zip lambda_trigger.zip lambda_trigger.py
+zip -j lambda_trigger.zip lambda_trigger.py ../common/instrumentation.py
 aws s3 cp lambda_trigger.zip \
     "s3://${DATA_LAKE_BUCKET}/lambda/lambda_trigger.zip" \
     --region "${AWS_REGION}"
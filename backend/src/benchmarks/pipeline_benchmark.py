@@ -0,0 +1,552 @@
+"""
+Offline End-to-End Pipeline Benchmark
+
+Runs the whole pipeline locally at increasing scale and records how every
+stage behaves, so scaling behaviour and regressions can be tracked release
+over release. Nothing touches AWS.
+
+Stages:
+    generate  FlightDataGenerator search events -> raw/*.json.gz
+    etl       Glue ETL transformations on local Spark -> curated/ Parquet
+    split     Training sample -> train/ and validation/ CSV (local Spark)
+    train     train_xgboost.py on the sample -> model/
+    score     TreeEnsemble scoring of every curated offer -> predictions.parquet
+
+Features:
+- 1M / 10M / 100M (or any) search events per run
+- Every stage runs in its own process, so wall time, CPU time and peak memory
+  are measured per stage (peak memory is the largest process of the stage,
+  e.g. the Spark JVM)
+- Throughput and output size per stage
+- Results appended as JSON lines; optional comparison with a baseline run
+
+Usage:
+    python pipeline_benchmark.py --scales 1M 10M 100M --work-dir /mnt/benchmark \\
+        --results benchmark_results.jsonl --baseline previous_results.jsonl
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import argparse
+import gzip
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import time
+import uuid
+from datetime import datetime, timezone
+from multiprocessing import Pool
+
+import numpy as np
+import pandas as pd
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.append(os.path.join(SRC_DIR, 'ingestion'))
+sys.path.append(os.path.join(SRC_DIR, 'processing'))
+sys.path.append(os.path.join(SRC_DIR, 'training'))
+sys.path.append(os.path.join(SRC_DIR, 'deployment'))
+from kinesis_producer import FlightDataGenerator
+
+TRAIN_SCRIPT = os.path.join(SRC_DIR, 'training', 'train_xgboost.py')
+
+STAGES = ['generate', 'etl', 'split', 'train', 'score']
+
+SCALE_SUFFIXES = {'K': 10 ** 3, 'M': 10 ** 6, 'B': 10 ** 9}
+
+# String columns one-hot encoded by train_xgboost.prepare_features
+CATEGORICAL_COLUMNS = ['origin_airport', 'destination_airport', 'airline', 'currency']
+
+
+def parse_scale(label):
+    """Number of events for a scale label: '1M' -> 1000000, '250K', '5000'"""
+    label = label.strip().upper()
+    if label[-1] in SCALE_SUFFIXES:
+        return int(float(label[:-1]) * SCALE_SUFFIXES[label[-1]])
+    return int(label)
+
+
+def directory_size(path):
+    """Total bytes of a file or directory tree"""
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    total = 0
+    for root, _, files in os.walk(path):
+        for name in files:
+            total += os.path.getsize(os.path.join(root, name))
+    return total
+
+
+def git_commit():
+    """Short commit hash of the benchmarked tree (None outside a checkout)"""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC_DIR,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# ============================================================================
+# Stages (each runs in its own process, see run_stage)
+# ============================================================================
+
+def write_raw_file(task):
+    """
+    Generate one gzipped JSON-lines file of search events (pool worker)
+
+    Args:
+        task: (path, first_event, num_events, seed)
+
+    Returns:
+        (events, price_offers) written
+    """
+    path, first_event, num_events, seed = task
+    random.seed(seed)
+
+    generator = FlightDataGenerator()
+    # Offset the counter so search_ids stay unique across files
+    generator.search_counter = first_event
+
+    offers = 0
+    with gzip.open(path, 'wt', compresslevel=1) as f:
+        for _ in range(num_events):
+            event = generator.generate_search_event()
+            offers += len(event['price_offers'])
+            f.write(json.dumps(event))
+            f.write('\n')
+    return num_events, offers
+
+
+def generate_stage(config):
+    """Synthesize config['num_events'] raw search events in parallel"""
+    raw_dir = os.path.join(config['scale_dir'], 'raw')
+    shutil.rmtree(raw_dir, ignore_errors=True)
+    os.makedirs(raw_dir)
+
+    num_events = config['num_events']
+    events_per_file = config['events_per_file']
+    tasks = [
+        (os.path.join(raw_dir, f'part-{i:05d}.json.gz'), first,
+         min(events_per_file, num_events - first), config['seed'] + i)
+        for i, first in enumerate(range(0, num_events, events_per_file))
+    ]
+
+    with Pool(config['workers'] or os.cpu_count()) as pool:
+        written = pool.map(write_raw_file, tasks, chunksize=1)
+
+    return {
+        'records': sum(events for events, _ in written),
+        'output_records': sum(offers for _, offers in written),
+        'output_path': raw_dir
+    }
+
+
+def local_spark(app_name, driver_memory):
+    """Local Spark session using every core"""
+    # Imported here: only the Spark stages need pyspark
+    from pyspark.sql import SparkSession
+
+    return (SparkSession.builder
+            .master('local[*]')
+            .appName(app_name)
+            .config('spark.driver.memory', driver_memory)
+            .config('spark.ui.enabled', 'false')
+            .getOrCreate())
+
+
+def stop_spark(spark):
+    """
+    Stop Spark and wait for the local JVM to exit, so its memory counts
+    toward the stage's resource usage
+    """
+    gateway = spark.sparkContext._gateway
+    spark.stop()
+    proc = getattr(gateway, 'proc', None)
+    if proc is not None:
+        # The gateway JVM exits once its stdin is closed
+        proc.stdin.close()
+        proc.wait()
+
+
+def etl_stage(config):
+    """Run the Glue job's transformations on local Spark"""
+    from etl_transforms import (
+        RAW_EVENT_SCHEMA, flatten_price_offers, clean_offers, engineer_features
+    )
+
+    scale_dir = config['scale_dir']
+    curated_dir = os.path.join(scale_dir, 'curated')
+
+    spark = local_spark('pipeline-benchmark-etl', config['driver_memory'])
+
+    # Explicit schema: no extra pass over the raw data to infer it
+    raw_df = spark.read.schema(RAW_EVENT_SCHEMA).json(os.path.join(scale_dir, 'raw'))
+    curated_df = engineer_features(clean_offers(flatten_price_offers(raw_df)))
+    curated_df.write.mode('overwrite').parquet(curated_dir)
+
+    # Parquet footers hold the row counts, so this does not rescan the data
+    curated_rows = spark.read.parquet(curated_dir).count()
+    stop_spark(spark)
+
+    return {
+        'records': load_stage_result(scale_dir, 'generate')['records'],
+        'output_records': curated_rows,
+        'output_path': curated_dir
+    }
+
+
+def split_stage(config):
+    """Sample curated rows into train/validation CSV for train_xgboost.py"""
+    from backtest import NON_FEATURE_COLUMNS
+
+    scale_dir = config['scale_dir']
+    spark = local_spark('pipeline-benchmark-split', config['driver_memory'])
+
+    curated_df = spark.read.parquet(os.path.join(scale_dir, 'curated'))
+    curated_rows = curated_df.count()
+
+    # Training happens in memory on one machine: cap the sample size
+    sample_df = curated_df.drop(*NON_FEATURE_COLUMNS)
+    if curated_rows > config['max_train_rows']:
+        sample_df = sample_df.sample(fraction=config['max_train_rows'] / curated_rows,
+                                     seed=config['seed'])
+    sample_df = sample_df.cache()
+
+    validation_fraction = config['validation_fraction']
+    train_df, validation_df = sample_df.randomSplit(
+        [1 - validation_fraction, validation_fraction], seed=config['seed'])
+
+    train_df.write.mode('overwrite').option('header', True).csv(os.path.join(scale_dir, 'train'))
+    validation_df.write.mode('overwrite').option('header', True).csv(
+        os.path.join(scale_dir, 'validation'))
+
+    train_rows, validation_rows = train_df.count(), validation_df.count()
+    stop_spark(spark)
+
+    return {
+        'records': curated_rows,
+        'output_records': train_rows + validation_rows,
+        'train_rows': train_rows,
+        'validation_rows': validation_rows,
+        'output_path': os.path.join(scale_dir, 'train')
+    }
+
+
+def score_frame(ensemble, frame):
+    """
+    Score curated rows with a TreeEnsemble
+
+    Builds the columns train_xgboost.prepare_features produced for training:
+    numeric columns as is, categorical columns one-hot as `<column>_<value>`.
+
+    Args:
+        ensemble: TreeEnsemble with feature_names
+        frame: Curated rows (DataFrame)
+
+    Returns:
+        float32 array of predicted prices
+    """
+    categorical = [column for column in CATEGORICAL_COLUMNS if column in frame.columns]
+    encoded = pd.get_dummies(frame, columns=categorical)
+    X = encoded.reindex(columns=ensemble.feature_names, fill_value=0)
+    return ensemble.predict(X.to_numpy(dtype=np.float32))
+
+
+def score_stage(config):
+    """Score every curated offer with the local tree scorer"""
+    # Imported here: only this stage reads Parquet incrementally
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from tree_scorer import TreeEnsemble
+
+    scale_dir = config['scale_dir']
+    ensemble = TreeEnsemble.from_model_dir(os.path.join(scale_dir, 'model'))
+
+    needed = set(ensemble.feature_names)
+    dataset = ds.dataset(os.path.join(scale_dir, 'curated'), format='parquet')
+    columns = ['search_id', 'flight_number'] + [
+        name for name in dataset.schema.names
+        if name in needed or name in CATEGORICAL_COLUMNS
+    ]
+
+    output_path = os.path.join(scale_dir, 'predictions.parquet')
+    schema = pa.schema([('search_id', pa.string()), ('flight_number', pa.string()),
+                        ('predicted_price', pa.float32())])
+
+    rows = 0
+    with pq.ParquetWriter(output_path, schema) as writer:
+        for batch in dataset.to_batches(columns=columns, batch_size=config['score_batch_size']):
+            frame = batch.to_pandas()
+            predictions = score_frame(ensemble, frame)
+            writer.write_table(pa.table({
+                'search_id': frame['search_id'],
+                'flight_number': frame['flight_number'],
+                'predicted_price': predictions
+            }, schema=schema))
+            rows += len(frame)
+
+    return {'records': rows, 'output_records': rows, 'output_path': output_path}
+
+
+STAGE_FUNCTIONS = {
+    'generate': generate_stage,
+    'etl': etl_stage,
+    'split': split_stage,
+    'score': score_stage
+}
+
+
+def stage_result_path(scale_dir, stage):
+    return os.path.join(scale_dir, f'{stage}.result.json')
+
+
+def load_stage_result(scale_dir, stage):
+    """Result written by an earlier (possibly earlier-run) stage"""
+    with open(stage_result_path(scale_dir, stage)) as f:
+        return json.load(f)
+
+
+def save_stage_result(scale_dir, stage, result):
+    with open(stage_result_path(scale_dir, stage), 'w') as f:
+        json.dump(result, f)
+
+
+# ============================================================================
+# Driver
+# ============================================================================
+
+def stage_command(stage, config):
+    """Command line that runs one stage in a fresh process"""
+    if stage == 'train':
+        scale_dir = config['scale_dir']
+        for name in ['model', 'train_output']:
+            os.makedirs(os.path.join(scale_dir, name), exist_ok=True)
+        return [
+            sys.executable, TRAIN_SCRIPT,
+            '--train', os.path.join(scale_dir, 'train'),
+            '--validation', os.path.join(scale_dir, 'validation'),
+            '--model-dir', os.path.join(scale_dir, 'model'),
+            '--output-data-dir', os.path.join(scale_dir, 'train_output'),
+            '--num_round', str(config['num_round']),
+            # Per-stage and per-round timings for drilling into the train stage
+            '--trace-file', os.path.join(scale_dir, 'train_trace.jsonl')
+        ]
+    return [sys.executable, os.path.abspath(__file__),
+            '--run-stage', stage, '--stage-config', json.dumps(config)]
+
+
+def run_stage(stage, config):
+    """
+    Run one stage in a child process and measure it
+
+    Args:
+        stage: Stage name
+        config: Scale configuration (see main)
+
+    Returns:
+        (exit_code, wall_seconds, cpu_seconds, peak_rss_mb)
+    """
+    start = time.perf_counter()
+    proc = subprocess.Popen(stage_command(stage, config))
+    _, status, usage = os.wait4(proc.pid, 0)
+    wall_seconds = time.perf_counter() - start
+    proc.returncode = os.waitstatus_to_exitcode(status)
+
+    # Resource usage includes the stage's reaped children (pool workers,
+    # Spark JVM); ru_maxrss is the largest of those processes, in KB
+    cpu_seconds = usage.ru_utime + usage.ru_stime
+    return proc.returncode, wall_seconds, cpu_seconds, usage.ru_maxrss / 1024
+
+
+def stage_record(stage, config, run_info, exit_code, wall_seconds, cpu_seconds, peak_rss_mb):
+    """One results-file line for a finished stage"""
+    record = {
+        **run_info,
+        'scale': config['scale'],
+        'num_events': config['num_events'],
+        'stage': stage,
+        'status': 'ok' if exit_code == 0 else 'failed',
+        'wall_seconds': round(wall_seconds, 3),
+        'cpu_seconds': round(cpu_seconds, 3),
+        'peak_rss_mb': round(peak_rss_mb, 1)
+    }
+    if exit_code != 0:
+        return record
+
+    scale_dir = config['scale_dir']
+    if stage == 'train':
+        split = load_stage_result(scale_dir, 'split')
+        result = {'records': split['train_rows'], 'output_records': split['train_rows'],
+                  'output_path': os.path.join(scale_dir, 'model')}
+        save_stage_result(scale_dir, 'train', result)
+    else:
+        result = load_stage_result(scale_dir, stage)
+
+    record.update({
+        'records': result['records'],
+        'output_records': result['output_records'],
+        'records_per_second': round(result['records'] / wall_seconds, 1),
+        'output_bytes': directory_size(result['output_path'])
+    })
+    return record
+
+
+def compare_results(current, baseline, tolerance=0.10):
+    """
+    Compare this run's stage records with the latest baseline records
+
+    Args:
+        current: Stage records of this run
+        baseline: Stage records of earlier runs (results file lines)
+        tolerance: Allowed relative regression (0.10 = 10%)
+
+    Returns:
+        List of regression messages (empty if none)
+    """
+    latest = {}
+    for record in baseline:
+        if record['status'] == 'ok':
+            latest[(record['scale'], record['stage'])] = record
+
+    regressions = []
+    for record in current:
+        key = (record['scale'], record['stage'])
+        if record['status'] != 'ok':
+            if key in latest:
+                regressions.append(f"{key[0]} {key[1]}: failed")
+            continue
+        if key not in latest:
+            continue
+
+        name = f"{key[0]} {key[1]}"
+        before, after = latest[key]['records_per_second'], record['records_per_second']
+        if before > 0 and after < before * (1 - tolerance):
+            regressions.append(f"{name} records_per_second: {before:,.0f} -> {after:,.0f}")
+
+        before, after = latest[key]['peak_rss_mb'], record['peak_rss_mb']
+        if before > 0 and after > before * (1 + tolerance):
+            regressions.append(f"{name} peak_rss_mb: {before:,.0f} -> {after:,.0f}")
+
+    return regressions
+
+
+def print_summary(records):
+    """Per-stage table for one scale"""
+    print(f"\n{'stage':<10}{'wall s':>10}{'cpu s':>10}{'records/s':>14}"
+          f"{'peak MB':>10}{'output MB':>12}")
+    for record in records:
+        if record['status'] != 'ok':
+            print(f"{record['stage']:<10}{'FAILED':>10}")
+            continue
+        print(f"{record['stage']:<10}{record['wall_seconds']:>10.1f}{record['cpu_seconds']:>10.1f}"
+              f"{record['records_per_second']:>14,.0f}{record['peak_rss_mb']:>10,.0f}"
+              f"{record['output_bytes'] / 1e6:>12,.1f}")
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Offline end-to-end pipeline benchmark')
+    parser.add_argument('--scales', nargs='+', default=['1M'],
+                        help='Search events per run, e.g. 1M 10M 100M')
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=STAGES,
+                        help='Stages to run (later stages reuse earlier outputs in --work-dir)')
+    parser.add_argument('--work-dir', type=str, default='benchmark_work')
+    parser.add_argument('--results', type=str, default='benchmark_results.jsonl',
+                        help='JSON-lines file the stage records are appended to')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='Results file of earlier runs to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+    parser.add_argument('--workers', type=int, default=None,
+                        help='Generator processes (default: all cores)')
+    parser.add_argument('--events-per-file', type=int, default=1_000_000)
+    parser.add_argument('--driver-memory', type=str, default='4g', help='Local Spark memory')
+    parser.add_argument('--max-train-rows', type=int, default=2_000_000)
+    parser.add_argument('--validation-fraction', type=float, default=0.2)
+    parser.add_argument('--num-round', type=int, default=100)
+    parser.add_argument('--score-batch-size', type=int, default=65536)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--cleanup', action='store_true',
+                        help='Delete each scale\'s data once its stages finished')
+    # Internal: run a single stage in this process
+    parser.add_argument('--run-stage', choices=list(STAGE_FUNCTIONS), help=argparse.SUPPRESS)
+    parser.add_argument('--stage-config', type=str, help=argparse.SUPPRESS)
+
+    args = parser.parse_args()
+
+    if args.run_stage:
+        config = json.loads(args.stage_config)
+        result = STAGE_FUNCTIONS[args.run_stage](config)
+        save_stage_result(config['scale_dir'], args.run_stage, result)
+        return
+
+    run_info = {
+        'run_id': uuid.uuid4().hex[:12],
+        'started_at': datetime.now(timezone.utc).isoformat(),
+        'git_commit': git_commit(),
+        'host': platform.node(),
+        'cpus': os.cpu_count()
+    }
+    stages = [stage for stage in STAGES if stage in args.stages]
+
+    all_records = []
+    for scale in args.scales:
+        config = {
+            'scale': scale,
+            'num_events': parse_scale(scale),
+            'scale_dir': os.path.abspath(os.path.join(args.work_dir, scale)),
+            'workers': args.workers,
+            'events_per_file': args.events_per_file,
+            'driver_memory': args.driver_memory,
+            'max_train_rows': args.max_train_rows,
+            'validation_fraction': args.validation_fraction,
+            'num_round': args.num_round,
+            'score_batch_size': args.score_batch_size,
+            'seed': args.seed
+        }
+        os.makedirs(config['scale_dir'], exist_ok=True)
+
+        print(f"\n=== Scale {scale}: {config['num_events']:,} search events ===")
+        records = []
+        for stage in stages:
+            print(f"\n--- {stage} ---")
+            measurements = run_stage(stage, config)
+            record = stage_record(stage, config, run_info, *measurements)
+            records.append(record)
+
+            # Append as we go: a failed or interrupted run keeps earlier stages
+            with open(args.results, 'a') as f:
+                f.write(json.dumps(record) + '\n')
+
+            if record['status'] != 'ok':
+                print(f"Stage {stage} failed (exit code {measurements[0]}), "
+                      f"skipping the remaining stages of scale {scale}")
+                break
+
+        print(f"\n=== Scale {scale} results ===")
+        print_summary(records)
+        all_records.extend(records)
+
+        if args.cleanup:
+            shutil.rmtree(config['scale_dir'], ignore_errors=True)
+
+    print(f"\nResults appended to {args.results} (run {run_info['run_id']})")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = [json.loads(line) for line in f if line.strip()]
+        regressions = compare_results(all_records, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,457 @@
+"""
+Shared Pipeline Instrumentation: Spans, Counters and Latency Histograms
+
+A small, dependency-free tracing layer used by the producer, the Glue job,
+the Lambda trigger, training and the inference client, so time can be
+followed from search event to price. Everything is written as JSON lines
+to a local file; nothing is recorded unless tracing is configured.
+
+Features:
+- Spans (context manager or start/end) with parent/child links
+- Trace ID propagated from the search event's search_id
+- Counters and HDR-style latency histograms, flushed as JSON lines
+- Per-trace sampling (every span of a sampled search is kept)
+- Optional sampling profiler thread (aggregated Python stacks)
+- Disabled by default: span() returns a shared no-op object after a
+  single flag check
+
+Configuration (or call configure() directly):
+    PIPELINE_TRACE_FILE       JSON-lines output path; enables tracing
+    PIPELINE_TRACE_SAMPLE     Fraction of traces to keep (default 1.0)
+    PIPELINE_PROFILE_HZ       Sampling profiler frequency (default 0 = off)
+
+Usage:
+    from instrumentation import increment, span, trace
+
+    with trace(event['search_id']):
+        with span('kinesis.put_record', shard=shard_id):
+            ...
+    increment('kinesis.records_sent')
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import atexit
+import contextvars
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import zlib
+from collections import Counter
+
+
+class LatencyHistogram:
+    """
+    Log-linear latency histogram in microseconds (HdrHistogram-style)
+
+    Values below 2^sub_bucket_bits are recorded exactly; above that every
+    power-of-two range is split into 2^(sub_bucket_bits - 1) buckets, which
+    bounds the relative error to about 1.6% with the default of 7 bits.
+    """
+
+    def __init__(self, sub_bucket_bits=7):
+        self.sub_bucket_bits = sub_bucket_bits
+        self.sub_bucket_count = 1 << sub_bucket_bits
+        self.half_count = self.sub_bucket_count >> 1
+        self.counts = {}
+        self.total = 0
+        self.max_value = 0
+        self._lock = threading.Lock()
+
+    def _index(self, value):
+        if value < self.sub_bucket_count:
+            return value
+        shift = value.bit_length() - self.sub_bucket_bits
+        return self.sub_bucket_count + (shift - 1) * self.half_count + ((value >> shift) - self.half_count)
+
+    def _value_at(self, index):
+        """Highest value that maps to `index`"""
+        if index < self.sub_bucket_count:
+            return index
+        shift = (index - self.sub_bucket_count) // self.half_count + 1
+        sub = (index - self.sub_bucket_count) % self.half_count + self.half_count
+        return ((sub + 1) << shift) - 1
+
+    def record(self, seconds):
+        """Record one latency given in seconds"""
+        value = max(int(seconds * 1e6), 0)
+        index = self._index(value)
+        with self._lock:
+            self.counts[index] = self.counts.get(index, 0) + 1
+            self.total += 1
+            self.max_value = max(self.max_value, value)
+
+    def _snapshot(self):
+        """Consistent (sorted bucket counts, total, max value) while record() runs"""
+        with self._lock:
+            return sorted(self.counts.items()), self.total, self.max_value
+
+    def _percentile(self, snapshot, p):
+        counts, total, max_value = snapshot
+        if total == 0:
+            return 0.0
+        target = max(int(math.ceil(total * p / 100.0)), 1)
+        seen = 0
+        for index, count in counts:
+            seen += count
+            if seen >= target:
+                return min(self._value_at(index), max_value) / 1000.0
+        return max_value / 1000.0
+
+    def percentile(self, p):
+        """Latency in milliseconds at percentile p (0-100)"""
+        return self._percentile(self._snapshot(), p)
+
+    def to_dict(self):
+        """Compact serializable form: percentiles plus the non-empty buckets"""
+        snapshot = self._snapshot()
+        counts, total, max_value = snapshot
+        return {
+            'count': total,
+            'p50_ms': self._percentile(snapshot, 50),
+            'p90_ms': self._percentile(snapshot, 90),
+            'p99_ms': self._percentile(snapshot, 99),
+            'p999_ms': self._percentile(snapshot, 99.9),
+            'max_ms': max_value / 1000.0,
+            'sub_bucket_bits': self.sub_bucket_bits,
+            'buckets': {str(index): count for index, count in counts}
+        }
+
+
+class _NoopSpan:
+    """Returned by span() when tracing is off or the trace is not sampled"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attrs):
+        pass
+
+    def end(self, error=None):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+_current_trace = contextvars.ContextVar('trace_id', default=None)
+_current_span = contextvars.ContextVar('span_id', default=None)
+
+
+class Span:
+    """A timed operation, written as one JSON line when it ends"""
+
+    __slots__ = ('tracer', 'name', 'trace_id', 'span_id', 'parent_id', 'attrs',
+                 'start_wall', 'start', '_token')
+
+    def __init__(self, tracer, name, trace_id, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = trace_id
+        self.span_id = '%016x' % random.getrandbits(64)
+        self.parent_id = _current_span.get()
+        self.attrs = attrs
+        self.start_wall = time.time()
+        self.start = time.perf_counter()
+        self._token = _current_span.set(self.span_id)
+
+    def set(self, **attrs):
+        """Attach attributes (row counts, shard IDs, ...)"""
+        self.attrs.update(attrs)
+
+    def end(self, error=None):
+        """Finish the span and record it"""
+        if self._token is None:
+            return
+        duration = time.perf_counter() - self.start
+        try:
+            _current_span.reset(self._token)
+        except ValueError:
+            # Ended from a different context than it started in
+            pass
+        self._token = None
+        self.tracer._finish_span(self, duration, error)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.end(error=exc_type.__name__ if exc_type else None)
+        return False
+
+
+class Tracer:
+    """Holds configuration, metrics and the JSON-lines writer"""
+
+    def __init__(self):
+        self.enabled = False
+        self.output_path = None
+        self.sample_rate = 1.0
+        self.service = None
+        self.counters = Counter()
+        self.histograms = {}
+        self.profiler = None
+        self._buffer = []
+        self._lock = threading.Lock()
+        self._buffer_limit = 1000
+
+    def configure(self, output_path=None, sample_rate=1.0, profile_hz=0, service=None):
+        """
+        Enable tracing
+
+        Args:
+            output_path: JSON-lines file (appended to); None disables tracing
+            sample_rate: Fraction of traces kept (decided per trace ID)
+            profile_hz: Sampling profiler frequency; 0 disables it
+            service: Name stamped on every record (defaults to the script name)
+        """
+        self.flush()
+        self.output_path = output_path
+        self.enabled = bool(output_path)
+        self.sample_rate = sample_rate
+        self.service = service or os.path.basename(sys.argv[0] or 'python')
+
+        if self.profiler is not None:
+            self.profiler.stop()
+            self.profiler = None
+        if self.enabled and profile_hz:
+            self.profiler = SamplingProfiler(profile_hz)
+            self.profiler.start()
+
+    def sampled(self, trace_id):
+        """Consistent per-trace sampling decision"""
+        if self.sample_rate >= 1.0 or trace_id is None:
+            return True
+        return zlib.crc32(str(trace_id).encode('utf-8')) < self.sample_rate * 0xFFFFFFFF
+
+    def _write(self, record):
+        record['service'] = self.service
+        with self._lock:
+            # Encoded at flush time, off the traced code path
+            self._buffer.append(record)
+            if len(self._buffer) >= self._buffer_limit:
+                self._flush_buffer()
+
+    def _flush_buffer(self):
+        if not self._buffer or not self.output_path:
+            self._buffer = []
+            return
+        data = ''.join(json.dumps(record, default=str) + '\n' for record in self._buffer)
+        self._buffer = []
+        # One append per batch keeps lines from concurrent processes intact
+        with open(self.output_path, 'a') as f:
+            f.write(data)
+
+    def _finish_span(self, span, duration, error):
+        self.histogram(span.name).record(duration)
+        record = {
+            'type': 'span',
+            'name': span.name,
+            'trace_id': span.trace_id,
+            'span_id': span.span_id,
+            'parent_id': span.parent_id,
+            'start': span.start_wall,
+            'duration_ms': duration * 1000.0,
+            'attrs': span.attrs
+        }
+        if error:
+            record['error'] = error
+        self._write(record)
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self._lock:
+                histogram = self.histograms.setdefault(name, LatencyHistogram())
+        return histogram
+
+    def flush(self):
+        """
+        Write buffered spans plus counter, histogram and profile summaries
+
+        Summaries are cumulative; the latest record per name supersedes earlier ones.
+        """
+        if not self.enabled:
+            return
+        now = time.time()
+        with self._lock:
+            counters = sorted(self.counters.items())
+            histograms = sorted(self.histograms.items())
+        for name, value in counters:
+            self._write({'type': 'counter', 'name': name, 'value': value, 'time': now})
+        for name, histogram in histograms:
+            summary = histogram.to_dict()
+            summary.pop('buckets')
+            self._write({'type': 'histogram', 'name': name, 'time': now, **summary})
+        if self.profiler is not None:
+            self._write({'type': 'profile', 'time': now, **self.profiler.summary()})
+        with self._lock:
+            self._flush_buffer()
+
+
+class SamplingProfiler:
+    """
+    Background thread that samples every other thread's Python stack at a
+    fixed frequency and counts identical stacks (flame-graph input)
+    """
+
+    def __init__(self, hz=100, max_depth=32):
+        self.interval = 1.0 / hz
+        self.max_depth = max_depth
+        self.stacks = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None and len(stack) < self.max_depth:
+                    code = frame.f_code
+                    stack.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(stack))] += 1
+            self.samples += 1
+
+    def summary(self, top=50):
+        """Most frequent stacks in collapsed (root;...;leaf) form"""
+        return {
+            'interval_ms': self.interval * 1000.0,
+            'samples': self.samples,
+            'stacks': dict(self.stacks.most_common(top))
+        }
+
+
+_tracer = Tracer()
+
+
+def configure(output_path=None, sample_rate=1.0, profile_hz=0, service=None):
+    """Enable tracing for this process (see Tracer.configure)"""
+    _tracer.configure(output_path, sample_rate, profile_hz, service)
+
+
+def enabled():
+    """True when tracing is on; guard expensive attribute computation with it"""
+    return _tracer.enabled
+
+
+def _configure_from_environment():
+    output_path = os.environ.get('PIPELINE_TRACE_FILE')
+    if output_path:
+        configure(output_path,
+                  sample_rate=float(os.environ.get('PIPELINE_TRACE_SAMPLE', 1.0)),
+                  profile_hz=float(os.environ.get('PIPELINE_PROFILE_HZ', 0)))
+
+
+class trace:
+    """
+    Make `trace_id` the current trace for spans started inside the block
+
+    Usage:
+        with trace(event['search_id']):
+            ...
+    """
+
+    __slots__ = ('trace_id', '_token')
+
+    def __init__(self, trace_id):
+        self.trace_id = trace_id
+
+    def __enter__(self):
+        self._token = _current_trace.set(self.trace_id)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_trace.reset(self._token)
+        return False
+
+
+def current_trace_id():
+    """Trace ID of the enclosing trace() block, or None"""
+    return _current_trace.get()
+
+
+def span(name, trace_id=None, **attrs):
+    """
+    Start a span; use as a context manager or call .end()
+
+    Args:
+        name: Operation name, e.g. 'endpoint.invoke'
+        trace_id: Overrides the current trace ID
+        attrs: JSON-serializable attributes
+
+    Returns:
+        Span, or a no-op object when tracing is off or the trace is not sampled
+    """
+    if not _tracer.enabled:
+        return NOOP_SPAN
+    trace_id = trace_id or _current_trace.get()
+    if not _tracer.sampled(trace_id):
+        return NOOP_SPAN
+    return Span(_tracer, name, trace_id, attrs)
+
+
+def increment(name, value=1):
+    """Add to a counter (cumulative value reported on flush)"""
+    if _tracer.enabled:
+        with _tracer._lock:
+            _tracer.counters[name] += value
+
+
+def record_latency(name, seconds):
+    """Record a latency into the named histogram (reported on flush)"""
+    if _tracer.enabled:
+        _tracer.histogram(name).record(seconds)
+
+
+def flush():
+    """Write everything recorded so far"""
+    _tracer.flush()
+
+
+def _before_fork():
+    # Write pending spans once, in the parent, instead of from every child
+    with _tracer._lock:
+        _tracer._flush_buffer()
+
+
+def _after_fork_in_child():
+    # Start the child with empty metrics: counters and histograms are
+    # cumulative, so inherited values would be re-reported by every child
+    _tracer._lock = threading.Lock()
+    _tracer._buffer = []
+    _tracer.counters = Counter()
+    _tracer.histograms = {}
+    if _tracer.profiler is not None:
+        # The profiler thread does not survive fork
+        _tracer.profiler = SamplingProfiler(1.0 / _tracer.profiler.interval,
+                                            _tracer.profiler.max_depth)
+        _tracer.profiler.start()
+
+
+_configure_from_environment()
+atexit.register(flush)
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(before=_before_fork, after_in_child=_after_fork_in_child)
@@ -0,0 +1,324 @@
+"""
+Offline Autoscaling Simulator for the Price Prediction Endpoint
+
+configure_autoscaling() uses a target of 70 invocations per instance, 2-10
+instances and fixed cooldowns. This simulator replays an invocation time
+series against a service-time model and emulates SageMaker target tracking
+so those values can be chosen to meet the 200 ms latency alarm at minimum
+cost.
+
+Model (per one-minute step, the granularity of the CloudWatch metric):
+- Target tracking on SageMakerVariantInvocationsPerInstance: scale out after
+  3 consecutive minutes above target, scale in after 15 consecutive minutes
+  below 90% of target, desired = ceil(instances * metric / target), with
+  scale-out / scale-in cooldowns and an instance warm-up delay
+- Each instance runs `workers_per_instance` model-server workers; latency is
+  approximated per minute with an M/G/c queue (Erlang C with the
+  Allen-Cunneen correction) plus a fluid backlog when arrivals exceed capacity
+- Service times come from a load_test.py results file (measured on the local
+  or real endpoint) or a log-normal fit of p50/p99
+
+Usage:
+    python autoscaling_simulator.py --load-test-results results.json \\
+        --invocations invocations.csv --targets 70 300 1200 --max-capacity 10 20
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import argparse
+import itertools
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from instrumentation import LatencyHistogram
+
+
+# Consecutive one-minute datapoints of the target-tracking alarms
+SCALE_OUT_DATAPOINTS = 3
+SCALE_IN_DATAPOINTS = 15
+SCALE_IN_THRESHOLD = 0.9
+
+
+class ServiceTimeModel:
+    """Per-request service time: mean, p99 and squared coefficient of variation"""
+
+    def __init__(self, mean_ms, p99_ms, cv2):
+        self.mean_ms = mean_ms
+        self.p99_ms = p99_ms
+        self.cv2 = cv2
+
+    @classmethod
+    def lognormal(cls, p50_ms, p99_ms):
+        """Fit a log-normal distribution to a measured p50 and p99"""
+        sigma = np.log(p99_ms / p50_ms) / 2.326
+        mean = p50_ms * np.exp(sigma ** 2 / 2)
+        return cls(mean, p99_ms, float(np.exp(sigma ** 2) - 1))
+
+    @classmethod
+    def from_load_test(cls, path):
+        """Use the service-time histogram recorded by load_test.py"""
+        with open(path) as f:
+            histogram = json.load(f)['service_time']
+
+        decoder = LatencyHistogram(histogram['sub_bucket_bits'])
+        values = np.array([decoder._value_at(int(i)) for i in histogram['buckets']], dtype=float)
+        counts = np.array(list(histogram['buckets'].values()), dtype=float)
+
+        values_ms = values / 1000.0
+        mean = np.average(values_ms, weights=counts)
+        variance = np.average((values_ms - mean) ** 2, weights=counts)
+        return cls(mean, histogram['p99_ms'], variance / mean ** 2)
+
+
+def synthetic_invocations(days=1, peak_per_minute=6000, trough_ratio=0.25, spikes=3,
+                          seed=42):
+    """
+    Diurnal invocation series (per minute) with noise and short search spikes
+
+    Returns:
+        float array of invocations per minute
+    """
+    rng = np.random.default_rng(seed)
+    minutes = np.arange(days * 1440)
+
+    # Trough around 04:00, peak around 16:00
+    phase = np.cos(2 * np.pi * (minutes % 1440 - 960) / 1440)
+    level = trough_ratio + (1 - trough_ratio) * (phase + 1) / 2
+    series = peak_per_minute * level * rng.normal(1.0, 0.05, len(minutes))
+
+    for start in rng.integers(0, len(minutes) - 30, spikes):
+        series[start:start + 20] *= rng.uniform(1.5, 2.5)
+
+    return np.maximum(series, 0)
+
+
+def load_invocations(path):
+    """Load recorded invocations per minute from a CSV with an `invocations` column"""
+    return pd.read_csv(path)['invocations'].to_numpy(dtype=float)
+
+
+def simulate_scaling(invocations, target_value, min_capacity, max_capacity,
+                     scale_out_cooldown=60, scale_in_cooldown=300, warmup_minutes=6):
+    """
+    Emulate target tracking minute by minute
+
+    Args:
+        invocations: Invocations per minute
+        target_value: Target invocations per instance per minute
+        min_capacity, max_capacity: Instance count bounds
+        scale_out_cooldown, scale_in_cooldown: Cooldowns in seconds
+        warmup_minutes: Minutes before a new instance serves traffic
+
+    Returns:
+        Tuple of (in-service instances, provisioned instances) per minute
+    """
+    num_minutes = len(invocations)
+    in_service = np.empty(num_minutes, dtype=np.int64)
+    provisioned = np.empty(num_minutes, dtype=np.int64)
+
+    desired = min_capacity
+    active = min_capacity
+    pending = []                 # (ready_minute, count)
+    above, below = 0, 0
+    last_scale_out = last_scale_in = -10 ** 9
+
+    for t in range(num_minutes):
+        ready = sum(count for ready_at, count in pending if ready_at <= t)
+        pending = [(ready_at, count) for ready_at, count in pending if ready_at > t]
+        active += ready
+
+        in_service[t] = active
+        provisioned[t] = desired
+
+        metric = invocations[t] / max(active, 1)
+        above = above + 1 if metric > target_value else 0
+        below = below + 1 if metric < SCALE_IN_THRESHOLD * target_value else 0
+
+        proposed = int(np.clip(np.ceil(desired * metric / target_value), min_capacity, max_capacity))
+
+        if (above >= SCALE_OUT_DATAPOINTS and proposed > desired
+                and (t - last_scale_out) * 60 >= scale_out_cooldown):
+            pending.append((t + warmup_minutes, proposed - desired))
+            desired = proposed
+            last_scale_out = t
+            above = 0
+        elif (below >= SCALE_IN_DATAPOINTS and proposed < desired and not pending
+              and (t - max(last_scale_in, last_scale_out)) * 60 >= scale_in_cooldown):
+            active -= desired - proposed
+            desired = proposed
+            last_scale_in = t
+            below = 0
+
+    return in_service, provisioned
+
+
+def erlang_c(servers, offered_load):
+    """
+    Probability that an arriving request waits (vectorized Erlang C)
+
+    Args:
+        servers: int array of server counts
+        offered_load: float array of offered load (arrival rate x mean service time)
+    """
+    blocking = np.ones_like(offered_load)
+    for k in range(1, int(servers.max()) + 1):
+        step = offered_load * blocking / (k + offered_load * blocking)
+        blocking = np.where(k <= servers, step, blocking)
+
+    utilization = offered_load / servers
+    with np.errstate(divide='ignore', invalid='ignore'):
+        wait_probability = blocking / (1 - utilization * (1 - blocking))
+    return np.where(utilization < 1, np.clip(wait_probability, 0, 1), 1.0)
+
+
+def estimate_latency(invocations, instances, service, workers_per_instance=2):
+    """
+    Approximate mean and p99 latency per minute
+
+    Returns:
+        Tuple of (mean_ms, p99_ms) arrays
+    """
+    servers = np.maximum(instances, 1) * workers_per_instance
+    arrival_rate = invocations / 60.0                       # per second
+    service_s = service.mean_ms / 1000.0
+    capacity = servers / service_s                          # requests per second
+    correction = (1 + service.cv2) / 2                      # Allen-Cunneen
+
+    # Fluid backlog carried between minutes when arrivals exceed capacity
+    backlog = np.zeros(len(invocations))
+    carried = 0.0
+    for t in range(len(invocations)):
+        carried = max(carried + (arrival_rate[t] - capacity[t]) * 60.0, 0.0)
+        backlog[t] = carried
+    backlog_delay = backlog / capacity
+
+    offered_load = np.minimum(arrival_rate * service_s, servers * 0.999)
+    wait_probability = erlang_c(servers, offered_load)
+    drain_rate = capacity - np.minimum(arrival_rate, capacity * 0.999)
+
+    mean_wait = wait_probability / drain_rate * correction
+    with np.errstate(divide='ignore'):
+        p99_wait = np.where(wait_probability > 0.01,
+                            np.log(wait_probability / 0.01) / drain_rate * correction, 0.0)
+
+    mean_ms = service.mean_ms + (mean_wait + backlog_delay) * 1000.0
+    p99_ms = service.p99_ms + (p99_wait + backlog_delay) * 1000.0
+    return mean_ms, p99_ms
+
+
+def evaluate_config(invocations, service, target_value, min_capacity, max_capacity,
+                    scale_out_cooldown, scale_in_cooldown, warmup_minutes=6,
+                    workers_per_instance=2, sla_ms=200.0):
+    """
+    Simulate one scaling configuration
+
+    Returns:
+        Dict with p99 latency, instance-hours and SLA violations
+    """
+    in_service, provisioned = simulate_scaling(
+        invocations, target_value, min_capacity, max_capacity,
+        scale_out_cooldown, scale_in_cooldown, warmup_minutes
+    )
+    mean_ms, p99_ms = estimate_latency(invocations, in_service, service, workers_per_instance)
+
+    # The CloudWatch alarm fires on Average ModelLatency > threshold for 2 periods
+    over = mean_ms > sla_ms
+    alarms = int(np.sum(over[1:] & over[:-1] & ~np.concatenate([[False], over[:-2]])))
+
+    weights = invocations / max(invocations.sum(), 1)
+    return {
+        'target_value': target_value,
+        'min_capacity': min_capacity,
+        'max_capacity': max_capacity,
+        'scale_out_cooldown': scale_out_cooldown,
+        'scale_in_cooldown': scale_in_cooldown,
+        'instance_hours': float(provisioned.sum() / 60.0),
+        'max_instances': int(provisioned.max()),
+        'p99_ms': float(np.max(p99_ms)),
+        'weighted_p99_ms': float(np.sum(p99_ms * weights)),
+        'sla_violation_minutes': int(np.sum(p99_ms > sla_ms)),
+        'latency_alarms': alarms
+    }
+
+
+def search_configs(invocations, service, targets, min_capacities, max_capacities,
+                   scale_out_cooldowns, scale_in_cooldowns, **kwargs):
+    """Evaluate every combination of candidate values; returns a DataFrame"""
+    results = [
+        evaluate_config(invocations, service, *combination, **kwargs)
+        for combination in itertools.product(targets, min_capacities, max_capacities,
+                                              scale_out_cooldowns, scale_in_cooldowns)
+        if combination[1] <= combination[2]
+    ]
+    return pd.DataFrame(results)
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Simulate endpoint autoscaling configurations')
+    parser.add_argument('--invocations', type=str, default=None,
+                        help='CSV with an `invocations` column (per minute); synthetic if omitted')
+    parser.add_argument('--days', type=int, default=1, help='Synthetic series length')
+    parser.add_argument('--peak-per-minute', type=float, default=6000)
+    parser.add_argument('--load-test-results', type=str, default=None,
+                        help='load_test.py results file providing measured service times')
+    parser.add_argument('--service-p50-ms', type=float, default=20.0)
+    parser.add_argument('--service-p99-ms', type=float, default=60.0)
+    parser.add_argument('--workers-per-instance', type=int, default=2)
+    parser.add_argument('--warmup-minutes', type=int, default=6)
+    parser.add_argument('--sla-ms', type=float, default=200.0)
+    parser.add_argument('--targets', type=float, nargs='+', default=[70, 300, 1200, 2400, 4800])
+    parser.add_argument('--min-capacity', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--max-capacity', type=int, nargs='+', default=[10, 20])
+    parser.add_argument('--scale-out-cooldown', type=int, nargs='+', default=[60, 180])
+    parser.add_argument('--scale-in-cooldown', type=int, nargs='+', default=[300, 900])
+    parser.add_argument('--output', type=str, default='autoscaling_simulation.csv')
+
+    args = parser.parse_args()
+
+    if args.invocations:
+        invocations = load_invocations(args.invocations)
+    else:
+        invocations = synthetic_invocations(args.days, args.peak_per_minute)
+
+    if args.load_test_results:
+        service = ServiceTimeModel.from_load_test(args.load_test_results)
+    else:
+        service = ServiceTimeModel.lognormal(args.service_p50_ms, args.service_p99_ms)
+
+    print(f"Replaying {len(invocations)} minutes ({invocations.sum():,.0f} invocations), "
+          f"service time mean {service.mean_ms:.1f} ms / p99 {service.p99_ms:.1f} ms")
+
+    results = search_configs(
+        invocations, service, args.targets, args.min_capacity, args.max_capacity,
+        args.scale_out_cooldown, args.scale_in_cooldown,
+        warmup_minutes=args.warmup_minutes,
+        workers_per_instance=args.workers_per_instance,
+        sla_ms=args.sla_ms
+    )
+    results = results.sort_values(['latency_alarms', 'sla_violation_minutes', 'instance_hours'])
+    results.to_csv(args.output, index=False)
+
+    print(results.head(10).to_string(index=False))
+    print(f"\nAll {len(results)} configurations written to {args.output}")
+
+    meeting_sla = results[(results['latency_alarms'] == 0) & (results['sla_violation_minutes'] == 0)]
+    if len(meeting_sla):
+        best = meeting_sla.sort_values('instance_hours').iloc[0]
+        print(f"\nCheapest configuration meeting the {args.sla_ms:.0f} ms SLA: "
+              f"target_value={best['target_value']}, min={best['min_capacity']}, "
+              f"max={best['max_capacity']}, scale_out_cooldown={best['scale_out_cooldown']}, "
+              f"scale_in_cooldown={best['scale_in_cooldown']} "
+              f"({best['instance_hours']:.1f} instance-hours)")
+    else:
+        print(f"\nNo candidate configuration meets the {args.sla_ms:.0f} ms SLA")
+
+
+if __name__ == '__main__':
+    main()
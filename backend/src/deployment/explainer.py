@@ -0,0 +1,305 @@
+"""
+Batched TreeSHAP Explanations for Price Decisions
+
+Answers "why this price" for analysts and the pricing UI without putting
+explanation cost on the scoring path. Contributions come from XGBoost's
+native TreeSHAP (pred_contribs) computed in bulk; route-level attributions
+are precomputed once after training, and per-request explanations are cached
+under the same keys as predictions.
+
+Features:
+- Exact TreeSHAP in batches via Booster.predict(pred_contribs=True)
+- One-hot columns folded back into their source column
+  (origin_airport_SFO, origin_airport_LAX, ... -> origin_airport)
+- Route-level mean attributions saved next to the model (route_attributions.json)
+- LRU cache of per-request explanations keyed by model version and the
+  float32 feature row, like PredictionCache
+
+Usage:
+    # After training: precompute route-level attributions
+    python explainer.py --model-dir model/ --data data/train --max-rows 100000
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from feature_store import route_key
+from prediction_cache import PredictionCache
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'training'))
+from train_xgboost import load_data, prepare_features
+
+
+ROUTE_ATTRIBUTIONS_FILE = 'route_attributions.json'
+
+# Name of the TreeSHAP bias term (expected model output)
+BASE_VALUE = 'base_value'
+
+# Raw columns train_xgboost.prepare_features one-hot encodes as `<column>_<value>`
+ONE_HOT_COLUMNS = ['origin_airport', 'destination_airport', 'airline', 'currency']
+
+
+def model_version(model_dir):
+    """Content hash of the saved booster; ties cache entries and aggregates to one model"""
+    with open(os.path.join(model_dir, 'xgboost-model'), 'rb') as f:
+        return hashlib.md5(f.read()).hexdigest()[:16]
+
+
+def feature_groups(feature_names):
+    """
+    Map model features onto the columns they were derived from
+
+    Args:
+        feature_names: Model feature names (feature_names.json)
+
+    Returns:
+        (group_names, group_matrix): contributions @ group_matrix sums the
+        contributions of every group; the base value is the last group
+    """
+    group_names = []
+    group_of_feature = []
+    for name in feature_names:
+        group = next((column for column in ONE_HOT_COLUMNS if name.startswith(column + '_')), name)
+        if group not in group_names:
+            group_names.append(group)
+        group_of_feature.append(group_names.index(group))
+
+    group_names.append(BASE_VALUE)
+    group_of_feature.append(len(group_names) - 1)
+
+    group_matrix = np.zeros((len(group_of_feature), len(group_names)), dtype=np.float32)
+    group_matrix[np.arange(len(group_of_feature)), group_of_feature] = 1.0
+    return group_names, group_matrix
+
+
+class _ContributionBackend:
+    """Gives PredictionCache the endpoint interface it caches: predict + model version"""
+
+    def __init__(self, explainer):
+        self.explainer = explainer
+
+    @property
+    def model_data_s3_uri(self):
+        return self.explainer.model_version
+
+    def predict(self, rows):
+        # Copies, so cache entries do not keep the whole batch array alive
+        return [values.copy() for values in self.explainer.contribution_matrix(rows)]
+
+
+class PriceExplainer:
+    """TreeSHAP explanations for the price model"""
+
+    def __init__(self, booster, feature_names, model_version=None, batch_size=8192,
+                 cache_entries=100000, cache_bytes=64 * 1024 * 1024, cache_ttl_seconds=None,
+                 route_attributions=None):
+        """
+        Initialize explainer
+
+        Args:
+            booster: Trained xgb.Booster
+            feature_names: Model feature names, in column order
+            model_version: Version string used in cache keys (see model_version)
+            batch_size: Rows per pred_contribs call (bounds temporary memory)
+            cache_entries: Maximum number of cached explanations
+            cache_bytes: Maximum estimated memory footprint of the cache
+            cache_ttl_seconds: Lifetime of a cached explanation (None: until
+                evicted; explanations of a model version never change)
+            route_attributions: Precomputed route-level attributions
+                (compute_route_attributions)
+        """
+        self.booster = booster
+        self.feature_names = list(feature_names)
+        self.model_version = model_version
+        self.batch_size = batch_size
+        self.group_names, self._group_matrix = feature_groups(self.feature_names)
+        self.route_attributions = route_attributions or {}
+
+        self.cache = PredictionCache(
+            _ContributionBackend(self),
+            max_entries=cache_entries,
+            max_bytes=cache_bytes,
+            ttl_seconds=cache_ttl_seconds
+        )
+
+    @classmethod
+    def from_model_dir(cls, model_dir, **kwargs):
+        """Load the model written by train_xgboost.save_model (and its route attributions)"""
+        booster = xgb.Booster()
+        booster.load_model(os.path.join(model_dir, 'xgboost-model'))
+        with open(os.path.join(model_dir, 'feature_names.json')) as f:
+            feature_names = json.load(f)
+
+        version = model_version(model_dir)
+        route_attributions = None
+        attributions_path = os.path.join(model_dir, ROUTE_ATTRIBUTIONS_FILE)
+        if os.path.exists(attributions_path):
+            with open(attributions_path) as f:
+                saved = json.load(f)
+            if saved['model_version'] == version:
+                route_attributions = saved['routes']
+            else:
+                print(f"Ignoring {ROUTE_ATTRIBUTIONS_FILE}: computed for model "
+                      f"{saved['model_version']}, loaded {version}")
+
+        return cls(booster, feature_names, model_version=version,
+                   route_attributions=route_attributions, **kwargs)
+
+    def contribution_matrix(self, X, grouped=True):
+        """
+        Batched TreeSHAP contributions
+
+        Contributions are in the model's output (margin) space; every row sums
+        to that row's prediction, base value included.
+
+        Args:
+            X: Feature rows, shape (n_rows, n_features), or a single row
+            grouped: Fold one-hot columns into their source column
+
+        Returns:
+            float32 array (n_rows, len(group_names)) if grouped, else
+            (n_rows, n_features + 1); the base value is the last column
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        width = len(self.group_names) if grouped else len(self.feature_names) + 1
+        values = np.empty((len(X), width), dtype=np.float32)
+        for start in range(0, len(X), self.batch_size):
+            batch = X[start:start + self.batch_size]
+            contributions = self.booster.predict(
+                xgb.DMatrix(batch, feature_names=self.feature_names), pred_contribs=True)
+            if grouped:
+                contributions = contributions @ self._group_matrix
+            values[start:start + len(batch)] = contributions
+        return values
+
+    def contributions(self, X, grouped=True):
+        """contribution_matrix as a DataFrame with feature (or group) columns"""
+        columns = self.group_names if grouped else self.feature_names + [BASE_VALUE]
+        return pd.DataFrame(self.contribution_matrix(X, grouped), columns=columns)
+
+    def explain(self, rows, top_k=5):
+        """
+        "Why this price" for feature rows, served from the explanation cache
+
+        Args:
+            rows: List or array of feature rows (the rows sent to the endpoint)
+            top_k: Number of contributions returned per row, largest first
+
+        Returns:
+            List of dicts with price (model output), base_value and the top_k
+            grouped contributions as [{'feature', 'value'}]
+        """
+        return [self._format(values, top_k) for values in self.cache.predict(rows)]
+
+    def _format(self, values, top_k):
+        contributions = values[:-1]
+        order = np.argsort(-np.abs(contributions))[:top_k]
+        return {
+            'price': float(values.sum()),
+            'base_value': float(values[-1]),
+            'contributions': [
+                {'feature': self.group_names[i], 'value': float(contributions[i])}
+                for i in order
+            ]
+        }
+
+    def route_explanation(self, origin, destination):
+        """Precomputed attribution of a route (None if unknown for this model)"""
+        return self.route_attributions.get(route_key(origin, destination))
+
+    def stats(self):
+        """Explanation cache metrics (see PredictionCache.stats)"""
+        return self.cache.stats()
+
+
+def compute_route_attributions(explainer, X, origins, destinations):
+    """
+    Mean grouped contributions per route
+
+    Args:
+        explainer: PriceExplainer
+        X: Feature rows in the model's column order
+        origins, destinations: Route of every row
+
+    Returns:
+        Dict route key -> {'rows', 'mean_price', 'base_value', 'contributions'},
+        contributions ordered by magnitude
+    """
+    frame = pd.DataFrame(explainer.contribution_matrix(X), columns=explainer.group_names)
+    frame['route'] = [route_key(o, d) for o, d in zip(origins, destinations)]
+
+    grouped = frame.groupby('route')
+    means = grouped.mean()
+    counts = grouped.size()
+
+    routes = {}
+    for route, row in means.iterrows():
+        contributions = row.drop(BASE_VALUE)
+        contributions = contributions.reindex(contributions.abs().sort_values(ascending=False).index)
+        routes[route] = {
+            'rows': int(counts[route]),
+            'mean_price': float(row.sum()),
+            'base_value': float(row[BASE_VALUE]),
+            'contributions': {name: float(value) for name, value in contributions.items()}
+        }
+    return routes
+
+
+def write_route_attributions(model_dir, explainer, routes):
+    """Save route attributions next to the model they were computed for"""
+    path = os.path.join(model_dir, ROUTE_ATTRIBUTIONS_FILE)
+    with open(path, 'w') as f:
+        json.dump({
+            'model_version': explainer.model_version,
+            'features': [name for name in explainer.group_names if name != BASE_VALUE],
+            'routes': routes
+        }, f)
+    return path
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Precompute route-level price attributions')
+    parser.add_argument('--model-dir', type=str, required=True,
+                        help='Directory written by train_xgboost.py')
+    parser.add_argument('--data', type=str, required=True,
+                        help='CSV directory in the training layout (with origin/destination)')
+    parser.add_argument('--max-rows', type=int, default=100000,
+                        help='Rows sampled for the aggregates (TreeSHAP cost is per row)')
+    parser.add_argument('--batch-size', type=int, default=8192)
+    parser.add_argument('--seed', type=int, default=42)
+
+    args = parser.parse_args()
+
+    explainer = PriceExplainer.from_model_dir(args.model_dir, batch_size=args.batch_size)
+
+    df = load_data(args.data)
+    if len(df) > args.max_rows:
+        df = df.sample(n=args.max_rows, random_state=args.seed)
+    origins = df['origin_airport'].to_numpy()
+    destinations = df['destination_airport'].to_numpy()
+
+    X, _ = prepare_features(df.reset_index(drop=True))
+    X = X.reindex(columns=explainer.feature_names, fill_value=0)
+
+    routes = compute_route_attributions(explainer, X.to_numpy(dtype=np.float32),
+                                        origins, destinations)
+    path = write_route_attributions(args.model_dir, explainer, routes)
+    print(f"Route attributions for {len(routes)} routes ({len(X)} rows) written to {path}")
+
+
+if __name__ == '__main__':
+    main()
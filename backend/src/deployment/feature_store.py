@@ -0,0 +1,326 @@
+"""
+Online Feature Store for Route Statistics at Inference Time
+
+The price model is trained on route features (route_avg_price,
+route_popularity, route_price_volatility, price_diff_from_avg) that only
+exist in the Glue output. This store makes them available to the serving
+path: it builds route-indexed snapshots from the curated Parquet data,
+keeps them as a compact float32 array (memory-mapped from disk), and swaps
+in new snapshots atomically when fresh ETL output lands.
+
+Features:
+- Snapshot build from curated Parquet (or a precomputed route-stats table)
+- Versioned snapshot directories with an atomically replaced CURRENT pointer
+- Lock-free reads: readers hold an immutable snapshot reference
+- Batch get_features(route_keys) with microsecond latency
+- Optional background thread that picks up new snapshots
+
+Usage:
+    python feature_store.py --curated s3://airline-data-lake/curated/flight_searches/ \\
+        --store-dir feature_store/
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import argparse
+import json
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+
+
+ROUTE_FEATURES = ['route_avg_price', 'route_popularity', 'route_price_volatility']
+
+CURRENT_FILE = 'CURRENT'
+VALUES_FILE = 'features.npy'
+INDEX_FILE = 'index.json'
+
+# Snapshots are assembled under this prefix and renamed into place complete
+TMP_PREFIX = 'tmp-'
+
+
+def route_key(origin, destination):
+    """Route key used across the serving path, e.g. 'SFO-JFK'"""
+    return f'{origin}-{destination}'
+
+
+def compute_route_stats(curated_df):
+    """
+    Aggregate route statistics the same way the Glue job's window functions do
+
+    Args:
+        curated_df: Curated rows with origin_airport, destination_airport,
+            search_id and price
+
+    Returns:
+        DataFrame indexed by route key with ROUTE_FEATURES columns
+    """
+    grouped = curated_df.groupby(['origin_airport', 'destination_airport'])
+    stats = pd.DataFrame({
+        'route_avg_price': grouped['price'].mean(),
+        'route_popularity': grouped['search_id'].count(),
+        'route_price_volatility': grouped['price'].std()
+    })
+    stats.index = [route_key(o, d) for o, d in stats.index]
+    return stats
+
+
+def write_snapshot(route_stats, store_dir, version=None, features=None):
+    """
+    Write a new snapshot and atomically make it current
+
+    Snapshots are immutable: files of a published snapshot may be memory-mapped
+    by live readers, so an existing version is never rewritten.
+
+    Args:
+        route_stats: DataFrame indexed by route key with the feature columns
+        store_dir: Feature store root directory
+        version: Snapshot version name (defaults to a UTC timestamp)
+        features: Feature columns to store (default: the batch ROUTE_FEATURES)
+
+    Returns:
+        Snapshot version
+
+    Raises:
+        FileExistsError: If the version already exists in the store
+    """
+    created_at = datetime.now(timezone.utc)
+    version = version or created_at.strftime('%Y%m%dT%H%M%S%fZ')
+    features = features or ROUTE_FEATURES
+    snapshot_dir = os.path.join(store_dir, version)
+    if os.path.exists(snapshot_dir):
+        raise FileExistsError(f"Feature snapshot {version} already exists in {store_dir}")
+
+    tmp_dir = os.path.join(store_dir, f'{TMP_PREFIX}{version}.{os.getpid()}')
+    os.makedirs(tmp_dir)
+
+    values = route_stats[features].to_numpy(dtype=np.float32)
+
+    # The last row holds the averages served for unknown routes
+    if len(values):
+        defaults = np.nanmean(values, axis=0, keepdims=True)
+    else:
+        defaults = np.full((1, len(features)), np.nan, dtype=np.float32)
+    np.save(os.path.join(tmp_dir, VALUES_FILE), np.vstack([values, defaults]))
+
+    index = {
+        'version': version,
+        'created_at': created_at.isoformat(),
+        'features': features,
+        'routes': [str(route) for route in route_stats.index]
+    }
+    with open(os.path.join(tmp_dir, INDEX_FILE), 'w') as f:
+        json.dump(index, f)
+
+    # Publish the complete directory; fails if a concurrent writer won the name
+    try:
+        os.rename(tmp_dir, snapshot_dir)
+    except OSError:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise FileExistsError(f"Feature snapshot {version} already exists in {store_dir}")
+
+    # Point CURRENT at the complete snapshot in a single rename
+    tmp_current = os.path.join(store_dir, CURRENT_FILE + '.tmp')
+    with open(tmp_current, 'w') as f:
+        f.write(version)
+    os.replace(tmp_current, os.path.join(store_dir, CURRENT_FILE))
+
+    print(f"Feature snapshot {version}: {len(values)} routes x {len(features)} features")
+    return version
+
+
+def _snapshot_created_at(snapshot_dir):
+    """
+    Creation time recorded in a snapshot's index (directory mtime for
+    snapshots written before it was recorded); None while the snapshot is
+    still being written
+    """
+    index_path = os.path.join(snapshot_dir, INDEX_FILE)
+    if not os.path.exists(index_path):
+        return None
+    with open(index_path) as f:
+        created_at = json.load(f).get('created_at')
+    if created_at is None:
+        return os.path.getmtime(snapshot_dir)
+    return datetime.fromisoformat(created_at).timestamp()
+
+
+def prune_snapshots(store_dir, keep=3):
+    """
+    Delete all but the `keep` newest snapshots, by recorded creation time
+
+    The snapshot CURRENT points at is never deleted, even when it is not
+    among the newest (e.g. after a rollback to an older version). Readers
+    that still map an older snapshot keep their open files.
+    """
+    with open(os.path.join(store_dir, CURRENT_FILE)) as f:
+        current = f.read().strip()
+
+    snapshots = []
+    for name in os.listdir(store_dir):
+        snapshot_dir = os.path.join(store_dir, name)
+        if name.startswith(TMP_PREFIX) or not os.path.isdir(snapshot_dir):
+            continue
+        created_at = _snapshot_created_at(snapshot_dir)
+        if created_at is not None:
+            snapshots.append((created_at, name))
+
+    snapshots.sort(reverse=True)
+    for _, version in snapshots[keep:]:
+        if version != current:
+            shutil.rmtree(os.path.join(store_dir, version), ignore_errors=True)
+
+
+class FeatureSnapshot:
+    """Immutable route-indexed feature table"""
+
+    def __init__(self, snapshot_dir):
+        with open(os.path.join(snapshot_dir, INDEX_FILE)) as f:
+            index = json.load(f)
+
+        self.version = index['version']
+        # Directory identity: a version name deleted and re-created is a new snapshot
+        self.inode = os.stat(snapshot_dir).st_ino
+        self.features = index['features']
+        self.positions = {route: i for i, route in enumerate(index['routes'])}
+
+        # Row len(routes) holds the defaults for unknown routes
+        self.values = np.load(os.path.join(snapshot_dir, VALUES_FILE), mmap_mode='r')
+        self.missing_position = len(index['routes'])
+
+
+class OnlineFeatureStore:
+    """Serve route features from the current snapshot"""
+
+    def __init__(self, store_dir):
+        """
+        Open the feature store
+
+        Args:
+            store_dir: Directory written by write_snapshot
+        """
+        self.store_dir = store_dir
+        self.snapshot = None
+        self._watcher = None
+        self._stop = threading.Event()
+        self.refresh()
+
+    def _current_version(self):
+        with open(os.path.join(self.store_dir, CURRENT_FILE)) as f:
+            return f.read().strip()
+
+    def refresh(self):
+        """
+        Load the current snapshot if it changed
+
+        Returns:
+            True if a new snapshot was swapped in
+        """
+        version = self._current_version()
+        snapshot_dir = os.path.join(self.store_dir, version)
+        if (self.snapshot is not None and self.snapshot.version == version
+                and self.snapshot.inode == os.stat(snapshot_dir).st_ino):
+            return False
+
+        snapshot = FeatureSnapshot(snapshot_dir)
+        # Single reference assignment: readers see the old or the new snapshot
+        self.snapshot = snapshot
+        print(f"Feature store serving snapshot {version}")
+        return True
+
+    def watch(self, interval_seconds=30.0):
+        """Poll for new snapshots in a background thread"""
+        def poll():
+            while not self._stop.wait(interval_seconds):
+                try:
+                    self.refresh()
+                except (OSError, ValueError) as e:
+                    print(f"Feature store refresh failed: {e}")
+
+        self._watcher = threading.Thread(target=poll, name='feature-store-watcher', daemon=True)
+        self._watcher.start()
+
+    def stop(self):
+        """Stop the background watcher"""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+
+    def get_features(self, route_keys):
+        """
+        Look up route features for a batch of routes
+
+        Args:
+            route_keys: Iterable of route keys ('SFO-JFK'); unknown routes
+                get the snapshot's default (average) values
+
+        Returns:
+            float32 array of shape (len(route_keys), number of snapshot features)
+        """
+        snapshot = self.snapshot
+        positions = snapshot.positions
+        missing = snapshot.missing_position
+        index = np.fromiter((positions.get(key, missing) for key in route_keys), dtype=np.intp)
+        return snapshot.values[index]
+
+    def price_diff_from_avg(self, route_keys, prices):
+        """price - route_avg_price for each offer, as engineered by the Glue job"""
+        route_avg = self.get_features(route_keys)[:, ROUTE_FEATURES.index('route_avg_price')]
+        return np.asarray(prices, dtype=np.float32) - route_avg
+
+    def add_route_features(self, requests_df):
+        """
+        Fill the route feature columns of a request DataFrame
+
+        Args:
+            requests_df: Rows with origin_airport, destination_airport and price
+
+        Returns:
+            Copy of requests_df with ROUTE_FEATURES and price_diff_from_avg,
+            ready for PricePredictionEndpoint.predict
+        """
+        keys = [route_key(o, d) for o, d in
+                zip(requests_df['origin_airport'], requests_df['destination_airport'])]
+        values = self.get_features(keys)
+
+        enriched = requests_df.copy()
+        for i, name in enumerate(ROUTE_FEATURES):
+            enriched[name] = values[:, i]
+        enriched['price_diff_from_avg'] = (
+            enriched['price'].to_numpy(dtype=np.float32) - enriched['route_avg_price'].to_numpy()
+        )
+        return enriched
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Build an online feature store snapshot')
+    parser.add_argument('--curated', type=str, default=None,
+                        help='Curated flight_searches Parquet path (local or s3://)')
+    parser.add_argument('--route-stats', type=str, default=None,
+                        help='Precomputed route-stats Parquet indexed by origin/destination')
+    parser.add_argument('--store-dir', type=str, default='feature_store')
+    parser.add_argument('--version', type=str, default=None)
+
+    args = parser.parse_args()
+
+    if args.route_stats:
+        stats = pd.read_parquet(args.route_stats)
+        stats.index = [route_key(o, d) for o, d in
+                       zip(stats['origin_airport'], stats['destination_airport'])]
+    elif args.curated:
+        columns = ['origin_airport', 'destination_airport', 'search_id', 'price']
+        stats = compute_route_stats(pd.read_parquet(args.curated, columns=columns))
+    else:
+        parser.error('one of --curated or --route-stats is required')
+
+    write_snapshot(stats, args.store_dir, args.version)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,297 @@
+"""
+Endpoint Load Testing and Latency Benchmark Harness
+
+Drives PricePredictionEndpoint.predict (SageMaker or the local stand-in from
+local_server.py) with feature rows built from FlightDataGenerator traffic:
+one request per search, one row per price offer, like the search fan-out.
+
+Features:
+- Open-loop mode: requests start on a fixed or Poisson arrival schedule and
+  latency is measured from the intended start time (no coordinated omission)
+- Closed-loop mode: N concurrent clients sending back-to-back requests
+- HDR-style log-linear latency histograms, throughput and error rate
+- Machine-readable JSON results and comparison against a baseline run
+
+Usage:
+    python load_test.py --model-dir model/ --local-url http://127.0.0.1:8080 \\
+        --rate 200 --duration 60 --output results.json --baseline previous.json
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timezone
+
+import numpy as np
+
+from payloads import CONTENT_TYPES, CSV, JSON
+from price_grid import build_feature_matrix
+from sagemaker_endpoint import PricePredictionEndpoint
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ingestion'))
+from kinesis_producer import FlightDataGenerator
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from instrumentation import LatencyHistogram
+
+
+def search_feature_rows(event, feature_names, today=None):
+    """
+    Convert one search event into model feature rows (one per price offer)
+
+    Args:
+        event: Event from FlightDataGenerator.generate_search_event
+        feature_names: Model feature names (feature_names.json)
+        today: Reference date for days_until_departure
+
+    Returns:
+        float32 array of shape (n_offers, n_features)
+    """
+    today = today or date.today()
+    departure = datetime.strptime(event['departure_date'], '%Y-%m-%d').date()
+    offers = event['price_offers']
+    n = len(offers)
+
+    cells = {
+        'origin_airport': np.full(n, event['origin_airport']),
+        'destination_airport': np.full(n, event['destination_airport']),
+        'airline': np.array([offer['airline'] for offer in offers]),
+        'stops': np.array([offer['stops'] for offer in offers]),
+        'days_until_departure': np.full(n, (departure - today).days),
+        # Spark dayofweek convention used by the ETL job: 1 = Sunday
+        'day_of_week': np.full(n, departure.isoweekday() % 7 + 1)
+    }
+    return build_feature_matrix(feature_names, cells)
+
+
+def generate_requests(feature_names, num_requests, seed=42):
+    """Pre-generate request payloads so generation cost stays out of the timings"""
+    random.seed(seed)
+    generator = FlightDataGenerator()
+    return [
+        search_feature_rows(generator.generate_search_event(), feature_names).tolist()
+        for _ in range(num_requests)
+    ]
+
+
+class LoadTest:
+    """Open- or closed-loop load generator around a predict function"""
+
+    def __init__(self, predict_fn, requests, concurrency=16):
+        """
+        Args:
+            predict_fn: Callable taking a list of feature rows
+            requests: Pre-generated request payloads (cycled if exhausted)
+            concurrency: Maximum number of requests in flight
+        """
+        self.predict_fn = predict_fn
+        self.requests = requests
+        self.concurrency = concurrency
+
+        self.response_time = LatencyHistogram()   # from intended start (open loop)
+        self.service_time = LatencyHistogram()    # from actual send
+        self.errors = 0
+        self.completed = 0
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def _call(self, payload, intended_start):
+        sent = time.perf_counter()
+        try:
+            self.predict_fn(payload)
+            ok = True
+        except Exception:
+            ok = False
+        finished = time.perf_counter()
+
+        self.service_time.record(finished - sent)
+        self.response_time.record(finished - intended_start)
+        with self._lock:
+            if ok:
+                self.completed += 1
+                self.rows += len(payload)
+            else:
+                self.errors += 1
+
+    def run_open_loop(self, rate, duration, poisson=True, seed=42):
+        """
+        Issue requests at `rate` per second for `duration` seconds
+
+        Requests start on schedule regardless of how slow earlier responses
+        are; when all workers are busy, queueing delay shows up in the
+        response-time histogram as it would for real users.
+        """
+        rng = np.random.default_rng(seed)
+        num_requests = int(rate * duration)
+        if poisson:
+            offsets = np.cumsum(rng.exponential(1.0 / rate, num_requests))
+        else:
+            offsets = np.arange(num_requests) / rate
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+            for i, offset in enumerate(offsets):
+                intended = start + offset
+                delay = intended - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self._call, self.requests[i % len(self.requests)], intended)
+        return time.perf_counter() - start
+
+    def run_closed_loop(self, duration):
+        """Run `concurrency` clients sending back-to-back requests"""
+        start = time.perf_counter()
+        deadline = start + duration
+        counter = iter(range(sys.maxsize))
+        counter_lock = threading.Lock()
+
+        def client():
+            while time.perf_counter() < deadline:
+                with counter_lock:
+                    i = next(counter)
+                self._call(self.requests[i % len(self.requests)], time.perf_counter())
+
+        threads = [threading.Thread(target=client) for _ in range(self.concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - start
+
+    def results(self, elapsed, config):
+        """Summarize the run as a JSON-serializable dict"""
+        total = self.completed + self.errors
+        return {
+            'config': config,
+            'timestamp': datetime.now(timezone.utc).isoformat().replace('+00:00', 'Z'),
+            'elapsed_seconds': elapsed,
+            'requests': total,
+            'errors': self.errors,
+            'error_rate': self.errors / total if total else 0.0,
+            'throughput_rps': self.completed / elapsed if elapsed else 0.0,
+            'rows_per_second': self.rows / elapsed if elapsed else 0.0,
+            'response_time': self.response_time.to_dict(),
+            'service_time': self.service_time.to_dict()
+        }
+
+
+def compare_results(current, baseline, tolerance=0.10):
+    """
+    Compare a run with a baseline run
+
+    Args:
+        current: Results dict of this run
+        baseline: Results dict of an earlier run
+        tolerance: Allowed relative regression (0.10 = 10%)
+
+    Returns:
+        List of regression messages (empty if none)
+    """
+    regressions = []
+    for metric in ['p50_ms', 'p99_ms', 'p999_ms']:
+        before = baseline['response_time'][metric]
+        after = current['response_time'][metric]
+        if before > 0 and after > before * (1 + tolerance):
+            regressions.append(f"response_time.{metric}: {before:.2f} -> {after:.2f} ms")
+
+    before, after = baseline['throughput_rps'], current['throughput_rps']
+    if before > 0 and after < before * (1 - tolerance):
+        regressions.append(f"throughput_rps: {before:.1f} -> {after:.1f}")
+
+    if current['error_rate'] > baseline['error_rate'] + 0.001:
+        regressions.append(f"error_rate: {baseline['error_rate']:.4f} -> {current['error_rate']:.4f}")
+
+    return regressions
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Load test the price prediction endpoint')
+    parser.add_argument('--model-dir', type=str, required=True,
+                        help='Directory with feature_names.json (defines the row layout)')
+    parser.add_argument('--endpoint-name', type=str, default='price-prediction-endpoint')
+    parser.add_argument('--local-url', type=str, default=None,
+                        help='Target a local inference server instead of SageMaker')
+    parser.add_argument('--embedded', action='store_true',
+                        help='Score in-process with the model in --model-dir (no HTTP)')
+    parser.add_argument('--mode', choices=['open', 'closed'], default='open')
+    parser.add_argument('--rate', type=float, default=100.0,
+                        help='Open loop: requests (searches) per second')
+    parser.add_argument('--arrivals', choices=['poisson', 'constant'], default='poisson')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=30.0, help='Seconds')
+    parser.add_argument('--micro-batching', action='store_true')
+    parser.add_argument('--content-type', choices=CONTENT_TYPES, default=CSV,
+                        help='Request payload format')
+    parser.add_argument('--accept', choices=CONTENT_TYPES, default=JSON,
+                        help='Response payload format')
+    parser.add_argument('--output', type=str, default='load_test_results.json')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='Results of an earlier run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.10)
+
+    args = parser.parse_args()
+
+    with open(os.path.join(args.model_dir, 'feature_names.json')) as f:
+        feature_names = json.load(f)
+
+    endpoint = PricePredictionEndpoint(
+        model_data_s3_uri=None,
+        role_arn=None,
+        endpoint_name=args.endpoint_name,
+        micro_batching=args.micro_batching,
+        local_endpoint_url=args.local_url,
+        local_model_dir=args.model_dir if args.embedded else None,
+        content_type=args.content_type,
+        accept=args.accept,
+        feature_names=feature_names
+    )
+
+    requests = generate_requests(feature_names, num_requests=10000)
+    load_test = LoadTest(endpoint.predict, requests, concurrency=args.concurrency)
+
+    print(f"Running {args.mode}-loop load test for {args.duration}s "
+          f"against {'in-process model' if args.embedded else args.local_url or args.endpoint_name}")
+
+    if args.mode == 'open':
+        elapsed = load_test.run_open_loop(args.rate, args.duration,
+                                          poisson=args.arrivals == 'poisson')
+    else:
+        elapsed = load_test.run_closed_loop(args.duration)
+
+    endpoint.close()
+
+    results = load_test.results(elapsed, config=vars(args))
+    with open(args.output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    latency = results['response_time']
+    print(f"\nRequests: {results['requests']} (errors: {results['errors']}, "
+          f"error rate: {results['error_rate']:.2%})")
+    print(f"Throughput: {results['throughput_rps']:.1f} req/s, {results['rows_per_second']:.1f} rows/s")
+    print(f"Latency p50 {latency['p50_ms']:.2f} ms, p99 {latency['p99_ms']:.2f} ms, "
+          f"p99.9 {latency['p999_ms']:.2f} ms, max {latency['max_ms']:.2f} ms")
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance)
+        if regressions:
+            print("\nRegressions against baseline:")
+            for regression in regressions:
+                print(f"  {regression}")
+            sys.exit(1)
+        print("\nNo regressions against baseline")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,332 @@
+"""
+Local In-Process Inference Server (SageMaker Endpoint Stand-In)
+
+Serves the artifacts written by train_xgboost.save_model (`xgboost-model`
+and `feature_names.json`) with the same invocation contract as the SageMaker
+XGBoost container, so latency work can be done locally and the pricing
+service can embed the model without a network hop.
+
+Features:
+- GET /ping and POST /invocations (also /endpoints/<name>/invocations)
+- text/csv, application/json, application/x-npy and
+  application/x-recordio-protobuf requests and responses (see payloads.py)
+- Rejects requests whose announced feature order differs from feature_names.json
+- Micro-batching of concurrent requests inside each worker
+- Multiple pre-forked worker processes sharing one listening socket
+- LocalRuntimeClient / EmbeddedRuntimeClient drop-ins for the
+  sagemaker-runtime client used by PricePredictionEndpoint
+
+Usage:
+    python local_server.py --model-dir model/ --port 8080 --workers 4
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import argparse
+import http.client
+import io
+import json
+import multiprocessing
+import os
+import select
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse
+
+import numpy as np
+import xgboost as xgb
+
+from micro_batcher import MicroBatcher
+from payloads import check_feature_attribute, deserialize_rows, serialize_predictions
+
+
+class LocalModel:
+    """XGBoost price model loaded from a local model directory"""
+
+    def __init__(self, model_dir, nthread=None):
+        """
+        Load model artifacts
+
+        Args:
+            model_dir: Directory containing `xgboost-model` and `feature_names.json`
+            nthread: Threads used per prediction (None lets XGBoost decide)
+        """
+        self.model_dir = model_dir
+
+        self.booster = xgb.Booster()
+        self.booster.load_model(os.path.join(model_dir, 'xgboost-model'))
+        if nthread is not None:
+            self.booster.set_param({'nthread': nthread})
+
+        with open(os.path.join(model_dir, 'feature_names.json')) as f:
+            self.feature_names = json.load(f)
+
+    def predict(self, rows):
+        """
+        Score a 2-D array of feature rows
+
+        Args:
+            rows: Array of shape (n_rows, n_features) in `feature_names` order
+
+        Returns:
+            NumPy array of predicted prices
+        """
+        rows = np.asarray(rows, dtype=np.float32)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        if rows.shape[1] != len(self.feature_names):
+            raise ValueError(
+                f"Expected {len(self.feature_names)} features, got {rows.shape[1]}"
+            )
+
+        dmatrix = xgb.DMatrix(rows, feature_names=self.feature_names)
+        return self.booster.predict(dmatrix)
+
+
+class BatchingScorer:
+    """Wrap a LocalModel with a micro-batching queue for concurrent requests"""
+
+    def __init__(self, model, max_batch_size=64, max_wait_ms=2.0):
+        self.model = model
+        self.max_batch_size = max_batch_size
+        self.batcher = MicroBatcher(self._score_rows, max_batch_size=max_batch_size,
+                                    max_wait_ms=max_wait_ms)
+
+    def _score_rows(self, rows):
+        return self.model.predict(np.vstack(rows)).tolist()
+
+    def predict(self, rows):
+        """Score rows, coalescing small requests with concurrent ones"""
+        rows = np.asarray(rows, dtype=np.float32)
+        if rows.ndim == 1:
+            rows = rows.reshape(1, -1)
+        if rows.shape[1] != len(self.model.feature_names):
+            raise ValueError(
+                f"Expected {len(self.model.feature_names)} features, got {rows.shape[1]}"
+            )
+
+        # Large requests are already a batch; score them directly
+        if len(rows) >= self.max_batch_size:
+            return self.model.predict(rows).tolist()
+
+        futures = self.batcher.submit_many(rows)
+        return [future.result() for future in futures]
+
+
+class InvocationHandler(BaseHTTPRequestHandler):
+    """HTTP handler implementing the SageMaker /ping and /invocations contract"""
+
+    # Keep-alive so clients can reuse pooled connections; headers and body are
+    # written separately, so disable Nagle to avoid delayed-ACK stalls
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        if self.path == '/ping':
+            self._send(200, b'OK', 'text/plain')
+        else:
+            self._send(404, b'Not Found', 'text/plain')
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        body = self.rfile.read(length)
+
+        path = self.path.split('?')[0]
+        if not (path == '/invocations' or
+                (path.startswith('/endpoints/') and path.endswith('/invocations'))):
+            self._send(404, b'Not Found', 'text/plain')
+            return
+
+        try:
+            check_feature_attribute(self.headers.get('X-Amzn-SageMaker-Custom-Attributes'),
+                                    self.server.scorer.model.feature_names)
+            rows = deserialize_rows(body, self.headers.get('Content-Type'))
+            predictions = self.server.scorer.predict(rows)
+            response, content_type = serialize_predictions(predictions, self.headers.get('Accept'))
+        except (ValueError, KeyError) as e:
+            self._send(400, str(e).encode('utf-8'), 'text/plain')
+            return
+        except Exception as e:
+            self._send(500, str(e).encode('utf-8'), 'text/plain')
+            return
+
+        self._send(200, response, content_type)
+
+    def _send(self, status, body, content_type):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Per-request logging would dominate latency at this scale
+        pass
+
+
+def _serve_worker(server, model_dir, nthread, max_batch_size, max_wait_ms):
+    """Load the model inside the worker process and serve requests"""
+    model = LocalModel(model_dir, nthread=nthread)
+    server.scorer = BatchingScorer(model, max_batch_size=max_batch_size,
+                                   max_wait_ms=max_wait_ms)
+    print(f"Worker {os.getpid()} serving {len(model.feature_names)}-feature model")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+def serve(model_dir, host='127.0.0.1', port=8080, workers=1, max_batch_size=64,
+          max_wait_ms=2.0):
+    """
+    Run the local inference server
+
+    Args:
+        model_dir: Directory containing the trained model artifacts
+        host: Interface to bind
+        port: Port to listen on
+        workers: Number of worker processes sharing the listening socket
+        max_batch_size: Maximum rows per micro-batch
+        max_wait_ms: Maximum micro-batch wait time in milliseconds
+    """
+    # Bind once in the parent; forked workers accept on the shared socket
+    server = ThreadingHTTPServer((host, port), InvocationHandler)
+    server.daemon_threads = True
+    print(f"Local inference server listening on http://{host}:{port} ({workers} workers)")
+
+    # With several processes, one XGBoost thread each avoids oversubscription
+    nthread = 1 if workers > 1 else None
+
+    if workers == 1:
+        _serve_worker(server, model_dir, nthread, max_batch_size, max_wait_ms)
+        return
+
+    context = multiprocessing.get_context('fork')
+    processes = [
+        context.Process(target=_serve_worker,
+                        args=(server, model_dir, nthread, max_batch_size, max_wait_ms))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        for process in processes:
+            process.terminate()
+    finally:
+        server.server_close()
+
+
+class LocalRuntimeClient:
+    """
+    Minimal stand-in for the boto3 sagemaker-runtime client that targets the
+    local inference server over keep-alive HTTP connections (one per thread)
+    """
+
+    def __init__(self, endpoint_url, timeout=5.0):
+        parsed = urlparse(endpoint_url)
+        self.host = parsed.hostname
+        self.port = parsed.port or 80
+        self.timeout = timeout
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None and connection.sock is not None:
+            # An idle keep-alive socket that is readable was closed by the server
+            # (EOF); drop it now so the request goes out on a fresh connection
+            readable, _, _ = select.select([connection.sock], [], [], 0)
+            if readable:
+                connection.close()
+        if connection is None:
+            connection = http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+            self._local.connection = connection
+        return connection
+
+    def invoke_endpoint(self, EndpointName, Body, ContentType='text/csv',
+                        Accept='application/json', CustomAttributes=None):
+        """Invoke the local server with the sagemaker-runtime call signature"""
+        headers = {'Content-Type': ContentType, 'Accept': Accept}
+        if CustomAttributes:
+            headers['X-Amzn-SageMaker-Custom-Attributes'] = CustomAttributes
+        connection = self._connection()
+
+        # http.client only sends bytes bodies in the same packet as the headers
+        if isinstance(Body, str):
+            Body = Body.encode('utf-8')
+
+        url = f'/endpoints/{EndpointName}/invocations'
+        try:
+            connection.request('POST', url, body=Body, headers=headers)
+        except (http.client.HTTPException, ConnectionError):
+            # Sending failed, so the server never received a complete request:
+            # safe to reconnect and send once more
+            connection.close()
+            connection.request('POST', url, body=Body, headers=headers)
+
+        # No retry once the request is out: invocations are not idempotent
+        try:
+            response = connection.getresponse()
+            data = response.read()
+        except (http.client.HTTPException, ConnectionError):
+            connection.close()
+            raise
+
+        if response.status != 200:
+            raise RuntimeError(f"Local endpoint returned {response.status}: {data.decode('utf-8')}")
+
+        return {
+            'Body': io.BytesIO(data),
+            'ContentType': response.getheader('Content-Type')
+        }
+
+
+class EmbeddedRuntimeClient:
+    """
+    In-process stand-in for the sagemaker-runtime client: the same contract
+    as the local server, without HTTP, for embedding in the pricing service
+    """
+
+    def __init__(self, model_dir, max_batch_size=64, max_wait_ms=2.0):
+        self.scorer = BatchingScorer(LocalModel(model_dir), max_batch_size=max_batch_size,
+                                     max_wait_ms=max_wait_ms)
+
+    def invoke_endpoint(self, EndpointName, Body, ContentType='text/csv',
+                        Accept='application/json', CustomAttributes=None):
+        """Score the payload in-process with the sagemaker-runtime call signature"""
+        check_feature_attribute(CustomAttributes, self.scorer.model.feature_names)
+        rows = deserialize_rows(Body, ContentType)
+        response, content_type = serialize_predictions(self.scorer.predict(rows), Accept)
+        return {'Body': io.BytesIO(response), 'ContentType': content_type}
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Serve the price model locally')
+    parser.add_argument('--model-dir', type=str, required=True,
+                        help='Directory with xgboost-model and feature_names.json')
+    parser.add_argument('--host', type=str, default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Number of worker processes')
+    parser.add_argument('--max-batch-size', type=int, default=64)
+    parser.add_argument('--max-wait-ms', type=float, default=2.0)
+
+    args = parser.parse_args()
+
+    serve(
+        model_dir=args.model_dir,
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        max_batch_size=args.max_batch_size,
+        max_wait_ms=args.max_wait_ms
+    )
+
+
+if __name__ == '__main__':
+    main()
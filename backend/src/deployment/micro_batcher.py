@@ -0,0 +1,127 @@
+"""
+Micro-Batching Queue for Real-Time Inference
+
+Coalesces concurrent single-row prediction requests into multi-row
+invocations. A request waits at most `max_wait_ms` for other requests to
+join its batch, so per-call overhead (HTTP round trip, request signing,
+serialization) is paid once per batch instead of once per row.
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+
+class MicroBatcher:
+    """Collect rows from many threads and score them in small batches"""
+
+    _STOP = object()
+
+    def __init__(self, batch_fn, max_batch_size=64, max_wait_ms=2.0, max_concurrent_batches=4):
+        """
+        Initialize micro-batcher
+
+        Args:
+            batch_fn: Callable taking a list of feature rows and returning a
+                list of predictions in the same order
+            max_batch_size: Maximum number of rows per invocation
+            max_wait_ms: Maximum time the first row of a batch waits for others
+            max_concurrent_batches: Number of batches that may be in flight at once
+        """
+        self.batch_fn = batch_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+
+        self._queue = queue.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrent_batches,
+                                            thread_name_prefix='micro-batch')
+        self._closed = False
+        # Guards _closed together with enqueueing, so no row lands behind _STOP
+        self._lock = threading.Lock()
+        self._dispatcher = threading.Thread(target=self._dispatch_loop,
+                                            name='micro-batch-dispatcher', daemon=True)
+        self._dispatcher.start()
+
+    def submit(self, row):
+        """
+        Queue a single feature row for scoring
+
+        Args:
+            row: List or array of feature values
+
+        Returns:
+            concurrent.futures.Future resolving to the prediction
+        """
+        future = Future()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("MicroBatcher is closed")
+            # The submitter's context (trace ID) travels with the row
+            self._queue.put((row, future, contextvars.copy_context()))
+        return future
+
+    def submit_many(self, rows):
+        """Queue several rows (e.g. all offers of one search); returns a list of futures"""
+        return [self.submit(row) for row in rows]
+
+    def predict(self, row):
+        """Score a single row, blocking until its batch completes"""
+        return self.submit(row).result()
+
+    def _dispatch_loop(self):
+        """Group queued rows into batches bounded by size and wait time"""
+        while True:
+            item = self._queue.get()
+            if item is self._STOP:
+                break
+
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            stop = False
+
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                try:
+                    # Drain rows that are already queued without waiting
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is self._STOP:
+                    stop = True
+                    break
+                batch.append(item)
+
+            self._executor.submit(self._run_batch, batch)
+            if stop:
+                break
+
+    def _run_batch(self, batch):
+        """Score one batch and resolve its futures"""
+        rows = [row for row, _, _ in batch]
+        try:
+            # Score in the first request's context so its trace covers the invocation
+            predictions = batch[0][2].run(self.batch_fn, rows)
+            if len(predictions) != len(rows):
+                raise ValueError(f"Expected {len(rows)} predictions, got {len(predictions)}")
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+
+        for (_, future, _), prediction in zip(batch, predictions):
+            future.set_result(prediction)
+
+    def close(self):
+        """Flush queued rows and stop the dispatcher"""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            self._queue.put(self._STOP)
+        self._dispatcher.join()
+        self._executor.shutdown(wait=True)
@@ -0,0 +1,327 @@
+"""
+Inference Request / Response Serialization
+
+Text payloads (CSV in, JSON out) spend a measurable share of latency and CPU
+formatting and parsing floats on both ends. This module adds binary payloads
+next to the text ones, shared by PricePredictionEndpoint and local_server.py.
+
+Content types:
+- text/csv                          rows in, predictions out (newline separated)
+- application/json                  {"instances": rows} in, SageMaker
+                                    {"predictions": [{"score": ...}]} out
+- application/x-npy                 float32 .npy array in and out (local server)
+- application/x-recordio-protobuf   SageMaker RecordIO-protobuf in and out
+                                    (supported by the SageMaker XGBoost container;
+                                    the only format that needs the sagemaker SDK)
+
+Binary payloads carry no column names, so clients send a hash of the feature
+order in the SageMaker CustomAttributes header and the local server rejects
+requests whose feature order differs from its feature_names.json.
+
+Usage:
+    python payloads.py --benchmark
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import struct
+import time
+
+import numpy as np
+
+
+CSV = 'text/csv'
+JSON = 'application/json'
+NPY = 'application/x-npy'
+RECORDIO = 'application/x-recordio-protobuf'
+
+CONTENT_TYPES = (CSV, JSON, NPY, RECORDIO)
+
+# RecordIO framing used by SageMaker built-in algorithms
+RECORDIO_MAGIC = 0xCED7230A
+
+# Key of the feature-order hash inside the CustomAttributes header
+FEATURE_HASH_ATTRIBUTE = 'feature_names_sha1'
+
+
+def _media_type(content_type, default):
+    return (content_type or default).split(';')[0].strip()
+
+
+def load_feature_names(path):
+    """Load feature names as written by train_xgboost.save_model"""
+    with open(path) as f:
+        return json.load(f)
+
+
+def feature_names_hash(feature_names):
+    """Short stable hash of the feature order"""
+    return hashlib.sha1(','.join(feature_names).encode('utf-8')).hexdigest()[:16]
+
+
+def feature_names_attribute(feature_names):
+    """CustomAttributes value announcing the client's feature order"""
+    return f'{FEATURE_HASH_ATTRIBUTE}={feature_names_hash(feature_names)}'
+
+
+def check_feature_attribute(custom_attributes, feature_names):
+    """
+    Verify a request's announced feature order against the model's
+
+    Raises:
+        ValueError: if the request announces a different feature order
+    """
+    if not custom_attributes:
+        return
+    for item in custom_attributes.split(';'):
+        key, _, value = item.strip().partition('=')
+        if key == FEATURE_HASH_ATTRIBUTE and value != feature_names_hash(feature_names):
+            raise ValueError("Request feature order does not match feature_names.json")
+
+
+def align_rows(rows, feature_names):
+    """
+    Put request rows in model feature order
+
+    Args:
+        rows: pandas DataFrame (columns are reordered by name), or list/array
+            of rows already in feature order (width is checked)
+        feature_names: Model feature names (feature_names.json)
+
+    Returns:
+        float32 array of shape (n_rows, n_features)
+
+    Raises:
+        ValueError: on missing columns or a wrong number of features
+    """
+    if hasattr(rows, 'columns'):
+        missing = [name for name in feature_names if name not in rows.columns]
+        if missing:
+            raise ValueError(f"Missing feature columns: {missing}")
+        rows = rows[feature_names].to_numpy()
+
+    rows = np.asarray(rows, dtype=np.float32)
+    if rows.ndim == 1:
+        rows = rows.reshape(1, -1)
+    if rows.shape[1] != len(feature_names):
+        raise ValueError(f"Expected {len(feature_names)} features, got {rows.shape[1]}")
+    return rows
+
+
+def _write_recordio(f, data):
+    """Write one RecordIO frame (magic, length, payload, 4-byte padding)"""
+    f.write(struct.pack('II', RECORDIO_MAGIC, len(data)))
+    f.write(data)
+    f.write(b'\x00' * ((4 - len(data) % 4) % 4))
+
+
+def serialize_rows(rows, content_type=CSV):
+    """
+    Encode feature rows as a request body
+
+    Args:
+        rows: List or array of feature rows
+        content_type: One of CONTENT_TYPES
+
+    Returns:
+        Request body bytes
+    """
+    content_type = _media_type(content_type, CSV)
+
+    if content_type == CSV:
+        return '\n'.join(','.join(str(value) for value in row) for row in rows).encode('utf-8')
+
+    rows = np.asarray(rows, dtype=np.float32)
+    if rows.ndim == 1:
+        rows = rows.reshape(1, -1)
+
+    if content_type == JSON:
+        return json.dumps({'instances': rows.tolist()}).encode('utf-8')
+    if content_type == NPY:
+        buffer = io.BytesIO()
+        np.save(buffer, rows, allow_pickle=False)
+        return buffer.getvalue()
+    if content_type == RECORDIO:
+        # sagemaker is only needed for RecordIO; imported here so the other
+        # formats (and the Lambda / inference code using them) do not require it
+        from sagemaker.amazon.common import write_numpy_to_dense_tensor
+        buffer = io.BytesIO()
+        write_numpy_to_dense_tensor(buffer, rows)
+        return buffer.getvalue()
+
+    raise ValueError(f"Unsupported content type: {content_type}")
+
+
+def deserialize_rows(body, content_type=CSV):
+    """
+    Decode a request body into a 2-D float32 array of feature rows
+
+    Args:
+        body: Request body bytes (or str for text payloads)
+        content_type: One of CONTENT_TYPES
+    """
+    content_type = _media_type(content_type, CSV)
+
+    if content_type == NPY:
+        rows = np.load(io.BytesIO(body), allow_pickle=False)
+    elif content_type == RECORDIO:
+        from sagemaker.amazon.common import read_records
+        records = read_records(io.BytesIO(body))
+        rows = [record.features['values'].float32_tensor.values for record in records]
+    else:
+        text = body.decode('utf-8') if isinstance(body, bytes) else body
+        if content_type == CSV:
+            rows = [line.split(',') for line in text.splitlines() if line.strip()]
+        elif content_type == JSON:
+            payload = json.loads(text)
+            rows = payload['instances'] if isinstance(payload, dict) else payload
+        else:
+            raise ValueError(f"Unsupported content type: {content_type}")
+
+    rows = np.asarray(rows, dtype=np.float32)
+    if rows.ndim == 1:
+        rows = rows.reshape(1, -1)
+    return rows
+
+
+def serialize_predictions(predictions, accept=JSON):
+    """
+    Encode predictions as a response body
+
+    Returns:
+        Tuple of (body bytes, content type)
+    """
+    accept = _media_type(accept, JSON)
+
+    if accept == CSV:
+        return '\n'.join(str(float(p)) for p in predictions).encode('utf-8'), CSV
+    if accept == NPY:
+        buffer = io.BytesIO()
+        np.save(buffer, np.asarray(predictions, dtype=np.float32), allow_pickle=False)
+        return buffer.getvalue(), NPY
+    if accept == RECORDIO:
+        # Same layout as the SageMaker XGBoost container: label['score'] per row
+        from sagemaker.amazon.record_pb2 import Record
+        buffer = io.BytesIO()
+        for prediction in predictions:
+            record = Record()
+            record.label['score'].float32_tensor.values.append(float(prediction))
+            _write_recordio(buffer, record.SerializeToString())
+        return buffer.getvalue(), RECORDIO
+
+    body = json.dumps({'predictions': [{'score': float(p)} for p in predictions]})
+    return body.encode('utf-8'), JSON
+
+
+def parse_predictions(payload):
+    """
+    Normalize a decoded JSON response to a list of floats
+
+    Accepts both a plain JSON list and the SageMaker XGBoost container format
+    {"predictions": [{"score": ...}, ...]}.
+    """
+    if isinstance(payload, dict):
+        payload = payload['predictions']
+
+    return [float(p['score']) if isinstance(p, dict) else float(p) for p in payload]
+
+
+def deserialize_predictions(body, content_type=JSON):
+    """
+    Decode a response body into a list of predicted prices
+
+    Args:
+        body: Response body bytes
+        content_type: Response content type
+    """
+    content_type = _media_type(content_type, JSON)
+
+    if content_type == NPY:
+        return np.load(io.BytesIO(body), allow_pickle=False).astype(float).tolist()
+    if content_type == RECORDIO:
+        from sagemaker.amazon.common import read_records
+        records = read_records(io.BytesIO(body))
+        return [float(record.label['score'].float32_tensor.values[0]) for record in records]
+    if content_type == CSV:
+        text = body.decode('utf-8')
+        return [float(value) for value in text.replace(',', '\n').split()]
+
+    return parse_predictions(json.loads(body))
+
+
+def benchmark(batch_sizes=(1, 10, 100, 1000), num_features=32, repeats=200, seed=42):
+    """
+    Measure round-trip serialization cost and payload size per content type
+
+    Each round trip covers what both ends do for one invocation: client
+    encodes rows, server decodes them, server encodes predictions, client
+    decodes them.
+
+    Returns:
+        List of result dicts (content_type, batch_size, request/response bytes,
+        mean round-trip serialization time in microseconds)
+    """
+    rng = np.random.default_rng(seed)
+    results = []
+
+    for batch_size in batch_sizes:
+        rows = rng.normal(300, 100, size=(batch_size, num_features)).astype(np.float32)
+        predictions = rng.normal(300, 100, size=batch_size).astype(np.float32)
+
+        for content_type in CONTENT_TYPES:
+            # Text requests come in as Python lists, binary ones as arrays
+            request_rows = rows.tolist() if content_type in (CSV, JSON) else rows
+
+            start = time.perf_counter()
+            for _ in range(repeats):
+                request = serialize_rows(request_rows, content_type)
+                deserialize_rows(request, content_type)
+                response, response_type = serialize_predictions(predictions, content_type)
+                deserialize_predictions(response, response_type)
+            elapsed = (time.perf_counter() - start) / repeats
+
+            results.append({
+                'content_type': content_type,
+                'batch_size': batch_size,
+                'request_bytes': len(request),
+                'response_bytes': len(response),
+                'round_trip_us': round(elapsed * 1e6, 1)
+            })
+
+    return results
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Benchmark inference payload serialization')
+    parser.add_argument('--benchmark', action='store_true')
+    parser.add_argument('--num-features', type=int, default=32)
+    parser.add_argument('--repeats', type=int, default=200)
+    parser.add_argument('--output', type=str, default=None,
+                        help='Write benchmark results as JSON to this path')
+
+    args = parser.parse_args()
+    if not args.benchmark:
+        parser.print_help()
+        return
+
+    results = benchmark(num_features=args.num_features, repeats=args.repeats)
+
+    print(f"{'content type':<34}{'batch':>7}{'request B':>12}{'response B':>12}{'round trip us':>15}")
+    for r in results:
+        print(f"{r['content_type']:<34}{r['batch_size']:>7}{r['request_bytes']:>12}"
+              f"{r['response_bytes']:>12}{r['round_trip_us']:>15.1f}")
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBenchmark results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,265 @@
+"""
+Model-Version-Aware Prediction Cache
+
+Search traffic scores the same route / date / offer features many times an
+hour. This cache sits in front of PricePredictionEndpoint and answers
+repeated feature rows from memory.
+
+Features:
+- Keys are the canonical float32 feature vector plus the model artifact
+  version (model_data_s3_uri), so a new model never serves stale prices
+- LRU eviction with TTL expiry, bounded by entry count and estimated bytes
+- Optional coalescing of concurrent identical requests into one invocation
+- Hit-rate, latency and memory metrics
+- Automatic invalidation when deploy_endpoint rolls out a model
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+import numpy as np
+
+from payloads import align_rows
+
+
+# Approximate per-entry overhead: OrderedDict node, key tuple, value tuple
+ENTRY_OVERHEAD_BYTES = 200
+
+
+class PredictionCache:
+    """LRU + TTL cache of endpoint predictions keyed by features and model version"""
+
+    def __init__(self, endpoint, max_entries=100000, max_bytes=64 * 1024 * 1024,
+                 ttl_seconds=300.0, coalesce=True, latency_window=10000):
+        """
+        Initialize prediction cache
+
+        Args:
+            endpoint: PricePredictionEndpoint (anything with `predict(rows)` and
+                `model_data_s3_uri`)
+            max_entries: Maximum number of cached predictions
+            max_bytes: Maximum estimated memory footprint of the cache
+            ttl_seconds: Lifetime of a cached prediction (None for no expiry)
+            coalesce: Share one invocation between concurrent identical rows
+            latency_window: Number of recent request latencies kept for percentiles
+        """
+        self.endpoint = endpoint
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.coalesce = coalesce
+
+        self._entries = OrderedDict()   # key -> (prediction, expires_at, size)
+        self._expiry = deque()          # (expires_at, key) in insertion order
+        self._in_flight = {}            # key -> Future
+        self._lock = threading.Lock()
+        self._bytes = 0
+        # Bumped by invalidate(): results of misses issued earlier are not stored
+        self._generation = 0
+
+        self._counters = {
+            'hits': 0, 'misses': 0, 'coalesced': 0,
+            'evictions': 0, 'expirations': 0, 'invalidations': 0
+        }
+        self._latencies = deque(maxlen=latency_window)
+
+        # Drop everything when the endpoint deploys a new model
+        if hasattr(endpoint, 'deploy_listeners'):
+            endpoint.deploy_listeners.append(self.invalidate)
+
+    @property
+    def model_version(self):
+        return self.endpoint.model_data_s3_uri
+
+    @staticmethod
+    def canonical_key(row, model_version):
+        """Canonical cache key: model version plus the row's float32 bytes"""
+        return model_version, np.asarray(row, dtype=np.float32).tobytes()
+
+    def canonical_rows(self, features):
+        """
+        Feature rows as a float32 matrix in model feature order
+
+        DataFrames are aligned by column name when the endpoint knows its
+        feature names, exactly as the endpoint itself does.
+        """
+        feature_names = getattr(self.endpoint, 'feature_names', None)
+        if feature_names is not None:
+            return align_rows(features, feature_names)
+        if hasattr(features, 'columns'):
+            features = features.to_numpy()
+        rows = np.asarray(features, dtype=np.float32)
+        return rows.reshape(1, -1) if rows.ndim == 1 else rows
+
+    def predict(self, features):
+        """
+        Predict prices, serving cached rows from memory
+
+        Args:
+            features: DataFrame, list or array of feature rows
+
+        Returns:
+            List of predicted prices, one per row
+        """
+        start = time.perf_counter()
+        version = self.model_version
+        rows = self.canonical_rows(features)
+        keys = [self.canonical_key(row, version) for row in rows]
+
+        results = [None] * len(keys)
+        waiting = []    # (index, future) for rows another request is scoring
+        owned = {}      # key -> (Future, [row indices]) for rows this request scores
+
+        now = time.monotonic()
+        with self._lock:
+            generation = self._generation
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is not None and (entry[1] is None or entry[1] > now):
+                    self._entries.move_to_end(key)
+                    results[i] = entry[0]
+                    self._counters['hits'] += 1
+                    continue
+
+                if entry is not None:
+                    self._remove(key)
+                    self._counters['expirations'] += 1
+
+                if key in owned:
+                    owned[key][1].append(i)
+                    self._counters['hits'] += 1
+                elif self.coalesce and key in self._in_flight:
+                    waiting.append((i, self._in_flight[key]))
+                    self._counters['coalesced'] += 1
+                else:
+                    future = Future()
+                    owned[key] = (future, [i])
+                    if self.coalesce:
+                        self._in_flight[key] = future
+                    self._counters['misses'] += 1
+
+        if owned:
+            self._score_misses(rows, owned, results, generation)
+
+        for i, future in waiting:
+            results[i] = future.result()
+
+        latency = time.perf_counter() - start
+        with self._lock:
+            self._latencies.append(latency)
+        return results
+
+    def _score_misses(self, rows, owned, results, generation):
+        """Score all missed rows in one endpoint call and populate the cache"""
+        miss_keys = list(owned)
+        miss_rows = rows[[owned[key][1][0] for key in miss_keys]]
+
+        try:
+            predictions = self.endpoint.predict(miss_rows)
+            # A short result would leave the unmatched rows' futures unresolved
+            if len(predictions) != len(miss_keys):
+                raise ValueError(f"Expected {len(miss_keys)} predictions, got {len(predictions)}")
+        except Exception as e:
+            with self._lock:
+                for key in miss_keys:
+                    self._release_in_flight(key, owned[key][0])
+            for key in miss_keys:
+                owned[key][0].set_exception(e)
+            raise
+
+        now = time.monotonic()
+        expires_at = None if self.ttl_seconds is None else now + self.ttl_seconds
+        with self._lock:
+            for key, prediction in zip(miss_keys, predictions):
+                self._release_in_flight(key, owned[key][0])
+                # Skip results issued before an invalidation (model redeployed while scoring)
+                if self._generation == generation:
+                    self._store(key, prediction, expires_at, now)
+
+        for key, prediction in zip(miss_keys, predictions):
+            future, indices = owned[key]
+            future.set_result(prediction)
+            for i in indices:
+                results[i] = prediction
+
+    def _release_in_flight(self, key, future):
+        # After an invalidation the key may belong to a newer request
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+
+    def _store(self, key, prediction, expires_at, now):
+        """Insert an entry, drop expired entries and evict LRU entries over budget"""
+        if key in self._entries:
+            self._remove(key)
+
+        # Constant TTL: the expiry queue is ordered, so expired entries sit at the front
+        while self._expiry and self._expiry[0][0] <= now:
+            expired_at, expired_key = self._expiry.popleft()
+            entry = self._entries.get(expired_key)
+            if entry is not None and entry[1] == expired_at:
+                self._remove(expired_key)
+                self._counters['expirations'] += 1
+
+        # Values range from float prices to explanation vectors (explainer.py)
+        size = ENTRY_OVERHEAD_BYTES + sys.getsizeof(key[1]) + sys.getsizeof(prediction)
+        self._entries[key] = (prediction, expires_at, size)
+        self._bytes += size
+        if expires_at is not None:
+            self._expiry.append((expires_at, key))
+
+        while self._entries and (len(self._entries) > self.max_entries
+                                 or self._bytes > self.max_bytes):
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._counters['evictions'] += 1
+
+    def _remove(self, key):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def invalidate(self, model_data_s3_uri=None):
+        """
+        Drop all cached predictions
+
+        Args:
+            model_data_s3_uri: Newly deployed model version (passed by
+                PricePredictionEndpoint.deploy_endpoint; unused)
+        """
+        with self._lock:
+            self._entries.clear()
+            self._expiry.clear()
+            # Requests scoring against the old model neither get joined nor stored
+            self._in_flight.clear()
+            self._generation += 1
+            self._bytes = 0
+            self._counters['invalidations'] += 1
+        print("Prediction cache invalidated")
+
+    def stats(self):
+        """
+        Cache metrics
+
+        Returns:
+            Dict with counters, hit rate, entry count, estimated bytes and
+            request latency percentiles in milliseconds
+        """
+        with self._lock:
+            stats = dict(self._counters)
+            stats['entries'] = len(self._entries)
+            stats['memory_bytes'] = self._bytes
+            latencies = np.array(self._latencies, dtype=np.float64)
+
+        lookups = stats['hits'] + stats['misses'] + stats['coalesced']
+        stats['hit_rate'] = (stats['hits'] + stats['coalesced']) / lookups if lookups else 0.0
+
+        if len(latencies):
+            stats['latency_p50_ms'] = float(np.percentile(latencies, 50) * 1000)
+            stats['latency_p99_ms'] = float(np.percentile(latencies, 99) * 1000)
+
+        return stats
@@ -0,0 +1,319 @@
+"""
+Precomputed Price Grid Served from a Memory-Mapped Lookup Table
+
+Much of the price surface depends only on route, airline, stops, days until
+departure and day of week. This batch job scores that full grid with the
+trained model after each training run and writes it as a flat float32 .npy
+file plus a small JSON index. Lookups are O(1) array reads that never touch
+the model, and every worker process maps the same file, so the table is
+shared through the OS page cache.
+
+Features:
+- Vectorized grid scoring in large batches
+- Compact float32 table written with np.lib.format.open_memmap
+- JSON index of axis values and the model version
+- Table and index published together: a versioned directory behind an
+  atomically replaced CURRENT pointer
+- O(1) lookup API with fallback to live scoring for off-grid requests
+
+Usage:
+    python price_grid.py --model-dir model/ --output-dir price_grid/ \\
+        --model-version s3://airline-data-lake/models/price_prediction/v1/model.tar.gz
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+
+from local_server import LocalModel
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ingestion'))
+from kinesis_producer import FlightDataGenerator
+
+
+CURRENT_FILE = 'CURRENT'
+GRID_FILE = 'price_grid.npy'
+INDEX_FILE = 'price_grid_index.json'
+
+# Grid axes, in table dimension order
+AXES = ['route', 'airline', 'stops', 'days_until_departure', 'day_of_week']
+
+
+def default_axes():
+    """Grid axes covering the routes and airlines in FlightDataGenerator traffic"""
+    airports = FlightDataGenerator.AIRPORTS
+    return {
+        'route': [f'{o}-{d}' for o in airports for d in airports if o != d],
+        'airline': list(FlightDataGenerator.AIRLINES),
+        'stops': [0, 1, 2],
+        'days_until_departure': list(range(1, 91)),
+        'day_of_week': list(range(1, 8))
+    }
+
+
+def build_feature_matrix(feature_names, cells, defaults=None):
+    """
+    Build model feature rows for grid cells
+
+    Grid values map onto the columns produced by train_xgboost.prepare_features:
+    numeric columns by name and one-hot columns as `<column>_<value>`.
+
+    Args:
+        feature_names: Model feature names (feature_names.json)
+        cells: Dict of equal-length arrays: origin_airport, destination_airport,
+            airline, stops, days_until_departure, day_of_week
+        defaults: Optional dict of values for features not on the grid
+
+    Returns:
+        float32 array of shape (n_cells, n_features)
+    """
+    n = len(cells['stops'])
+    defaults = defaults or {}
+    column_index = {name: i for i, name in enumerate(feature_names)}
+
+    X = np.zeros((n, len(feature_names)), dtype=np.float32)
+    for name, value in defaults.items():
+        if name in column_index:
+            X[:, column_index[name]] = value
+
+    numeric = {
+        'stops': cells['stops'],
+        'days_until_departure': cells['days_until_departure'],
+        'day_of_week': cells['day_of_week'],
+        # dayofweek in the ETL job: 1 = Sunday, 7 = Saturday
+        'is_weekend': np.isin(cells['day_of_week'], [1, 7]).astype(np.float32)
+    }
+    for name, values in numeric.items():
+        if name in column_index:
+            X[:, column_index[name]] = values
+
+    for column in ['origin_airport', 'destination_airport', 'airline']:
+        values = np.asarray(cells[column])
+        for value in np.unique(values):
+            name = f'{column}_{value}'
+            if name in column_index:
+                X[values == value, column_index[name]] = 1.0
+
+    return X
+
+
+def build_price_grid(model, output_dir, axes=None, defaults=None, model_version=None,
+                     batch_size=262144, keep=2):
+    """
+    Score every grid cell and publish the memory-mapped table and index
+
+    Table and index are written into a new version directory, which is
+    renamed into place complete and then made current by replacing the
+    CURRENT pointer, so readers always see a matching pair.
+
+    Args:
+        model: LocalModel (anything with `predict(X)` and `feature_names`)
+        output_dir: Grid root directory (CURRENT plus version directories)
+        axes: Dict of axis values (defaults to default_axes())
+        defaults: Values for model features that are not on the grid
+        model_version: Model artifact version recorded in the index
+        batch_size: Number of cells scored per model call
+        keep: Number of newest grid versions kept (the current one included)
+
+    Returns:
+        Grid version
+    """
+    axes = axes or default_axes()
+    shape = tuple(len(axes[axis]) for axis in AXES)
+    num_cells = int(np.prod(shape))
+
+    version = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    version_dir = os.path.join(output_dir, version)
+    tmp_dir = os.path.join(output_dir, 'tmp-' + version)
+    os.makedirs(tmp_dir)
+
+    print(f"Scoring price grid {dict(zip(AXES, shape))} = {num_cells:,} cells")
+    start = time.time()
+
+    table = np.lib.format.open_memmap(os.path.join(tmp_dir, GRID_FILE), mode='w+',
+                                      dtype=np.float32, shape=shape)
+    flat = table.reshape(-1)
+
+    routes = np.array([route.split('-') for route in axes['route']])
+    airlines = np.asarray(axes['airline'])
+    stops = np.asarray(axes['stops'])
+    days = np.asarray(axes['days_until_departure'])
+    weekdays = np.asarray(axes['day_of_week'])
+
+    for batch_start in range(0, num_cells, batch_size):
+        batch_end = min(batch_start + batch_size, num_cells)
+        r, a, s, d, w = np.unravel_index(np.arange(batch_start, batch_end), shape)
+
+        cells = {
+            'origin_airport': routes[r, 0],
+            'destination_airport': routes[r, 1],
+            'airline': airlines[a],
+            'stops': stops[s],
+            'days_until_departure': days[d],
+            'day_of_week': weekdays[w]
+        }
+        X = build_feature_matrix(model.feature_names, cells, defaults)
+        flat[batch_start:batch_end] = model.predict(X)
+
+    table.flush()
+    del table, flat
+
+    index = {
+        'version': version,
+        'axes': axes,
+        'shape': list(shape),
+        'model_version': model_version,
+        'created_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    }
+    with open(os.path.join(tmp_dir, INDEX_FILE), 'w') as f:
+        json.dump(index, f)
+
+    # Publish: complete version directory first, then the pointer in one rename
+    os.rename(tmp_dir, version_dir)
+    tmp_current = os.path.join(output_dir, CURRENT_FILE + '.tmp')
+    with open(tmp_current, 'w') as f:
+        f.write(version)
+    os.replace(tmp_current, os.path.join(output_dir, CURRENT_FILE))
+
+    prune_grids(output_dir, keep)
+
+    grid_path = os.path.join(version_dir, GRID_FILE)
+    elapsed = time.time() - start
+    print(f"Price grid written to {grid_path} ({os.path.getsize(grid_path) / 1e6:.1f} MB) "
+          f"in {elapsed:.1f}s ({num_cells / max(elapsed, 1e-9):,.0f} cells/sec)")
+    return version
+
+
+def prune_grids(output_dir, keep=2):
+    """
+    Delete all but the `keep` newest published grid versions (never the
+    current one); readers that still map an older grid keep their open files
+    """
+    with open(os.path.join(output_dir, CURRENT_FILE)) as f:
+        current = f.read().strip()
+
+    # Version names are UTC timestamps; unpublished tmp- directories are skipped
+    versions = sorted(name for name in os.listdir(output_dir)
+                      if os.path.exists(os.path.join(output_dir, name, INDEX_FILE)))
+    for version in versions[:-keep] if keep else versions:
+        if version != current:
+            shutil.rmtree(os.path.join(output_dir, version), ignore_errors=True)
+
+
+class PriceGrid:
+    """O(1) price lookups from the memory-mapped grid"""
+
+    def __init__(self, grid_dir, fallback=None, model_version=None):
+        """
+        Open the current price grid
+
+        Args:
+            grid_dir: Directory written by build_price_grid
+            fallback: Optional callable(origin, destination, airline, stops,
+                days_until_departure, day_of_week) used for off-grid requests
+            model_version: If given, the grid must have been built from this
+                model version
+
+        Raises:
+            ValueError: If table and index do not match, or the grid was
+                built from a different model version
+        """
+        with open(os.path.join(grid_dir, CURRENT_FILE)) as f:
+            version = f.read().strip()
+        version_dir = os.path.join(grid_dir, version)
+
+        with open(os.path.join(version_dir, INDEX_FILE)) as f:
+            index = json.load(f)
+
+        # Read-only mapping: pages are shared between processes
+        table = np.load(os.path.join(version_dir, GRID_FILE), mmap_mode='r')
+
+        expected_shape = tuple(len(index['axes'][axis]) for axis in AXES)
+        if (index.get('version') != version or table.dtype != np.float32
+                or table.shape != tuple(index['shape']) or table.shape != expected_shape):
+            raise ValueError(f"Price grid {version_dir}: table {table.shape} {table.dtype} "
+                             f"does not match its index (version {index.get('version')}, "
+                             f"shape {index['shape']})")
+        if model_version is not None and index['model_version'] != model_version:
+            raise ValueError(f"Price grid {version} was built from model "
+                             f"{index['model_version']}, expected {model_version}")
+
+        self.version = version
+        self.model_version = index['model_version']
+        self.fallback = fallback
+        self.table = table
+
+        # Axis value -> position, one dict per axis
+        self._positions = [
+            {value: i for i, value in enumerate(index['axes'][axis])} for axis in AXES
+        ]
+
+        self.hits = 0
+        self.fallbacks = 0
+
+    def lookup(self, origin, destination, airline, stops, days_until_departure, day_of_week):
+        """
+        Look up a precomputed price
+
+        Returns:
+            Predicted price, the fallback's result for off-grid requests, or
+            None if the request is off-grid and no fallback is configured
+        """
+        keys = (f'{origin}-{destination}', airline, int(stops), int(days_until_departure),
+                int(day_of_week))
+        try:
+            position = tuple(positions[key] for positions, key in zip(self._positions, keys))
+        except KeyError:
+            self.fallbacks += 1
+            if self.fallback is None:
+                return None
+            return self.fallback(origin, destination, airline, stops, days_until_departure,
+                                 day_of_week)
+
+        self.hits += 1
+        return float(self.table[position])
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Precompute the price grid for O(1) lookups')
+    parser.add_argument('--model-dir', type=str, required=True,
+                        help='Directory with xgboost-model and feature_names.json')
+    parser.add_argument('--output-dir', type=str, default='price_grid',
+                        help='Directory for the grid table and index')
+    parser.add_argument('--defaults', type=str, default=None,
+                        help='JSON file of values for features not on the grid')
+    parser.add_argument('--model-version', type=str, default=None,
+                        help='Model artifact version (e.g. model_data_s3_uri)')
+    parser.add_argument('--batch-size', type=int, default=262144)
+    parser.add_argument('--keep', type=int, default=2,
+                        help='Number of grid versions kept on disk')
+
+    args = parser.parse_args()
+
+    defaults = None
+    if args.defaults:
+        with open(args.defaults) as f:
+            defaults = json.load(f)
+
+    build_price_grid(
+        LocalModel(args.model_dir),
+        args.output_dir,
+        defaults=defaults,
+        model_version=args.model_version,
+        batch_size=args.batch_size,
+        keep=args.keep
+    )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,432 @@
+"""
+Batch Price Optimization on Top of the Price Prediction Model
+
+The model predicts the market price of a flight; this job decides the price
+to charge. For every flight it predicts the market price in one large model
+batch, evaluates a grid of candidate prices against a demand curve
+(own-price elasticity plus a competitor-price response using the cheapest
+competing offer from `price_offers`), and picks the revenue-maximizing
+candidate that satisfies the business constraints.
+
+Features:
+- One vectorized NumPy pass over a (flights x candidates) matrix
+- Model scoring in large batches (LocalModel or tree_scorer.TreeEnsemble),
+  optionally with route features from the online feature store
+- Price floors, ceilings and a maximum change per update
+- Incremental re-optimization of only the flights whose inputs changed
+- Flight table built from FlightDataGenerator / Kinesis search events
+
+Usage:
+    python price_optimizer.py --model-dir model/ --num-searches 100000 \\
+        --candidates 41 --max-change 0.1 --output prices.csv
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+from datetime import date, datetime
+
+import numpy as np
+import pandas as pd
+
+from feature_store import ROUTE_FEATURES, route_key
+from local_server import LocalModel
+from price_grid import build_feature_matrix
+from tree_scorer import TreeEnsemble
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'ingestion'))
+from kinesis_producer import FlightDataGenerator
+
+
+# Columns that determine a flight's price decision; a change in any of them
+# marks the flight for re-optimization
+INPUT_COLUMNS = [
+    'origin_airport', 'destination_airport', 'airline', 'stops',
+    'days_until_departure', 'day_of_week', 'current_price', 'competitor_min_price',
+    'floor_price', 'ceiling_price', 'elasticity', 'base_demand', 'seats_remaining'
+]
+
+# Lowest market price used for pricing: the model can predict prices <= 0
+# for unusual inputs, which would make the demand curve undefined
+MIN_MARKET_PRICE = 1.0
+
+# Per-flight columns filled from optimizer defaults when missing
+OPTIONAL_COLUMNS = {
+    'competitor_min_price': np.nan,
+    'floor_price': 0.0,
+    'ceiling_price': np.inf,
+    'elasticity': None,
+    'base_demand': 1.0,
+    'seats_remaining': np.inf
+}
+
+
+def flights_from_searches(events, today=None):
+    """
+    Build the flight table from search events
+
+    Every offered flight_number becomes one flight; its current price is the
+    latest offered price and its competitor price the cheapest offer from
+    another airline seen in the same searches.
+
+    Args:
+        events: Search events (FlightDataGenerator / Kinesis records)
+        today: Reference date for days_until_departure
+
+    Returns:
+        DataFrame indexed by flight_id
+    """
+    today = today or date.today()
+    rows = []
+    for event in events:
+        departure = datetime.strptime(event['departure_date'], '%Y-%m-%d').date()
+        offers = event['price_offers']
+        for offer in offers:
+            competitor = [o['price'] for o in offers if o['airline'] != offer['airline']]
+            rows.append({
+                'flight_id': f"{offer['flight_number']}-{event['departure_date']}",
+                'origin_airport': event['origin_airport'],
+                'destination_airport': event['destination_airport'],
+                'airline': offer['airline'],
+                'stops': offer['stops'],
+                'days_until_departure': (departure - today).days,
+                # Spark dayofweek convention used by the ETL job: 1 = Sunday
+                'day_of_week': departure.isoweekday() % 7 + 1,
+                'current_price': offer['price'],
+                'competitor_min_price': min(competitor) if competitor else np.nan
+            })
+
+    searches = pd.DataFrame(rows)
+    flights = searches.groupby('flight_id').agg(
+        {**{column: 'last' for column in searches.columns if column != 'flight_id'},
+         'competitor_min_price': 'min'}
+    )
+    return flights
+
+
+class PriceOptimizer:
+    """Pick revenue-maximizing prices for batches of flights"""
+
+    def __init__(self, model, num_candidates=41, max_change=0.10, min_ratio=0.7,
+                 max_ratio=1.3, price_step=1.0, elasticity=-1.5,
+                 competitor_sensitivity=4.0, feature_store=None, feature_defaults=None,
+                 batch_size=65536):
+        """
+        Args:
+            model: Anything with `predict(X)` and `feature_names` (LocalModel,
+                TreeEnsemble)
+            num_candidates: Candidate prices evaluated per flight
+            max_change: Maximum relative change from current_price per update
+            min_ratio: Lowest candidate as a fraction of the predicted market price
+            max_ratio: Highest candidate as a fraction of the predicted market price
+            price_step: Candidates are rounded to this step (0 disables rounding)
+            elasticity: Default own-price elasticity of demand (negative)
+            competitor_sensitivity: Steepness of the demand response to the
+                price ratio against the cheapest competitor
+            feature_store: Optional OnlineFeatureStore supplying route features
+            feature_defaults: Values for model features not in the flight table
+            batch_size: Flights scored per model call and optimized per pass
+        """
+        self.model = model
+        self.num_candidates = num_candidates
+        self.max_change = max_change
+        self.min_ratio = min_ratio
+        self.max_ratio = max_ratio
+        self.price_step = price_step
+        self.elasticity = elasticity
+        self.competitor_sensitivity = competitor_sensitivity
+        self.feature_store = feature_store
+        self.feature_defaults = feature_defaults
+        self.batch_size = batch_size
+
+        # State for incremental re-optimization
+        self.decisions = None
+        self.input_hashes = None
+
+    def _with_defaults(self, flights):
+        flights = flights.copy()
+        for column, default in OPTIONAL_COLUMNS.items():
+            if default is None:
+                default = self.elasticity
+            if column not in flights.columns:
+                flights[column] = default
+            else:
+                flights[column] = flights[column].fillna(default)
+        return flights
+
+    def predict_market_prices(self, flights):
+        """
+        Predict market prices for all flights in large model batches
+
+        Returns:
+            float64 array of predicted prices
+        """
+        feature_names = self.model.feature_names
+        column_index = {name: i for i, name in enumerate(feature_names)}
+        predictions = np.empty(len(flights))
+
+        for start in range(0, len(flights), self.batch_size):
+            batch = flights.iloc[start:start + self.batch_size]
+            cells = {column: batch[column].to_numpy() for column in
+                     ['origin_airport', 'destination_airport', 'airline', 'stops',
+                      'days_until_departure', 'day_of_week']}
+            X = build_feature_matrix(feature_names, cells, self.feature_defaults)
+
+            if self.feature_store is not None:
+                keys = [route_key(o, d) for o, d in
+                        zip(cells['origin_airport'], cells['destination_airport'])]
+                route_values = self.feature_store.get_features(keys)
+                for j, name in enumerate(ROUTE_FEATURES):
+                    if name in column_index:
+                        X[:, column_index[name]] = route_values[:, j]
+
+            predictions[start:start + len(batch)] = self.model.predict(X)
+
+        return predictions
+
+    def _optimize_batch(self, market, current, competitor, floor, ceiling, elasticity,
+                        base_demand, seats):
+        """Vectorized candidate evaluation for one batch of flights"""
+        # Candidate grid around the market price, restricted to what the
+        # constraints allow: floors/ceilings are hard limits, the rate limit
+        # gives way when it conflicts with them
+        low = np.clip(np.maximum(market * self.min_ratio, current * (1 - self.max_change)),
+                      floor, ceiling)
+        high = np.clip(np.minimum(market * self.max_ratio, current * (1 + self.max_change)),
+                       floor, ceiling)
+        # Market range entirely outside the rate-limited range: move as far as allowed
+        high = np.maximum(high, low)
+
+        steps = np.linspace(0.0, 1.0, self.num_candidates)
+        prices = low[:, None] + (high - low)[:, None] * steps[None, :]
+        if self.price_step:
+            prices = np.round(prices / self.price_step) * self.price_step
+            prices = np.clip(prices, low[:, None], high[:, None])
+
+        # Demand relative to selling at the market price
+        demand = base_demand[:, None] * (prices / market[:, None]) ** elasticity[:, None]
+
+        # Logistic response to the cheapest competitor (1.0 at price parity)
+        has_competitor = ~np.isnan(competitor)
+        competitor_ratio = prices / np.where(has_competitor, competitor, 1.0)[:, None]
+        exponent = np.clip(self.competitor_sensitivity * (competitor_ratio - 1.0), -50.0, 50.0)
+        response = 2.0 / (1.0 + np.exp(exponent))
+        demand *= np.where(has_competitor[:, None], response, 1.0)
+
+        bookings = np.minimum(demand, seats[:, None])
+        revenue = prices * bookings
+
+        # argmax keeps the lowest price among ties
+        best = np.argmax(revenue, axis=1)
+        rows = np.arange(len(best))
+        return prices[rows, best], bookings[rows, best], revenue[rows, best], low == high
+
+    def optimize(self, flights):
+        """
+        Price every flight
+
+        Args:
+            flights: DataFrame indexed by flight_id with at least origin_airport,
+                destination_airport, airline, stops, days_until_departure,
+                day_of_week and current_price; optional columns are listed in
+                OPTIONAL_COLUMNS
+
+        Returns:
+            DataFrame indexed by flight_id with market_price, recommended_price,
+            price_change_pct, expected_bookings, expected_revenue and constrained
+
+        Raises:
+            ValueError: If a current_price is missing or not positive (the
+                maximum change per update is relative to it)
+        """
+        invalid = ~(flights['current_price'].to_numpy(dtype=np.float64) > 0)
+        if invalid.any():
+            raise ValueError(f"{int(invalid.sum())} flights have a missing or non-positive "
+                             f"current_price, e.g. {list(flights.index[invalid][:5])}")
+
+        flights = self._with_defaults(flights)
+        market = self.predict_market_prices(flights)
+
+        clipped = market < MIN_MARKET_PRICE
+        if clipped.any():
+            print(f"Clipped {int(clipped.sum())} market price predictions below "
+                  f"{MIN_MARKET_PRICE} to {MIN_MARKET_PRICE}")
+            market = np.maximum(market, MIN_MARKET_PRICE)
+
+        n = len(flights)
+        recommended = np.empty(n)
+        bookings = np.empty(n)
+        revenue = np.empty(n)
+        constrained = np.empty(n, dtype=bool)
+
+        columns = {column: flights[column].to_numpy(dtype=np.float64) for column in
+                   ['current_price', 'competitor_min_price', 'floor_price', 'ceiling_price',
+                    'elasticity', 'base_demand', 'seats_remaining']}
+
+        # Bound the (flights x candidates) working set
+        for start in range(0, n, self.batch_size):
+            end = min(start + self.batch_size, n)
+            batch = {column: values[start:end] for column, values in columns.items()}
+            (recommended[start:end], bookings[start:end], revenue[start:end],
+             constrained[start:end]) = self._optimize_batch(
+                market[start:end], batch['current_price'], batch['competitor_min_price'],
+                batch['floor_price'], batch['ceiling_price'], batch['elasticity'],
+                batch['base_demand'], batch['seats_remaining']
+            )
+
+        current = columns['current_price']
+        return pd.DataFrame({
+            'market_price': market,
+            'current_price': current,
+            'recommended_price': recommended,
+            'price_change_pct': (recommended - current) / current * 100,
+            'expected_bookings': bookings,
+            'expected_revenue': revenue,
+            'constrained': constrained
+        }, index=flights.index)
+
+    def _hash_inputs(self, flights):
+        columns = [column for column in INPUT_COLUMNS if column in flights.columns]
+        return pd.util.hash_pandas_object(flights[columns], index=False).set_axis(flights.index)
+
+    def reoptimize(self, flights):
+        """
+        Re-price only flights that are new or whose inputs changed since the
+        previous call; decisions for unchanged flights are reused
+
+        Args:
+            flights: Full flight table (same layout as for optimize)
+
+        Returns:
+            Tuple of (decisions for all flights, number of flights re-optimized)
+        """
+        hashes = self._hash_inputs(flights).to_numpy()
+
+        if self.decisions is None:
+            changed = np.ones(len(flights), dtype=bool)
+        else:
+            # Row of each flight in the previous call (-1 for new flights)
+            positions = self.decisions.index.get_indexer(flights.index)
+            changed = (positions < 0) | (self.input_hashes[np.maximum(positions, 0)] != hashes)
+
+        updated = self.optimize(flights[changed]) if changed.any() else None
+
+        if self.decisions is None:
+            decisions = updated
+        else:
+            # Reuse previous rows positionally, then overwrite the re-optimized ones;
+            # flights that are no longer offered drop out
+            decisions = self.decisions.iloc[np.maximum(positions, 0)].set_axis(flights.index)
+            if updated is not None:
+                rows = np.flatnonzero(changed)
+                for column in decisions.columns:
+                    values = decisions[column].to_numpy(copy=True)
+                    values[rows] = updated[column].to_numpy()
+                    decisions[column] = values
+
+        self.decisions = decisions
+        self.input_hashes = hashes
+        return self.decisions, int(changed.sum())
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Optimize prices for a batch of flights')
+    parser.add_argument('--model-dir', type=str, required=True,
+                        help='Directory with xgboost-model and feature_names.json')
+    parser.add_argument('--flights', type=str, default=None,
+                        help='Flight table (CSV or Parquet, flight_id column); '
+                             'generated from search events if omitted')
+    parser.add_argument('--num-searches', type=int, default=100000,
+                        help='Search events to generate when --flights is omitted')
+    parser.add_argument('--scorer', type=str, default='tree',
+                        choices=['tree', 'xgboost'],
+                        help='tree_scorer.TreeEnsemble or the XGBoost booster')
+    parser.add_argument('--feature-store-dir', type=str, default=None)
+    parser.add_argument('--defaults', type=str, default=None,
+                        help='JSON file of values for model features not in the flight table')
+    parser.add_argument('--candidates', type=int, default=41)
+    parser.add_argument('--max-change', type=float, default=0.10)
+    parser.add_argument('--min-ratio', type=float, default=0.7)
+    parser.add_argument('--max-ratio', type=float, default=1.3)
+    parser.add_argument('--elasticity', type=float, default=-1.5)
+    parser.add_argument('--competitor-sensitivity', type=float, default=4.0)
+    parser.add_argument('--changed-fraction', type=float, default=0.05,
+                        help='Fraction of flights changed for the incremental benchmark')
+    parser.add_argument('--output', type=str, default=None)
+    parser.add_argument('--seed', type=int, default=42)
+
+    args = parser.parse_args()
+
+    if args.scorer == 'tree':
+        model = TreeEnsemble.from_model_dir(args.model_dir)
+    else:
+        model = LocalModel(args.model_dir)
+
+    defaults = None
+    if args.defaults:
+        with open(args.defaults) as f:
+            defaults = json.load(f)
+
+    feature_store = None
+    if args.feature_store_dir:
+        from feature_store import OnlineFeatureStore
+        feature_store = OnlineFeatureStore(args.feature_store_dir)
+
+    if args.flights:
+        if args.flights.endswith('.csv'):
+            flights = pd.read_csv(args.flights, index_col='flight_id')
+        else:
+            flights = pd.read_parquet(args.flights).set_index('flight_id')
+    else:
+        random.seed(args.seed)
+        generator = FlightDataGenerator()
+        events = [generator.generate_search_event() for _ in range(args.num_searches)]
+        flights = flights_from_searches(events)
+    print(f"Pricing {len(flights):,} flights x {args.candidates} candidates")
+
+    optimizer = PriceOptimizer(
+        model,
+        num_candidates=args.candidates,
+        max_change=args.max_change,
+        min_ratio=args.min_ratio,
+        max_ratio=args.max_ratio,
+        elasticity=args.elasticity,
+        competitor_sensitivity=args.competitor_sensitivity,
+        feature_store=feature_store,
+        feature_defaults=defaults
+    )
+
+    start = time.perf_counter()
+    decisions, _ = optimizer.reoptimize(flights)
+    elapsed = time.perf_counter() - start
+    print(f"Full reprice: {elapsed:.2f}s ({len(flights) / elapsed:,.0f} flights/sec)")
+
+    # Incremental pass: competitors move on a fraction of the flights
+    rng = np.random.default_rng(args.seed)
+    changed = rng.random(len(flights)) < args.changed_fraction
+    updated = flights.copy()
+    updated.loc[changed, 'competitor_min_price'] *= rng.uniform(0.9, 1.1, changed.sum())
+
+    start = time.perf_counter()
+    decisions, num_changed = optimizer.reoptimize(updated)
+    elapsed = time.perf_counter() - start
+    print(f"Incremental reprice: {num_changed:,} changed flights in {elapsed:.2f}s")
+
+    print(f"\nMean change: {decisions['price_change_pct'].mean():+.2f}%, "
+          f"constrained: {decisions['constrained'].mean() * 100:.1f}%, "
+          f"expected revenue: {decisions['expected_revenue'].sum():,.0f}")
+
+    if args.output:
+        decisions.to_csv(args.output)
+        print(f"Price decisions written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
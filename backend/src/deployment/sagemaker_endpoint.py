@@ -8,26 +8,47 @@ Features:
 - Deploy model to SageMaker endpoint
 - Configure auto-scaling (2-10 instances)
 - Set up CloudWatch alarms
+- Low-overhead inference through a pooled sagemaker-runtime client
+- Micro-batching of concurrent single-row requests and an async API
+- Optional local inference server target (see local_server.py)
+- Optional binary request/response payloads (see payloads.py)
 - Test endpoint with sample predictions
 
 Author: Ratnesh ML Engineering Team
 Date: 2024-01-20
 """
 
+import asyncio
 import boto3
+import contextvars
 import sagemaker
+from botocore.config import Config
 from sagemaker.xgboost import XGBoostModel
-from sagemaker.predictor import Predictor
 from sagemaker.serializers import CSVSerializer
 from sagemaker.deserializers import JSONDeserializer
 import json
+import os
+import sys
+import threading
 import time
 
+from micro_batcher import MicroBatcher
+from payloads import (
+    CSV, JSON, align_rows, deserialize_predictions, feature_names_attribute,
+    serialize_rows
+)
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from instrumentation import current_trace_id, span
+
 
 class PricePredictionEndpoint:
     """Class to manage SageMaker endpoint deployment and inference"""
     
-    def __init__(self, model_data_s3_uri, role_arn, endpoint_name='price-prediction-endpoint'):
+    def __init__(self, model_data_s3_uri, role_arn, endpoint_name='price-prediction-endpoint',
+                 max_pool_connections=50, micro_batching=False, max_batch_size=64,
+                 max_wait_ms=2.0, local_endpoint_url=None, content_type=CSV,
+                 accept=JSON, feature_names=None, local_model_dir=None, runtime_client=None):
         """
         Initialize endpoint manager
         
@@ -35,17 +56,108 @@ class PricePredictionEndpoint:
             model_data_s3_uri: S3 URI of trained model artifacts (model.tar.gz)
             role_arn: IAM role ARN for SageMaker
             endpoint_name: Name for the endpoint
+            max_pool_connections: HTTP connection pool size of the runtime client
+            micro_batching: Coalesce concurrent single-row requests into
+                multi-row invocations
+            max_batch_size: Maximum rows per micro-batched invocation
+            max_wait_ms: Maximum time a request waits for its batch to fill
+            local_endpoint_url: URL of a local inference server (local_server.py)
+                to send predictions to instead of SageMaker, e.g.
+                'http://127.0.0.1:8080'. Deployment methods are unavailable.
+            content_type: Request payload format: 'text/csv', 'application/json',
+                'application/x-recordio-protobuf' (SageMaker XGBoost container
+                and local server) or 'application/x-npy' (local server only)
+            accept: Response payload format (same choices as content_type)
+            feature_names: Model feature order (feature_names.json). When set,
+                rows are checked/reordered against it and the order is
+                announced to the server via CustomAttributes.
+            local_model_dir: Directory with xgboost-model and feature_names.json
+                to score in-process (local_server.EmbeddedRuntimeClient) instead
+                of over HTTP. Deployment methods are unavailable.
+            runtime_client: Ready-made inference client with the sagemaker-runtime
+                `invoke_endpoint` signature (e.g. a shared EmbeddedRuntimeClient);
+                takes precedence over local_model_dir and local_endpoint_url
         """
         self.model_data_s3_uri = model_data_s3_uri
         self.role_arn = role_arn
         self.endpoint_name = endpoint_name
-        self.sagemaker_session = sagemaker.Session()
-        self.region = self.sagemaker_session.boto_region_name
+        self.local_endpoint_url = local_endpoint_url
+        self.local_model_dir = local_model_dir
+        
+        local = (runtime_client is not None or local_model_dir is not None
+                 or local_endpoint_url is not None)
+        if not local:
+            self.sagemaker_session = sagemaker.Session()
+            self.region = self.sagemaker_session.boto_region_name
+            
+            # Boto3 clients
+            self.sagemaker_client = boto3.client('sagemaker')
+            self.autoscaling_client = boto3.client('application-autoscaling')
+            self.cloudwatch_client = boto3.client('cloudwatch')
+        else:
+            # Local serving needs no AWS session or control-plane clients
+            self.sagemaker_session = None
+            self.region = None
         
-        # Boto3 clients
-        self.sagemaker_client = boto3.client('sagemaker')
-        self.autoscaling_client = boto3.client('application-autoscaling')
-        self.cloudwatch_client = boto3.client('cloudwatch')
+        # Inference client settings (client and batcher are created lazily and reused)
+        self.max_pool_connections = max_pool_connections
+        self.micro_batching = micro_batching
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.content_type = content_type
+        self.accept = accept
+        self.feature_names = feature_names
+        self._runtime_client = runtime_client
+        self._batcher = None
+        self._lock = threading.Lock()
+        
+        # Callables notified with the model URI after deploy_endpoint
+        # (e.g. PredictionCache.invalidate)
+        self.deploy_listeners = []
+    
+    @property
+    def runtime_client(self):
+        """Shared sagemaker-runtime client with a keep-alive connection pool"""
+        if self._runtime_client is None:
+            with self._lock:
+                if self._runtime_client is None:
+                    self._runtime_client = self._create_runtime_client()
+        return self._runtime_client
+    
+    def _create_runtime_client(self):
+        """Create the inference client (in-process model, local server or sagemaker-runtime)"""
+        if self.local_model_dir is not None:
+            # Imported here: local_server pulls in xgboost, which SageMaker clients do not need
+            from local_server import EmbeddedRuntimeClient
+            return EmbeddedRuntimeClient(self.local_model_dir, max_batch_size=self.max_batch_size,
+                                         max_wait_ms=self.max_wait_ms)
+        if self.local_endpoint_url is not None:
+            # Imported here: local_server pulls in xgboost, which SageMaker clients do not need
+            from local_server import LocalRuntimeClient
+            return LocalRuntimeClient(self.local_endpoint_url)
+        
+        config = Config(
+            max_pool_connections=self.max_pool_connections,
+            tcp_keepalive=True,
+            connect_timeout=2,
+            read_timeout=5,
+            retries={'max_attempts': 2, 'mode': 'standard'}
+        )
+        return boto3.client('sagemaker-runtime', region_name=self.region, config=config)
+    
+    @property
+    def batcher(self):
+        """Micro-batching queue in front of `invoke`"""
+        if self._batcher is None:
+            with self._lock:
+                if self._batcher is None:
+                    self._batcher = MicroBatcher(
+                        self.invoke,
+                        max_batch_size=self.max_batch_size,
+                        max_wait_ms=self.max_wait_ms,
+                        max_concurrent_batches=self.max_pool_connections
+                    )
+        return self._batcher
     
     def deploy_endpoint(self, instance_type='ml.m5.large', initial_instance_count=2):
         """
@@ -86,6 +198,10 @@ class PricePredictionEndpoint:
         )
         
         print(f"Endpoint deployed successfully: {self.endpoint_name}")
+        
+        for listener in self.deploy_listeners:
+            listener(self.model_data_s3_uri)
+        
         return predictor
     
     def configure_autoscaling(self, min_capacity=2, max_capacity=10, target_value=70.0):
@@ -186,26 +302,87 @@ class PricePredictionEndpoint:
         
         print("CloudWatch alarms created successfully!")
     
+    def invoke(self, rows):
+        """
+        Send one multi-row invocation to the endpoint
+        
+        Args:
+            rows: List of feature rows (lists or arrays of feature values),
+                or a DataFrame when `feature_names` is set
+        
+        Returns:
+            List of predicted prices, one per row
+        """
+        attributes = []
+        if self.feature_names is not None:
+            rows = align_rows(rows, self.feature_names)
+            attributes.append(feature_names_attribute(self.feature_names))
+        
+        # Carry the search's trace ID to the model container
+        trace_id = current_trace_id()
+        if trace_id:
+            attributes.append(f'trace_id={trace_id}')
+        request = {'CustomAttributes': ';'.join(attributes)} if attributes else {}
+        
+        with span('endpoint.invoke', rows=len(rows), content_type=self.content_type):
+            response = self.runtime_client.invoke_endpoint(
+                EndpointName=self.endpoint_name,
+                ContentType=self.content_type,
+                Accept=self.accept,
+                Body=serialize_rows(rows, self.content_type),
+                **request
+            )
+            
+            return deserialize_predictions(response['Body'].read(),
+                                           response.get('ContentType', self.accept))
+    
     def predict(self, features):
         """
         Make prediction using the endpoint
         
         Args:
-            features: List or array of feature values
+            features: List or array of feature rows
         
         Returns:
-            Predicted price
+            List of predicted prices, one per row
         """
-        predictor = Predictor(
-            endpoint_name=self.endpoint_name,
-            sagemaker_session=self.sagemaker_session,
-            serializer=CSVSerializer(),
-            deserializer=JSONDeserializer()
-        )
+        if self.micro_batching:
+            # Covers the wait for the batch; the invoke span runs on the batcher
+            with span('endpoint.predict_batched', rows=len(features)):
+                if self.feature_names is not None:
+                    features = align_rows(features, self.feature_names)
+                futures = self.batcher.submit_many(features)
+                return [future.result() for future in futures]
         
-        # Make prediction
-        result = predictor.predict(features)
-        return result
+        return self.invoke(features)
+    
+    async def predict_async(self, features):
+        """
+        Make prediction without blocking the event loop
+        
+        Args:
+            features: List or array of feature rows
+        
+        Returns:
+            List of predicted prices, one per row
+        """
+        if self.micro_batching:
+            if self.feature_names is not None:
+                features = align_rows(features, self.feature_names)
+            futures = self.batcher.submit_many(features)
+            return list(await asyncio.gather(*(asyncio.wrap_future(f) for f in futures)))
+        
+        loop = asyncio.get_running_loop()
+        # run_in_executor does not carry context variables: copy them so the
+        # caller's trace ID reaches invoke() on the executor thread
+        return await loop.run_in_executor(None, contextvars.copy_context().run,
+                                          self.invoke, features)
+    
+    def close(self):
+        """Flush pending micro-batches and release the batcher threads"""
+        if self._batcher is not None:
+            self._batcher.close()
+            self._batcher = None
     
     def delete_endpoint(self):
         """Delete the endpoint"""
@@ -256,6 +433,8 @@ def main():
     prediction = endpoint_manager.predict(sample_features)
     print(f"Sample prediction: ${prediction[0]:.2f}")
     
+    endpoint_manager.close()
+    
     print("\nDeployment completed successfully!")
     print(f"Endpoint name: {ENDPOINT_NAME}")
     print(f"Endpoint ARN: arn:aws:sagemaker:{endpoint_manager.region}:123456789012:endpoint/{ENDPOINT_NAME}")
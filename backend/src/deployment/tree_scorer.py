@@ -0,0 +1,429 @@
+"""
+Compiled Tree-Ensemble Scorer for Low-Latency Pricing
+
+For single-search scoring, building an xgb.DMatrix per request costs more
+than evaluating the trees themselves. This module exports a trained XGBoost
+booster into flat node arrays (feature index, threshold, children, missing
+direction, leaf value) and scores them with vectorized NumPy, or with C code
+generated from the trees and compiled on the fly when a C compiler exists.
+
+Features:
+- Exact export from the booster's JSON model (float32 thresholds and leaves)
+- Vectorized NumPy scorer matching booster.predict within float tolerance
+- Optional generated native scorer loaded with ctypes
+- .npz save/load of the array representation
+- p50/p99 latency benchmark against booster.predict
+
+Usage:
+    python tree_scorer.py --model-dir model/ --benchmark
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import argparse
+import ctypes
+import json
+import os
+import subprocess
+import tempfile
+import time
+
+import numpy as np
+import xgboost as xgb
+
+
+# Objectives whose prediction is the raw margin (identity link)
+IDENTITY_OBJECTIVES = ('reg:squarederror', 'reg:squaredlogerror', 'reg:absoluteerror',
+                       'reg:pseudohubererror', 'reg:quantileerror')
+
+# Objectives whose prediction is exp(margin) (log link)
+LOG_OBJECTIVES = ('reg:gamma', 'reg:tweedie', 'count:poisson')
+
+
+def _parse_base_score(value):
+    """Parse base_score, stored as '1.5E2' or (XGBoost >= 2) '[1.5E2]'"""
+    return float(value.strip('[]').split(',')[0])
+
+
+class TreeEnsemble:
+    """Flat array representation of a gbtree regression model"""
+
+    def __init__(self, feature, threshold, left, right, default_left, value,
+                 roots, base_margin, link, feature_names):
+        """
+        Args:
+            feature: int32 split feature per node (-1 for leaves)
+            threshold: float32 split threshold per node (go left if x < threshold)
+            left, right: int32 global child node indices (self for leaves)
+            default_left: bool, direction taken when the feature is missing
+            value: float32 leaf value per node (0 for internal nodes)
+            roots: int32 global index of each tree's root node
+            base_margin: Margin added to the sum of leaves
+            link: 'identity' or 'log'
+            feature_names: Feature names in model input order
+        """
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.default_left = default_left
+        self.value = value
+        self.roots = roots
+        self.base_margin = np.float32(base_margin)
+        self.link = link
+        self.feature_names = feature_names
+        self.max_depth = self._compute_max_depth()
+
+        # Traversal helpers: leaves read feature 0 (result unused) and the
+        # children are interleaved so one gather picks left or right
+        self._split_feature = np.maximum(feature, 0).astype(np.intp)
+        self._children = np.stack([left, right], axis=1).ravel()
+
+    @classmethod
+    def from_booster(cls, booster, feature_names=None):
+        """
+        Export a trained booster
+
+        Args:
+            booster: xgb.Booster trained with the gbtree booster
+            feature_names: Optional feature names (defaults to the booster's)
+
+        Returns:
+            TreeEnsemble
+        """
+        model = json.loads(booster.save_raw('json'))
+        learner = model['learner']
+
+        objective = learner['objective']['name']
+        if objective in IDENTITY_OBJECTIVES:
+            link = 'identity'
+        elif objective in LOG_OBJECTIVES:
+            link = 'log'
+        else:
+            raise ValueError(f"Unsupported objective for compiled scoring: {objective}")
+
+        booster_model = learner['gradient_booster']
+        if booster_model['name'] != 'gbtree':
+            raise ValueError(f"Unsupported booster type: {booster_model['name']}")
+
+        base_score = _parse_base_score(learner['learner_model_param']['base_score'])
+        base_margin = np.log(base_score) if link == 'log' else base_score
+
+        features, thresholds, lefts, rights, defaults, values, roots = [], [], [], [], [], [], []
+        offset = 0
+        for tree in booster_model['model']['trees']:
+            if any(tree['split_type']):
+                raise ValueError("Categorical splits are not supported")
+
+            left = np.asarray(tree['left_children'], dtype=np.int32)
+            right = np.asarray(tree['right_children'], dtype=np.int32)
+            conditions = np.asarray(tree['split_conditions'], dtype=np.float32)
+            is_leaf = left == -1
+            node_ids = np.arange(len(left), dtype=np.int32) + offset
+
+            # Leaves point at themselves so traversal can run a fixed number of steps
+            features.append(np.where(is_leaf, -1, tree['split_indices']).astype(np.int32))
+            thresholds.append(np.where(is_leaf, 0, conditions).astype(np.float32))
+            lefts.append(np.where(is_leaf, node_ids, left + offset).astype(np.int32))
+            rights.append(np.where(is_leaf, node_ids, right + offset).astype(np.int32))
+            defaults.append(np.asarray(tree['default_left'], dtype=bool))
+            values.append(np.where(is_leaf, conditions, 0).astype(np.float32))
+            roots.append(offset)
+            offset += len(left)
+
+        return cls(
+            feature=np.concatenate(features),
+            threshold=np.concatenate(thresholds),
+            left=np.concatenate(lefts),
+            right=np.concatenate(rights),
+            default_left=np.concatenate(defaults),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.int32),
+            base_margin=base_margin,
+            link=link,
+            feature_names=feature_names or learner.get('feature_names') or []
+        )
+
+    @classmethod
+    def from_model_dir(cls, model_dir):
+        """Export the model written by train_xgboost.save_model"""
+        booster = xgb.Booster()
+        booster.load_model(os.path.join(model_dir, 'xgboost-model'))
+        with open(os.path.join(model_dir, 'feature_names.json')) as f:
+            feature_names = json.load(f)
+        return cls.from_booster(booster, feature_names)
+
+    def _compute_max_depth(self):
+        """Number of traversal steps needed to reach every leaf"""
+        depth = 0
+        nodes = self.roots
+        while True:
+            internal = nodes[self.feature[nodes] >= 0]
+            if len(internal) == 0:
+                return depth
+            nodes = np.concatenate([self.left[internal], self.right[internal]])
+            depth += 1
+
+    @property
+    def num_trees(self):
+        return len(self.roots)
+
+    @property
+    def num_nodes(self):
+        return len(self.feature)
+
+    def predict(self, X):
+        """
+        Score feature rows with vectorized NumPy traversal
+
+        Args:
+            X: Array of shape (n_rows, n_features) or a single row
+
+        Returns:
+            float32 array of predictions
+        """
+        X = np.asarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+
+        num_rows, num_features = X.shape
+        if self.feature_names and num_features != len(self.feature_names):
+            raise ValueError(f"Expected {len(self.feature_names)} features, got {num_features}")
+        X_flat = np.ascontiguousarray(X).ravel()
+
+        # One flat (row, tree) cursor array; each step advances every tree one
+        # level, and leaves loop onto themselves
+        nodes = np.tile(self.roots, num_rows)
+        row_offsets = np.repeat(np.arange(num_rows) * num_features, self.num_trees)
+
+        for _ in range(self.max_depth):
+            x = X_flat[row_offsets + self._split_feature[nodes]]
+            # NaN compares False, so missing values only go left by default
+            go_left = (x < self.threshold[nodes]) | (np.isnan(x) & self.default_left[nodes])
+            nodes = self._children[2 * nodes + (~go_left)]
+
+        nodes = nodes.reshape(num_rows, self.num_trees)
+        margin = self.value[nodes].sum(axis=1, dtype=np.float32) + self.base_margin
+        return np.exp(margin) if self.link == 'log' else margin
+
+    def save(self, path):
+        """Save the array representation to a .npz file"""
+        np.savez(
+            path,
+            feature=self.feature, threshold=self.threshold, left=self.left,
+            right=self.right, default_left=self.default_left, value=self.value,
+            roots=self.roots, base_margin=self.base_margin,
+            link=np.array(self.link), feature_names=np.array(self.feature_names)
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load an ensemble saved with `save`"""
+        with np.load(path) as data:
+            return cls(
+                feature=data['feature'], threshold=data['threshold'],
+                left=data['left'], right=data['right'],
+                default_left=data['default_left'], value=data['value'],
+                roots=data['roots'], base_margin=float(data['base_margin']),
+                link=str(data['link']), feature_names=data['feature_names'].tolist()
+            )
+
+    def generate_c_source(self):
+        """
+        Generate C source with one nested if/else function per tree
+
+        The exported `predict_batch(X, n_rows, n_features, out)` writes the
+        margin for each row; the link function is applied in Python.
+        """
+        lines = ['#include <math.h>', '']
+
+        def emit(node, indent):
+            pad = '    ' * indent
+            if self.feature[node] < 0:
+                lines.append(f'{pad}return {float(self.value[node]):.9g}f;')
+                return
+            feature = int(self.feature[node])
+            threshold = f'{float(self.threshold[node]):.9g}f'
+            missing = '1' if self.default_left[node] else '0'
+            lines.append(f'{pad}if (isnan(x[{feature}]) ? {missing} : x[{feature}] < {threshold}) {{')
+            emit(self.left[node], indent + 1)
+            lines.append(f'{pad}}} else {{')
+            emit(self.right[node], indent + 1)
+            lines.append(f'{pad}}}')
+
+        for i, root in enumerate(self.roots):
+            lines.append(f'static float tree_{i}(const float* x) {{')
+            emit(root, 1)
+            lines.append('}')
+            lines.append('')
+
+        lines.append('void predict_batch(const float* X, long n_rows, long n_features, float* out) {')
+        lines.append('    for (long r = 0; r < n_rows; r++) {')
+        lines.append('        const float* x = X + r * n_features;')
+        lines.append(f'        float margin = {float(self.base_margin):.9g}f;')
+        for i in range(self.num_trees):
+            lines.append(f'        margin += tree_{i}(x);')
+        lines.append('        out[r] = margin;')
+        lines.append('    }')
+        lines.append('}')
+        return '\n'.join(lines) + '\n'
+
+    def compile_native(self, build_dir=None, compiler='cc'):
+        """
+        Compile the generated C source into a shared library
+
+        Args:
+            build_dir: Directory for the source and library (temporary if None)
+            compiler: C compiler executable
+
+        Returns:
+            NativeScorer, or None if no C compiler is available
+        """
+        build_dir = build_dir or tempfile.mkdtemp(prefix='tree_scorer_')
+        source_path = os.path.join(build_dir, 'tree_scorer.c')
+        library_path = os.path.join(build_dir, 'tree_scorer.so')
+
+        with open(source_path, 'w') as f:
+            f.write(self.generate_c_source())
+
+        try:
+            subprocess.run(
+                [compiler, '-O2', '-shared', '-fPIC', '-o', library_path, source_path, '-lm'],
+                check=True, capture_output=True
+            )
+        except (OSError, subprocess.CalledProcessError) as e:
+            print(f"Native compilation unavailable: {e}")
+            return None
+
+        return NativeScorer(library_path, len(self.feature_names), self.link)
+
+
+class NativeScorer:
+    """Scorer backed by the shared library built by TreeEnsemble.compile_native"""
+
+    def __init__(self, library_path, num_features, link='identity'):
+        self.library = ctypes.CDLL(library_path)
+        self.library.predict_batch.restype = None
+        self.library.predict_batch.argtypes = [
+            ctypes.c_void_p, ctypes.c_long, ctypes.c_long, ctypes.c_void_p
+        ]
+        self.num_features = num_features
+        self.link = link
+
+    def predict(self, X):
+        """Score feature rows; same contract as TreeEnsemble.predict"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if X.ndim == 1:
+            X = X.reshape(1, -1)
+        if X.shape[1] != self.num_features:
+            raise ValueError(f"Expected {self.num_features} features, got {X.shape[1]}")
+
+        out = np.empty(X.shape[0], dtype=np.float32)
+        self.library.predict_batch(X.ctypes.data, X.shape[0], X.shape[1], out.ctypes.data)
+        return np.exp(out) if self.link == 'log' else out
+
+
+def _latency_percentiles(fn, X, repeats):
+    """Return (p50, p99) latency in microseconds of fn(X)"""
+    fn(X)  # warm up
+    timings = np.empty(repeats)
+    for i in range(repeats):
+        start = time.perf_counter()
+        fn(X)
+        timings[i] = time.perf_counter() - start
+    return np.percentile(timings, 50) * 1e6, np.percentile(timings, 99) * 1e6
+
+
+def benchmark(booster, ensemble, native=None, batch_sizes=(1, 8, 64, 1024), repeats=1000,
+              seed=42):
+    """
+    Benchmark scorers against booster.predict on random feature rows
+
+    Args:
+        booster: Original xgb.Booster
+        ensemble: Exported TreeEnsemble
+        native: Optional NativeScorer
+        batch_sizes: Batch sizes to measure
+        repeats: Timed calls per scorer and batch size
+
+    Returns:
+        List of result dicts (scorer, batch_size, p50_us, p99_us, max_abs_diff)
+    """
+    rng = np.random.default_rng(seed)
+    num_features = len(ensemble.feature_names) or booster.num_features()
+    feature_names = ensemble.feature_names or None
+
+    scorers = {
+        'xgboost': lambda X: booster.predict(xgb.DMatrix(X, feature_names=feature_names)),
+        'numpy': ensemble.predict
+    }
+    if native is not None:
+        scorers['native'] = native.predict
+
+    results = []
+    for batch_size in batch_sizes:
+        X = rng.normal(size=(batch_size, num_features)).astype(np.float32)
+        expected = scorers['xgboost'](X)
+
+        for name, fn in scorers.items():
+            p50, p99 = _latency_percentiles(fn, X, repeats)
+            results.append({
+                'scorer': name,
+                'batch_size': batch_size,
+                'p50_us': round(p50, 2),
+                'p99_us': round(p99, 2),
+                'max_abs_diff': float(np.max(np.abs(fn(X) - expected)))
+            })
+
+    return results
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Export and benchmark the compiled tree scorer')
+    parser.add_argument('--model-dir', type=str, required=True,
+                        help='Directory with xgboost-model and feature_names.json')
+    parser.add_argument('--output', type=str, default=None,
+                        help='Path for the exported .npz ensemble')
+    parser.add_argument('--native', action='store_true',
+                        help='Also build the generated C scorer')
+    parser.add_argument('--benchmark', action='store_true',
+                        help='Measure p50/p99 latency against booster.predict')
+    parser.add_argument('--repeats', type=int, default=1000)
+    parser.add_argument('--results', type=str, default=None,
+                        help='Write benchmark results as JSON to this path')
+
+    args = parser.parse_args()
+
+    booster = xgb.Booster()
+    booster.load_model(os.path.join(args.model_dir, 'xgboost-model'))
+    with open(os.path.join(args.model_dir, 'feature_names.json')) as f:
+        feature_names = json.load(f)
+
+    ensemble = TreeEnsemble.from_booster(booster, feature_names)
+    print(f"Exported {ensemble.num_trees} trees, {ensemble.num_nodes} nodes, "
+          f"max depth {ensemble.max_depth}")
+
+    output = args.output or os.path.join(args.model_dir, 'tree_ensemble.npz')
+    ensemble.save(output)
+    print(f"Saved ensemble to {output}")
+
+    native = ensemble.compile_native() if args.native else None
+
+    if args.benchmark:
+        results = benchmark(booster, ensemble, native, repeats=args.repeats)
+
+        print(f"\n{'scorer':<10}{'batch':>8}{'p50 (us)':>12}{'p99 (us)':>12}{'max diff':>12}")
+        for r in results:
+            print(f"{r['scorer']:<10}{r['batch_size']:>8}{r['p50_us']:>12.1f}"
+                  f"{r['p99_us']:>12.1f}{r['max_abs_diff']:>12.2e}")
+
+        if args.results:
+            with open(args.results, 'w') as f:
+                json.dump(results, f, indent=2)
+            print(f"\nBenchmark results written to {args.results}")
+
+
+if __name__ == '__main__':
+    main()
@@ -16,12 +16,17 @@ Date: 2024-01-20
 
 import boto3
 import json
+import os
 import random
+import sys
 import time
 from datetime import datetime, timedelta
 from typing import Dict, List
 import argparse
 
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from instrumentation import increment, span, trace
+
 
 class FlightDataGenerator:
     """Generate realistic flight search data"""
@@ -137,12 +142,14 @@ class KinesisProducer:
         # Use search_id as partition key for even distribution
         partition_key = data['search_id']
         
-        # Send to Kinesis
-        response = self.kinesis_client.put_record(
-            StreamName=self.stream_name,
-            Data=data_json,
-            PartitionKey=partition_key
-        )
+        # Send to Kinesis; the search_id is the trace ID for downstream stages
+        with trace(partition_key), span('kinesis.put_record', stream=self.stream_name) as put_span:
+            response = self.kinesis_client.put_record(
+                StreamName=self.stream_name,
+                Data=data_json,
+                PartitionKey=partition_key
+            )
+            put_span.set(shard_id=response['ShardId'], bytes=len(data_json))
         
         return response
     
@@ -169,6 +176,7 @@ class KinesisProducer:
                 response = self.send_record(event)
                 
                 success_count += 1
+                increment('kinesis.records_sent')
                 
                 if (i + 1) % 10 == 0:
                     print(f"Sent {i + 1}/{num_records} records (Success: {success_count}, Errors: {error_count})")
@@ -178,6 +186,7 @@ class KinesisProducer:
                 
             except Exception as e:
                 error_count += 1
+                increment('kinesis.send_errors')
                 print(f"Error sending record {i + 1}: {str(e)}")
         
         print(f"\nStreaming completed!")
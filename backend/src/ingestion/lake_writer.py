@@ -0,0 +1,461 @@
+"""
+Raw-to-Lake Micro-Batch Writer
+
+Local stand-in for Kinesis Firehose: consumes flight search events and
+writes them to the raw zone of the data lake in the layout the S3 trigger
+Lambda expects,
+
+    raw/year=YYYY/month=MM/day=DD/hour=HH/<stream>-<time>-<id>.json.gz
+
+and emits the S3 ObjectCreated notifications that lambda_trigger consumes,
+so ingestion-to-lake throughput can be tuned and tested offline.
+
+Features:
+- Sources: FlightDataGenerator, the file-backed stream stand-in, or a Kinesis
+  stream (optionally via --endpoint-url: moto server, LocalStack)
+- Newline-delimited JSON buffered per hour partition (arrival time like
+  Firehose, or event time)
+- Flush by buffer size or buffer age, whichever comes first
+- gzip (or zstd) compression and uploads on a pool of threads; zlib releases
+  the GIL, so compression runs in parallel with reading
+- Bounded in-flight batches (back pressure instead of unbounded memory)
+- Local directory or S3 as the destination; notifications appended as
+  JSON lines (one S3 event per object)
+
+Usage:
+    python lake_writer.py --generate 100000 --lake-dir lake/ \\
+        --notifications lake/notifications.jsonl
+
+    python lake_writer.py --stream-dir stream/ --lake-dir lake/ \\
+        --buffer-mb 64 --buffer-seconds 60 --compression-threads 4
+
+Author: Ratnesh Data Engineering Team
+Date: 2024-01-20
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+import uuid
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+import boto3
+
+from kinesis_producer import FlightDataGenerator
+from stream_consumer import FileShardReader, KinesisShardReader, event_time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from instrumentation import increment, span
+
+
+RAW_PREFIX = 'raw'
+
+EXTENSIONS = {'gzip': '.json.gz', 'zstd': '.json.zst'}
+
+
+def partition_prefix(timestamp, prefix=RAW_PREFIX):
+    """Hour partition for a Unix timestamp: raw/year=YYYY/month=MM/day=DD/hour=HH"""
+    t = datetime.fromtimestamp(timestamp, tz=timezone.utc)
+    return f'{prefix}/year={t.year:04d}/month={t.month:02d}/day={t.day:02d}/hour={t.hour:02d}'
+
+
+def make_compressor(compression, level=None):
+    """
+    Compression function for one batch
+
+    Args:
+        compression: 'gzip' or 'zstd' (requires the zstandard package)
+        level: Compression level (default: 6 for gzip, 3 for zstd)
+
+    Returns:
+        Callable taking bytes and returning compressed bytes
+    """
+    if compression == 'gzip':
+        level = 6 if level is None else level
+
+        def compress(data):
+            # wbits=31: gzip container, readable by gzip / Spark / Athena
+            compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+            return compressor.compress(data) + compressor.flush()
+        return compress
+
+    if compression == 'zstd':
+        # Imported here: only needed when zstd output is requested
+        import zstandard
+
+        level = 3 if level is None else level
+        local = threading.local()
+
+        def compress(data):
+            # ZstdCompressor objects are not thread-safe: one per thread
+            if not hasattr(local, 'compressor'):
+                local.compressor = zstandard.ZstdCompressor(level=level)
+            return local.compressor.compress(data)
+        return compress
+
+    raise ValueError(f"Unsupported compression: {compression}")
+
+
+class LocalObjectStore:
+    """Directory standing in for the data lake bucket"""
+
+    def __init__(self, root, bucket='airline-data-lake'):
+        self.root = root
+        self.bucket = bucket
+
+    def put(self, key, data):
+        """Write an object atomically (readers never see partial objects)"""
+        path = os.path.join(self.root, key)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # Leading dot: Spark and Glue skip hidden files while the write is in progress
+        tmp_path = os.path.join(directory, '.' + os.path.basename(path) + '.tmp')
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+class S3ObjectStore:
+    """Data lake bucket on S3 (or an S3-compatible endpoint)"""
+
+    def __init__(self, bucket, region_name='us-east-1', endpoint_url=None):
+        self.bucket = bucket
+        # boto3 clients are thread-safe; one is shared by all upload threads
+        self.client = boto3.client('s3', region_name=region_name, endpoint_url=endpoint_url)
+
+    def put(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=key, Body=data)
+
+
+class NotificationLog:
+    """S3 ObjectCreated:Put events, one JSON line per object, in the Lambda's event format"""
+
+    def __init__(self, path, region_name='us-east-1'):
+        self.path = path
+        self.region_name = region_name
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def s3_event(self, bucket, key, size, etag):
+        """S3 event notification for one new object"""
+        return {
+            'Records': [{
+                'eventVersion': '2.1',
+                'eventSource': 'aws:s3',
+                'awsRegion': self.region_name,
+                'eventTime': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%S.%f')[:-3] + 'Z',
+                'eventName': 'ObjectCreated:Put',
+                's3': {
+                    's3SchemaVersion': '1.0',
+                    'bucket': {'name': bucket, 'arn': f'arn:aws:s3:::{bucket}'},
+                    'object': {'key': key, 'size': size, 'eTag': etag}
+                }
+            }]
+        }
+
+    def __call__(self, bucket, key, size, etag):
+        line = json.dumps(self.s3_event(bucket, key, size, etag)) + '\n'
+        with self._lock:
+            with open(self.path, 'a') as f:
+                f.write(line)
+
+
+class PartitionBuffer:
+    """Pending records of one hour partition"""
+
+    __slots__ = ('records', 'size', 'created')
+
+    def __init__(self):
+        self.records = []
+        self.size = 0
+        self.created = time.monotonic()
+
+
+class LakeWriter:
+    """Buffer events per hour partition and write compressed objects in parallel"""
+
+    def __init__(self, store, notify=None, stream_name='airline-flight-searches',
+                 prefix=RAW_PREFIX, buffer_bytes=64 * 1024 * 1024, buffer_seconds=60.0,
+                 compression='gzip', compression_level=None, compression_threads=4,
+                 max_pending=None, partition_by='arrival'):
+        """
+        Initialize lake writer
+
+        Args:
+            store: LocalObjectStore or S3ObjectStore
+            notify: Callable(bucket, key, size, etag) run after each object is
+                written, e.g. a NotificationLog
+            stream_name: Object name prefix (Firehose names objects after the stream)
+            prefix: Raw zone prefix (lambda_trigger only handles keys under raw/)
+            buffer_bytes: Flush a partition once it holds this many uncompressed bytes
+            buffer_seconds: Flush a partition once its oldest record is this old
+            compression: 'gzip' or 'zstd'
+            compression_level: Codec-specific level (None for the codec default)
+            compression_threads: Threads compressing and writing batches
+            max_pending: Batches queued or in flight before add() blocks
+                (default: 2 per thread)
+            partition_by: 'arrival' (Firehose behaviour, no parsing) or 'event'
+                (the event's timestamp field)
+        """
+        self.store = store
+        self.notify = notify
+        self.stream_name = stream_name
+        self.prefix = prefix
+        self.buffer_bytes = buffer_bytes
+        self.buffer_seconds = buffer_seconds
+        self.extension = EXTENSIONS[compression]
+        self.partition_by = partition_by
+
+        self._compress = make_compressor(compression, compression_level)
+        self._executor = ThreadPoolExecutor(max_workers=compression_threads,
+                                            thread_name_prefix='lake-writer')
+        self._slots = threading.BoundedSemaphore(max_pending or 2 * compression_threads)
+        self._pending = set()
+        self._errors = []
+        self._lock = threading.Lock()
+
+        self.buffers = {}
+        self.counters = {'events': 0, 'objects': 0, 'raw_bytes': 0, 'compressed_bytes': 0,
+                         'size_flushes': 0, 'age_flushes': 0}
+        self.compress_seconds = 0.0
+
+    def add(self, record, timestamp=None):
+        """
+        Buffer one event
+
+        Args:
+            record: JSON-encoded event (bytes, with or without trailing newline)
+            timestamp: Unix timestamp that picks the partition (default: now,
+                or the event's own timestamp with partition_by='event')
+        """
+        if not record.endswith(b'\n'):
+            record += b'\n'
+        if timestamp is None:
+            timestamp = event_time(json.loads(record)) if self.partition_by == 'event' else time.time()
+
+        partition = partition_prefix(timestamp, self.prefix)
+        buffer = self.buffers.get(partition)
+        if buffer is None:
+            buffer = self.buffers[partition] = PartitionBuffer()
+        buffer.records.append(record)
+        buffer.size += len(record)
+        self.counters['events'] += 1
+
+        if buffer.size >= self.buffer_bytes:
+            self.counters['size_flushes'] += 1
+            self._flush(partition)
+
+    def add_event(self, event):
+        """Buffer one event dict (generator source)"""
+        timestamp = event_time(event) if self.partition_by == 'event' else None
+        self.add(json.dumps(event).encode('utf-8'), timestamp)
+
+    def flush_expired(self):
+        """Flush partitions whose oldest record exceeded buffer_seconds"""
+        deadline = time.monotonic() - self.buffer_seconds
+        for partition in [p for p, b in self.buffers.items() if b.created <= deadline]:
+            self.counters['age_flushes'] += 1
+            self._flush(partition)
+        self._raise_errors()
+
+    def flush_all(self):
+        """Flush every partition and wait until all objects are written"""
+        for partition in list(self.buffers):
+            self._flush(partition)
+        for future in list(self._pending):
+            future.result()
+        self._raise_errors()
+
+    def close(self):
+        """Flush everything and stop the compression threads"""
+        try:
+            self.flush_all()
+        finally:
+            self._executor.shutdown(wait=True)
+
+    def _flush(self, partition):
+        """Hand a partition's records to a compression thread"""
+        buffer = self.buffers.pop(partition)
+        # Blocks while max_pending batches are queued: back pressure on the source
+        self._slots.acquire()
+        future = self._executor.submit(self._write_object, partition, buffer.records, buffer.size)
+        with self._lock:
+            self._pending.add(future)
+        future.add_done_callback(self._batch_done)
+
+    def _batch_done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+            if future.exception() is not None:
+                self._errors.append(future.exception())
+        self._slots.release()
+
+    def _raise_errors(self):
+        with self._lock:
+            if self._errors:
+                raise self._errors[0]
+
+    def _write_object(self, partition, records, raw_size):
+        """Compress one batch, write it and notify (runs on a pool thread)"""
+        created = datetime.now(timezone.utc).strftime('%Y-%m-%d-%H-%M-%S')
+        key = f'{partition}/{self.stream_name}-{created}-{uuid.uuid4().hex[:12]}{self.extension}'
+
+        with span('lake.write_object', partition=partition, records=len(records)) as write_span:
+            start = time.perf_counter()
+            data = self._compress(b''.join(records))
+            compress_seconds = time.perf_counter() - start
+
+            self.store.put(key, data)
+            write_span.set(raw_bytes=raw_size, compressed_bytes=len(data))
+
+        if self.notify is not None:
+            self.notify(self.store.bucket, key, len(data), hashlib.md5(data).hexdigest())
+
+        increment('lake.objects_written')
+        with self._lock:
+            self.counters['objects'] += 1
+            self.counters['raw_bytes'] += raw_size
+            self.counters['compressed_bytes'] += len(data)
+            self.compress_seconds += compress_seconds
+        return key
+
+    def report(self, elapsed_seconds):
+        """Throughput summary"""
+        with self._lock:
+            report = dict(self.counters)
+            report['compress_seconds'] = self.compress_seconds
+
+        report['elapsed_seconds'] = elapsed_seconds
+        report['events_per_sec'] = report['events'] / elapsed_seconds if elapsed_seconds else 0.0
+        report['raw_mb_per_sec'] = report['raw_bytes'] / 1e6 / elapsed_seconds if elapsed_seconds else 0.0
+        report['compression_ratio'] = (report['raw_bytes'] / report['compressed_bytes']
+                                       if report['compressed_bytes'] else 0.0)
+        return report
+
+
+def write_generated(writer, num_records, check_every=1000):
+    """Feed FlightDataGenerator events into the writer"""
+    generator = FlightDataGenerator()
+    for i in range(num_records):
+        writer.add_event(generator.generate_search_event())
+        if i % check_every == 0:
+            writer.flush_expired()
+
+
+def write_stream(writer, readers, batch_size=1000):
+    """
+    Feed records from stream shard readers into the writer (round robin)
+
+    Args:
+        writer: LakeWriter
+        readers: FileShardReader or KinesisShardReader instances
+        batch_size: Records per read call
+    """
+    for reader in readers:
+        reader.open()
+
+    active = list(readers)
+    while active:
+        idle = True
+        for reader in list(active):
+            records, finished = reader.read(batch_size)
+            for _, data in records:
+                writer.add(data)
+            idle = idle and not records
+            if finished:
+                active.remove(reader)
+
+        writer.flush_expired()
+        if idle and active:
+            time.sleep(min(reader.IDLE_SLEEP_SECONDS for reader in active))
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Write flight search events to the raw data lake')
+    parser.add_argument('--generate', type=int, default=0,
+                        help='Write this many FlightDataGenerator events')
+    parser.add_argument('--stream-dir', type=str, default=None,
+                        help='File-backed stream directory (see stream_consumer.py)')
+    parser.add_argument('--stream-name', type=str, default='airline-flight-searches',
+                        help='Kinesis stream (with --from-kinesis); also names the objects')
+    parser.add_argument('--from-kinesis', action='store_true')
+    parser.add_argument('--region', type=str, default='us-east-1')
+    parser.add_argument('--endpoint-url', type=str, default=None,
+                        help='Alternative Kinesis / S3 endpoint (moto server, LocalStack)')
+    parser.add_argument('--follow', action='store_true',
+                        help='Keep reading at the tip of each shard')
+    parser.add_argument('--lake-dir', type=str, default=None,
+                        help='Local directory standing in for the bucket')
+    parser.add_argument('--bucket', type=str, default='airline-data-lake')
+    parser.add_argument('--s3', action='store_true',
+                        help='Upload to --bucket instead of writing to --lake-dir')
+    parser.add_argument('--notifications', type=str, default=None,
+                        help='Append S3 event notifications (JSON lines) to this file')
+    parser.add_argument('--buffer-mb', type=float, default=64.0)
+    parser.add_argument('--buffer-seconds', type=float, default=60.0)
+    parser.add_argument('--compression', choices=list(EXTENSIONS), default='gzip')
+    parser.add_argument('--compression-level', type=int, default=None)
+    parser.add_argument('--compression-threads', type=int, default=4)
+    parser.add_argument('--partition-by', choices=['arrival', 'event'], default='arrival')
+
+    args = parser.parse_args()
+
+    if args.s3:
+        store = S3ObjectStore(args.bucket, args.region, args.endpoint_url)
+    elif args.lake_dir:
+        store = LocalObjectStore(args.lake_dir, args.bucket)
+    else:
+        parser.error('one of --lake-dir or --s3 is required')
+
+    writer = LakeWriter(
+        store,
+        notify=NotificationLog(args.notifications, args.region) if args.notifications else None,
+        stream_name=args.stream_name,
+        buffer_bytes=int(args.buffer_mb * 1024 * 1024),
+        buffer_seconds=args.buffer_seconds,
+        compression=args.compression,
+        compression_level=args.compression_level,
+        compression_threads=args.compression_threads,
+        partition_by=args.partition_by
+    )
+
+    start = time.perf_counter()
+    try:
+        if args.generate:
+            write_generated(writer, args.generate)
+        elif args.stream_dir:
+            write_stream(writer, [FileShardReader(args.stream_dir, shard_id, follow=args.follow)
+                                  for shard_id in FileShardReader.list_shards(args.stream_dir)])
+        elif args.from_kinesis:
+            shard_ids = KinesisShardReader.list_shards(args.stream_name, args.region,
+                                                       args.endpoint_url)
+            write_stream(writer, [KinesisShardReader(args.stream_name, shard_id, args.region,
+                                                     args.endpoint_url, follow=args.follow)
+                                  for shard_id in shard_ids])
+        else:
+            parser.error('one of --generate, --stream-dir or --from-kinesis is required')
+    except KeyboardInterrupt:
+        print("Interrupted, flushing buffered events")
+    finally:
+        writer.close()
+
+    report = writer.report(time.perf_counter() - start)
+    print(f"\nWrote {report['events']} events in {report['objects']} objects "
+          f"({report['size_flushes']} size / {report['age_flushes']} age flushes)")
+    print(f"Throughput: {report['events_per_sec']:.0f} events/sec, "
+          f"{report['raw_mb_per_sec']:.1f} MB/sec uncompressed")
+    print(f"Compression: {report['compression_ratio']:.1f}x, "
+          f"{report['compress_seconds']:.2f}s on {args.compression_threads} threads")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,670 @@
+"""
+Kinesis Stream Consumer with Sliding-Window Route Statistics
+
+Consumes flight search events from every shard of the Kinesis stream and
+keeps per-route statistics over a sliding event-time window, so route
+features track demand within seconds instead of waiting for the next Glue
+run.
+
+Features:
+- One worker process per shard (per-shard reads, state and checkpoints)
+- Sliding window of fixed-size time buckets: constant work per event
+- Per-route search count, offer count, mean / variance (Welford) and
+  minimum offer price; buckets and shards are combined with Chan's
+  parallel-variance merge
+- Per-shard checkpoints (sequence number + window state) for restart
+- Periodic publishing to a JSON file and, optionally, to an online feature
+  store as stream_<statistic>_<window> features (kept apart from the batch
+  route_* features the model was trained on)
+- File-backed stream stand-in (one JSON-lines file per shard) for local runs;
+  the Kinesis reader also accepts an endpoint URL (moto server, LocalStack)
+- Throughput reported as events/sec per core
+
+Usage:
+    python stream_consumer.py --stream-name airline-flight-searches \\
+        --checkpoint-dir checkpoints/ --output route_stats.json
+
+    python stream_consumer.py --stream-dir stream/ --generate 100000 --shards 4
+
+Author: Ratnesh Data Engineering Team
+Date: 2024-01-20
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import multiprocessing
+import os
+import queue
+import sys
+import time
+from datetime import datetime, timezone
+
+import boto3
+import pandas as pd
+
+from kinesis_producer import FlightDataGenerator
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'deployment'))
+from feature_store import prune_snapshots, write_snapshot
+
+
+# Per-route accumulator layout: [searches, offers, mean, m2, min_price]
+SEARCHES, OFFERS, MEAN, M2, MIN_PRICE = range(5)
+
+# Published per-route statistics
+STAT_COLUMNS = ['search_count', 'offer_count', 'avg_price', 'price_volatility', 'min_price']
+
+
+def stream_feature_names(window_seconds):
+    """
+    Feature store column per statistic, e.g. offer_count -> stream_offer_count_15m
+
+    Windowed statistics get their own names: the model's route_* features are
+    computed over the full curated history and must not be overwritten.
+    """
+    if window_seconds % 3600 == 0:
+        label = f'{window_seconds // 3600}h'
+    elif window_seconds % 60 == 0:
+        label = f'{window_seconds // 60}m'
+    else:
+        label = f'{window_seconds}s'
+    return {column: f'stream_{column}_{label}' for column in STAT_COLUMNS}
+
+
+def merge_stats(target, other):
+    """
+    Merge route accumulator `other` into `target` in place (Chan et al.)
+
+    Args:
+        target: Accumulator list, updated in place
+        other: Accumulator list
+    """
+    n_a, n_b = target[OFFERS], other[OFFERS]
+    target[SEARCHES] += other[SEARCHES]
+    if n_b == 0:
+        return
+    n = n_a + n_b
+    delta = other[MEAN] - target[MEAN]
+    target[MEAN] += delta * n_b / n
+    target[M2] += other[M2] + delta * delta * n_a * n_b / n
+    target[OFFERS] = n
+    target[MIN_PRICE] = min(target[MIN_PRICE], other[MIN_PRICE])
+
+
+def merge_summaries(summaries):
+    """Combine per-shard route summaries into one"""
+    merged = {}
+    for summary in summaries:
+        for route, stats in summary.items():
+            if route in merged:
+                merge_stats(merged[route], stats)
+            else:
+                merged[route] = list(stats)
+    return merged
+
+
+def event_time(event):
+    """Event timestamp in epoch seconds (producer writes ISO-8601 UTC with 'Z')"""
+    timestamp = event.get('timestamp')
+    if not timestamp:
+        return time.time()
+    return datetime.fromisoformat(timestamp.rstrip('Z')).replace(tzinfo=timezone.utc).timestamp()
+
+
+class RouteWindow:
+    """
+    Sliding event-time window of per-route statistics
+
+    The window is a ring of `window_seconds / bucket_seconds` buckets. An
+    event only touches the accumulator of its route in its bucket; expired
+    buckets are dropped whole when their ring slot is reused, and the window
+    is combined across buckets only when a summary is requested.
+    """
+
+    def __init__(self, window_seconds=900, bucket_seconds=15):
+        """
+        Args:
+            window_seconds: Window length
+            bucket_seconds: Bucket width (expiry granularity)
+        """
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.num_buckets = max(int(math.ceil(window_seconds / bucket_seconds)), 1)
+        self.bucket_ids = [None] * self.num_buckets
+        self.buckets = [None] * self.num_buckets
+        self.latest_bucket = None
+        self.late_events = 0
+
+    def add_event(self, event):
+        """
+        Add one search event
+
+        Args:
+            event: Search event as produced by FlightDataGenerator
+
+        Returns:
+            False if the event was older than the window and dropped
+        """
+        bucket_id = int(event_time(event) // self.bucket_seconds)
+
+        if self.latest_bucket is None or bucket_id > self.latest_bucket:
+            self.latest_bucket = bucket_id
+        elif bucket_id <= self.latest_bucket - self.num_buckets:
+            self.late_events += 1
+            return False
+
+        slot = bucket_id % self.num_buckets
+        if self.bucket_ids[slot] != bucket_id:
+            # Slot held a bucket that has slid out of the window
+            self.bucket_ids[slot] = bucket_id
+            self.buckets[slot] = {}
+        bucket = self.buckets[slot]
+
+        route = f"{event['origin_airport']}-{event['destination_airport']}"
+        stats = bucket.get(route)
+        if stats is None:
+            stats = bucket[route] = [0, 0, 0.0, 0.0, math.inf]
+
+        stats[SEARCHES] += 1
+        for offer in event.get('price_offers', ()):
+            price = offer['price']
+            # Welford update
+            stats[OFFERS] += 1
+            delta = price - stats[MEAN]
+            stats[MEAN] += delta / stats[OFFERS]
+            stats[M2] += delta * (price - stats[MEAN])
+            if price < stats[MIN_PRICE]:
+                stats[MIN_PRICE] = price
+        return True
+
+    def summary(self):
+        """
+        Combine the buckets still inside the window
+
+        Returns:
+            Dict of route -> accumulator list
+        """
+        if self.latest_bucket is None:
+            return {}
+        oldest = self.latest_bucket - self.num_buckets + 1
+        live = [bucket for bucket_id, bucket in zip(self.bucket_ids, self.buckets)
+                if bucket_id is not None and bucket_id >= oldest]
+        return merge_summaries(live)
+
+    def to_state(self):
+        """JSON-serializable window state for checkpoints"""
+        return {
+            'bucket_seconds': self.bucket_seconds,
+            'latest_bucket': self.latest_bucket,
+            'buckets': [[bucket_id, bucket] for bucket_id, bucket in
+                        zip(self.bucket_ids, self.buckets) if bucket_id is not None]
+        }
+
+    def load_state(self, state):
+        """Restore window state written by to_state"""
+        if state.get('bucket_seconds') != self.bucket_seconds:
+            print("Checkpointed window uses a different bucket size; starting empty")
+            return
+        self.latest_bucket = state['latest_bucket']
+        for bucket_id, bucket in state['buckets']:
+            slot = bucket_id % self.num_buckets
+            self.bucket_ids[slot] = bucket_id
+            self.buckets[slot] = bucket
+
+
+def finalize_stats(summary):
+    """
+    Turn accumulators into published route statistics
+
+    Returns:
+        Dict of route -> statistics dict
+    """
+    stats = {}
+    for route, (searches, offers, mean, m2, min_price) in summary.items():
+        stats[route] = {
+            'search_count': searches,
+            'offer_count': offers,
+            'avg_price': mean if offers else None,
+            # Sample standard deviation, like Spark's stddev in the Glue job
+            'price_volatility': math.sqrt(m2 / (offers - 1)) if offers > 1 else None,
+            'min_price': min_price if offers else None
+        }
+    return stats
+
+
+class ShardCheckpointer:
+    """Per-shard checkpoint files: last processed sequence number + window state"""
+
+    def __init__(self, checkpoint_dir):
+        self.checkpoint_dir = checkpoint_dir
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def _path(self, shard_id):
+        return os.path.join(self.checkpoint_dir, f'{shard_id}.json')
+
+    def load(self, shard_id):
+        """Return the shard checkpoint dict, or None if there is none"""
+        path = self._path(shard_id)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            return json.load(f)
+
+    def save(self, shard_id, sequence_number, window_state):
+        """Atomically write the shard checkpoint"""
+        path = self._path(shard_id)
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'sequence_number': sequence_number, 'window': window_state}, f)
+        os.replace(tmp_path, path)
+
+
+class KinesisShardReader:
+    """Read records from one Kinesis shard"""
+
+    # Kinesis allows 5 GetRecords calls per second per shard
+    IDLE_SLEEP_SECONDS = 0.2
+
+    def __init__(self, stream_name, shard_id, region_name='us-east-1', endpoint_url=None,
+                 start_at='TRIM_HORIZON', follow=True):
+        """
+        Args:
+            stream_name: Kinesis stream name
+            shard_id: Shard to read
+            region_name: AWS region
+            endpoint_url: Alternative endpoint (moto server, LocalStack)
+            start_at: TRIM_HORIZON or LATEST when there is no checkpoint
+            follow: Keep polling at the tip of the shard; otherwise stop there
+        """
+        self.stream_name = stream_name
+        self.shard_id = shard_id
+        self.region_name = region_name
+        self.endpoint_url = endpoint_url
+        self.start_at = start_at
+        self.follow = follow
+        self.client = None
+        self.iterator = None
+
+    def open(self, after_sequence=None):
+        """Position the reader after a checkpointed sequence number"""
+        # Created here so every worker process gets its own client
+        self.client = boto3.client('kinesis', region_name=self.region_name,
+                                   endpoint_url=self.endpoint_url)
+        kwargs = {'StreamName': self.stream_name, 'ShardId': self.shard_id}
+        if after_sequence is not None:
+            kwargs.update(ShardIteratorType='AFTER_SEQUENCE_NUMBER',
+                          StartingSequenceNumber=after_sequence)
+        else:
+            kwargs['ShardIteratorType'] = self.start_at
+        self.iterator = self.client.get_shard_iterator(**kwargs)['ShardIterator']
+
+    def read(self, limit=1000):
+        """
+        Fetch the next batch of records
+
+        Returns:
+            Tuple of (list of (sequence_number, data bytes), finished)
+        """
+        response = self.client.get_records(ShardIterator=self.iterator, Limit=limit)
+        self.iterator = response.get('NextShardIterator')
+        records = [(r['SequenceNumber'], r['Data']) for r in response['Records']]
+
+        # A closed shard has no next iterator; otherwise stop at the tip unless following
+        finished = self.iterator is None or (
+            not self.follow and not records and response.get('MillisBehindLatest', 0) == 0
+        )
+        return records, finished
+
+    @staticmethod
+    def list_shards(stream_name, region_name='us-east-1', endpoint_url=None):
+        """Shard IDs of the stream"""
+        client = boto3.client('kinesis', region_name=region_name, endpoint_url=endpoint_url)
+        shards = []
+        kwargs = {'StreamName': stream_name}
+        while True:
+            response = client.list_shards(**kwargs)
+            shards.extend(shard['ShardId'] for shard in response['Shards'])
+            if not response.get('NextToken'):
+                return shards
+            kwargs = {'NextToken': response['NextToken']}
+
+
+class FileShardReader:
+    """
+    File-backed stand-in for a Kinesis shard: one JSON event per line of
+    `<stream_dir>/<shard_id>.jsonl`, sequence number = line number
+    """
+
+    IDLE_SLEEP_SECONDS = 0.05
+
+    def __init__(self, stream_dir, shard_id, follow=False):
+        self.path = os.path.join(stream_dir, f'{shard_id}.jsonl')
+        self.shard_id = shard_id
+        self.follow = follow
+        self.file = None
+        self.sequence = 0
+
+    def open(self, after_sequence=None):
+        """Position the reader after a checkpointed sequence number"""
+        self.file = open(self.path, 'rb')
+        self.sequence = 0
+        if after_sequence is not None:
+            while self.sequence < int(after_sequence) and self.file.readline():
+                self.sequence += 1
+
+    def read(self, limit=1000):
+        """
+        Fetch the next batch of records
+
+        Returns:
+            Tuple of (list of (sequence_number, data bytes), finished)
+        """
+        records = []
+        while len(records) < limit:
+            position = self.file.tell()
+            line = self.file.readline()
+            if not line.endswith(b'\n'):
+                # End of file or a partially written line: retry it next time
+                self.file.seek(position)
+                break
+            self.sequence += 1
+            records.append((str(self.sequence), line))
+        return records, not records and not self.follow
+
+    @staticmethod
+    def list_shards(stream_dir):
+        """Shard IDs present in the stream directory"""
+        return sorted(name[:-len('.jsonl')] for name in os.listdir(stream_dir)
+                      if name.endswith('.jsonl'))
+
+
+def write_file_stream(stream_dir, num_records, num_shards=4):
+    """
+    Generate search events into a file-backed stream
+
+    Events are assigned to shards by the MD5 hash of the partition key
+    (search_id), as Kinesis does.
+
+    Args:
+        stream_dir: Directory for the shard files
+        num_records: Number of events to generate
+        num_shards: Number of shards
+    """
+    os.makedirs(stream_dir, exist_ok=True)
+    generator = FlightDataGenerator()
+    files = [open(os.path.join(stream_dir, f'shardId-{i:012d}.jsonl'), 'a')
+             for i in range(num_shards)]
+    try:
+        for _ in range(num_records):
+            event = generator.generate_search_event()
+            digest = hashlib.md5(event['search_id'].encode('utf-8')).digest()
+            shard = int.from_bytes(digest, 'big') * num_shards >> 128
+            files[shard].write(json.dumps(event) + '\n')
+    finally:
+        for f in files:
+            f.close()
+    print(f"Wrote {num_records} events to {num_shards} shards in {stream_dir}")
+
+
+def consume_shard(reader, checkpointer, summaries, stop, window_seconds, bucket_seconds,
+                  publish_interval):
+    """
+    Worker loop for one shard
+
+    Sends (shard_id, summary, report, finished) tuples to the `summaries`
+    queue every publish interval and checkpoints right after each send.
+    """
+    window = RouteWindow(window_seconds, bucket_seconds)
+    checkpoint = checkpointer.load(reader.shard_id)
+    sequence_number = None
+    if checkpoint:
+        sequence_number = checkpoint['sequence_number']
+        window.load_state(checkpoint['window'])
+    reader.open(after_sequence=sequence_number)
+
+    events = 0
+    cpu_start = time.process_time()
+    wall_start = time.perf_counter()
+    next_publish = time.monotonic() + publish_interval
+    finished = False
+
+    while not finished:
+        records, finished = reader.read()
+        for sequence_number, data in records:
+            window.add_event(json.loads(data))
+        events += len(records)
+
+        finished = finished or stop.is_set()
+        if finished or time.monotonic() >= next_publish:
+            report = {
+                'events': events,
+                'late_events': window.late_events,
+                'cpu_seconds': time.process_time() - cpu_start,
+                'wall_seconds': time.perf_counter() - wall_start
+            }
+            summaries.put((reader.shard_id, window.summary(), report, finished))
+            if sequence_number is not None:
+                checkpointer.save(reader.shard_id, sequence_number, window.to_state())
+            next_publish = time.monotonic() + publish_interval
+
+        if not records and not finished:
+            stop.wait(reader.IDLE_SLEEP_SECONDS)
+
+
+class RouteStatsPublisher:
+    """Write merged route statistics for the scoring path"""
+
+    def __init__(self, output_path=None, feature_store_dir=None, keep_snapshots=3,
+                 window_seconds=900):
+        """
+        Args:
+            output_path: JSON file replaced atomically on every publish
+            feature_store_dir: Online feature store for the streaming features
+                (a separate directory from the batch route-feature store)
+            keep_snapshots: Feature store snapshots to keep
+            window_seconds: Window length, part of the streaming feature names
+        """
+        self.output_path = output_path
+        self.feature_store_dir = feature_store_dir
+        self.keep_snapshots = keep_snapshots
+        self.feature_names = stream_feature_names(window_seconds)
+
+    def publish(self, stats):
+        """
+        Publish finalized route statistics
+
+        Args:
+            stats: Dict of route -> statistics dict (see finalize_stats)
+        """
+        if self.output_path:
+            tmp_path = self.output_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump({'published_at': datetime.now(timezone.utc).isoformat(),
+                           'routes': stats}, f)
+            os.replace(tmp_path, self.output_path)
+
+        if self.feature_store_dir:
+            frame = pd.DataFrame.from_dict(stats, orient='index', columns=STAT_COLUMNS)
+            frame = frame.rename(columns=self.feature_names)
+            write_snapshot(frame, self.feature_store_dir,
+                           features=[self.feature_names[column] for column in STAT_COLUMNS])
+            prune_snapshots(self.feature_store_dir, keep=self.keep_snapshots)
+
+
+class StreamConsumer:
+    """Run one worker process per shard and publish merged route statistics"""
+
+    def __init__(self, readers, checkpoint_dir, publisher, window_seconds=900,
+                 bucket_seconds=15, publish_interval=10.0):
+        """
+        Args:
+            readers: One KinesisShardReader or FileShardReader per shard
+            checkpoint_dir: Directory for per-shard checkpoints
+            publisher: RouteStatsPublisher
+            window_seconds: Sliding window length
+            bucket_seconds: Window bucket width
+            publish_interval: Seconds between publishes
+        """
+        self.readers = readers
+        self.checkpointer = ShardCheckpointer(checkpoint_dir)
+        self.publisher = publisher
+        self.window_seconds = window_seconds
+        self.bucket_seconds = bucket_seconds
+        self.publish_interval = publish_interval
+
+    def run(self):
+        """
+        Consume until every shard finishes (or Ctrl-C)
+
+        Returns:
+            Throughput report dict
+        """
+        context = multiprocessing.get_context('fork')
+        summaries = context.Queue()
+        stop = context.Event()
+
+        processes = [
+            context.Process(target=consume_shard,
+                            args=(reader, self.checkpointer, summaries, stop,
+                                  self.window_seconds, self.bucket_seconds,
+                                  self.publish_interval))
+            for reader in self.readers
+        ]
+        for process in processes:
+            process.start()
+        print(f"Consuming {len(processes)} shards")
+
+        latest = {}
+        reports = {}
+        running = {reader.shard_id for reader in self.readers}
+        next_publish = time.monotonic() + self.publish_interval
+        publishes = 0
+
+        try:
+            while running:
+                try:
+                    shard_id, summary, report, finished = summaries.get(timeout=0.5)
+                    latest[shard_id] = summary
+                    reports[shard_id] = report
+                    if finished:
+                        running.discard(shard_id)
+                except queue.Empty:
+                    if not any(process.is_alive() for process in processes):
+                        break
+
+                if latest and time.monotonic() >= next_publish:
+                    self.publisher.publish(finalize_stats(merge_summaries(latest.values())))
+                    publishes += 1
+                    next_publish = time.monotonic() + self.publish_interval
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            # Workers cannot exit while their last summaries sit in the queue
+            while any(process.is_alive() for process in processes):
+                try:
+                    shard_id, summary, report, _ = summaries.get(timeout=0.1)
+                    latest[shard_id] = summary
+                    reports[shard_id] = report
+                except queue.Empty:
+                    pass
+            for process in processes:
+                process.join()
+
+        stats = finalize_stats(merge_summaries(latest.values()))
+        self.publisher.publish(stats)
+        publishes += 1
+
+        report = self._throughput_report(reports)
+        report.update({'routes': len(stats), 'publishes': publishes})
+        return report
+
+    @staticmethod
+    def _throughput_report(reports):
+        events = sum(r['events'] for r in reports.values())
+        cpu_seconds = sum(r['cpu_seconds'] for r in reports.values())
+        wall_seconds = max((r['wall_seconds'] for r in reports.values()), default=0.0)
+        return {
+            'shards': len(reports),
+            'events': events,
+            'late_events': sum(r['late_events'] for r in reports.values()),
+            'events_per_sec': events / wall_seconds if wall_seconds else 0.0,
+            'events_per_sec_per_core': events / cpu_seconds if cpu_seconds else 0.0,
+            'per_shard': {
+                shard_id: {
+                    'events': r['events'],
+                    'events_per_sec_per_core':
+                        r['events'] / r['cpu_seconds'] if r['cpu_seconds'] else 0.0
+                }
+                for shard_id, r in sorted(reports.items())
+            }
+        }
+
+
+def main():
+    """Main function"""
+    parser = argparse.ArgumentParser(description='Consume flight searches into route statistics')
+    parser.add_argument('--stream-name', type=str, default=None,
+                        help='Kinesis stream to consume')
+    parser.add_argument('--region', type=str, default='us-east-1')
+    parser.add_argument('--endpoint-url', type=str, default=None,
+                        help='Alternative Kinesis endpoint (moto server, LocalStack)')
+    parser.add_argument('--start-at', type=str, default='TRIM_HORIZON',
+                        choices=['TRIM_HORIZON', 'LATEST'])
+    parser.add_argument('--stream-dir', type=str, default=None,
+                        help='File-backed stream directory (instead of Kinesis)')
+    parser.add_argument('--generate', type=int, default=0,
+                        help='Generate this many events into --stream-dir first')
+    parser.add_argument('--shards', type=int, default=4,
+                        help='Shards to generate with --generate')
+    parser.add_argument('--follow', action='store_true',
+                        help='Keep reading at the tip of each shard')
+    parser.add_argument('--checkpoint-dir', type=str, default='checkpoints')
+    parser.add_argument('--output', type=str, default='route_stats.json')
+    parser.add_argument('--feature-store-dir', type=str, default=None,
+                        help='Publish streaming-feature snapshots to this feature store '
+                             '(separate from the batch route-feature store)')
+    parser.add_argument('--window-seconds', type=int, default=900)
+    parser.add_argument('--bucket-seconds', type=int, default=15)
+    parser.add_argument('--publish-interval', type=float, default=10.0)
+
+    args = parser.parse_args()
+
+    if args.stream_dir:
+        if args.generate:
+            write_file_stream(args.stream_dir, args.generate, args.shards)
+        readers = [FileShardReader(args.stream_dir, shard_id, follow=args.follow)
+                   for shard_id in FileShardReader.list_shards(args.stream_dir)]
+    elif args.stream_name:
+        shard_ids = KinesisShardReader.list_shards(args.stream_name, args.region,
+                                                   args.endpoint_url)
+        readers = [KinesisShardReader(args.stream_name, shard_id, args.region,
+                                      args.endpoint_url, args.start_at, follow=args.follow)
+                   for shard_id in shard_ids]
+    else:
+        parser.error('one of --stream-name or --stream-dir is required')
+
+    consumer = StreamConsumer(
+        readers,
+        checkpoint_dir=args.checkpoint_dir,
+        publisher=RouteStatsPublisher(args.output, args.feature_store_dir,
+                                      window_seconds=args.window_seconds),
+        window_seconds=args.window_seconds,
+        bucket_seconds=args.bucket_seconds,
+        publish_interval=args.publish_interval
+    )
+    report = consumer.run()
+
+    print(f"\nConsumed {report['events']} events from {report['shards']} shards "
+          f"({report['late_events']} late) into {report['routes']} routes")
+    print(f"Throughput: {report['events_per_sec']:.0f} events/sec, "
+          f"{report['events_per_sec_per_core']:.0f} events/sec per core")
+    for shard_id, shard in report['per_shard'].items():
+        print(f"  {shard_id}: {shard['events']} events, "
+              f"{shard['events_per_sec_per_core']:.0f} events/sec per core")
+
+
+if __name__ == '__main__':
+    main()
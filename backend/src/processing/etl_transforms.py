@@ -0,0 +1,168 @@
+"""
+Spark Transformations for the Flight Search ETL
+
+The DataFrame transformations of the Glue ETL job, without any Glue
+dependencies, so the same code runs in the Glue job and on a local Spark
+session (pipeline benchmark, local testing).
+
+Features:
+- Explicit schema for raw search events (no schema-inference pass)
+- Flatten nested price_offers into one row per offer
+- Missing value handling, de-duplication and type conversions
+- Temporal, route and trip feature engineering
+
+Author: Ratnesh Data Engineering Team
+Date: 2024-01-20
+"""
+
+from pyspark.sql.functions import (
+    explode, col, to_date, current_date, datediff, dayofweek, weekofyear,
+    month, when, count, avg, stddev
+)
+from pyspark.sql.types import (
+    StructType, StructField, StringType, ArrayType, IntegerType, DoubleType
+)
+from pyspark.sql.window import Window
+
+
+# Raw search event as produced by kinesis_producer.FlightDataGenerator
+PRICE_OFFER_SCHEMA = StructType([
+    StructField('airline', StringType()),
+    StructField('flight_number', StringType()),
+    StructField('price', DoubleType()),
+    StructField('stops', IntegerType())
+])
+
+RAW_EVENT_SCHEMA = StructType([
+    StructField('timestamp', StringType()),
+    StructField('search_id', StringType()),
+    StructField('user_id', StringType()),
+    StructField('origin_airport', StringType()),
+    StructField('destination_airport', StringType()),
+    StructField('departure_date', StringType()),
+    StructField('return_date', StringType()),
+    StructField('number_of_passengers', IntegerType()),
+    StructField('currency', StringType()),
+    StructField('price_offers', ArrayType(PRICE_OFFER_SCHEMA)),
+    StructField('user_location', StructType([
+        StructField('ip_address', StringType()),
+        StructField('country', StringType())
+    ])),
+    StructField('device_info', StructType([
+        StructField('user_agent', StringType()),
+        StructField('platform', StringType())
+    ]))
+])
+
+
+def flatten_price_offers(raw_df):
+    """Explode the price_offers array into one row per price offer"""
+    return raw_df.select(
+        col("search_id"),
+        col("timestamp"),
+        col("user_id"),
+        col("origin_airport"),
+        col("destination_airport"),
+        col("departure_date"),
+        col("return_date"),
+        col("number_of_passengers"),
+        col("currency"),
+        explode("price_offers").alias("price_offer")
+    ).select(
+        # Select fields after explode - nested structure becomes flattened
+        col("search_id"),
+        col("timestamp"),
+        col("user_id"),
+        col("origin_airport"),
+        col("destination_airport"),
+        col("departure_date"),
+        col("return_date"),
+        col("number_of_passengers"),
+        col("currency"),
+        col("price_offer.airline").alias("airline"),
+        col("price_offer.flight_number").alias("flight_number"),
+        col("price_offer.price").alias("price"),
+        col("price_offer.stops").alias("stops")
+    )
+
+
+def clean_offers(flattened_df):
+    """
+    Fill missing values, drop duplicate offers and convert column types
+
+    Note: computing the mean price for null fills runs one Spark job.
+    """
+    # Calculate mean price for filling nulls
+    mean_price = flattened_df.select(avg("price")).collect()[0][0]
+
+    cleaned_df = flattened_df.fillna({
+        'stops': 0,
+        'price': mean_price,
+        'return_date': None  # Keep as null for one-way flights
+    })
+
+    # Remove duplicates
+    cleaned_df = cleaned_df.dropDuplicates(['search_id', 'flight_number'])
+
+    # Data type conversions
+    cleaned_df = cleaned_df.withColumn('price', col('price').cast(DoubleType()))
+    cleaned_df = cleaned_df.withColumn('stops', col('stops').cast(IntegerType()))
+    cleaned_df = cleaned_df.withColumn('number_of_passengers', col('number_of_passengers').cast(IntegerType()))
+
+    # Convert date strings to date type
+    cleaned_df = cleaned_df.withColumn('departure_date', to_date(col('departure_date')))
+    cleaned_df = cleaned_df.withColumn('return_date', to_date(col('return_date')))
+
+    return cleaned_df
+
+
+def engineer_features(cleaned_df):
+    """Add temporal, route-level and trip features"""
+    # Temporal features
+    cleaned_df = cleaned_df.withColumn('days_until_departure',
+                                       datediff(col('departure_date'), current_date()))
+    cleaned_df = cleaned_df.withColumn('day_of_week', dayofweek(col('departure_date')))
+    cleaned_df = cleaned_df.withColumn('week_of_year', weekofyear(col('departure_date')))
+    cleaned_df = cleaned_df.withColumn('month', month(col('departure_date')))
+
+    # Is weekend
+    cleaned_df = cleaned_df.withColumn('is_weekend',
+                                       when(col('day_of_week').isin([1, 7]), 1).otherwise(0))
+
+    # Season (1=Winter, 2=Spring, 3=Summer, 4=Fall)
+    cleaned_df = cleaned_df.withColumn('season',
+        when(col('month').isin([12, 1, 2]), 1)
+        .when(col('month').isin([3, 4, 5]), 2)
+        .when(col('month').isin([6, 7, 8]), 3)
+        .otherwise(4)
+    )
+
+    # Route-based features
+    window_spec = Window.partitionBy('origin_airport', 'destination_airport')
+
+    # Route popularity (count of searches for this route)
+    cleaned_df = cleaned_df.withColumn('route_popularity',
+                                       count('search_id').over(window_spec))
+
+    # Price statistics for route
+    cleaned_df = cleaned_df.withColumn('route_avg_price',
+                                       avg('price').over(window_spec))
+    cleaned_df = cleaned_df.withColumn('route_price_volatility',
+                                       stddev('price').over(window_spec))
+
+    # Competitor price difference (your price - average price)
+    cleaned_df = cleaned_df.withColumn('price_diff_from_avg',
+                                       col('price') - col('route_avg_price'))
+
+    # Is round trip
+    cleaned_df = cleaned_df.withColumn('is_round_trip',
+                                       when(col('return_date').isNotNull(), 1).otherwise(0))
+
+    # Trip duration (for round trips)
+    cleaned_df = cleaned_df.withColumn('trip_duration_days',
+        when(col('is_round_trip') == 1,
+             datediff(col('return_date'), col('departure_date'))
+        ).otherwise(0)
+    )
+
+    return cleaned_df
@@ -18,19 +18,16 @@ from awsglue.context import GlueContext
 from awsglue.job import Job
 from awsglue.utils import getResolvedOptions
 
-from pyspark.sql.functions import (
-    explode, col, from_json, get_json_object, to_date,
-    current_date, datediff, dayofweek, weekofyear, month,
-    when, count, avg, stddev, lit
-)
-from pyspark.sql.types import (
-    StructType, StructField, StringType, FloatType, ArrayType,
-    TimestampType, IntegerType, DoubleType
-)
-from pyspark.sql.window import Window
-
+import os
 import sys
 
+# Shipped with --extra-py-files; locally they live next to this script and in src/common
+if '__file__' in globals():
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+
+from etl_transforms import flatten_price_offers, clean_offers, engineer_features
+from instrumentation import configure, flush, increment, span
+
 
 # ============================================================================
 # Initialize Spark and Glue Context
@@ -44,12 +41,21 @@ spark = glueContext.spark_session
 job = Job(glueContext)
 job.init(args['JOB_NAME'], args)
 
+# Optional tracing: --TRACE_FILE (driver-local JSON lines), --TRACE_ID (set by
+# lambda_trigger to the raw object key)
+trace_args = getResolvedOptions(sys.argv, [name for name in ['TRACE_FILE', 'TRACE_ID']
+                                           if f'--{name}' in sys.argv])
+configure(trace_args.get('TRACE_FILE'), service='glue_etl_job')
+trace_id = trace_args.get('TRACE_ID', args['JOB_NAME'])
+job_span = span('glue.job', trace_id=trace_id)
+
 
 # ============================================================================
 # Step 1: Read Raw Data from S3 using Glue Data Catalog
 # ============================================================================
 
 print("Step 1: Reading raw data from Glue Data Catalog...")
+step_span = span('glue.read_raw', trace_id=trace_id)
 
 raw_data_dyf = glueContext.create_dynamic_frame.from_catalog(
     database="airline_raw_db",
@@ -59,8 +65,11 @@ raw_data_dyf = glueContext.create_dynamic_frame.from_catalog(
 # Convert to Spark DataFrame for easier operations
 raw_data_df = raw_data_dyf.toDF()
 
-print(f"Raw data count: {raw_data_df.count()}")
+raw_count = raw_data_df.count()
+increment('glue.raw_records', raw_count)
+print(f"Raw data count: {raw_count}")
 raw_data_df.printSchema()
+step_span.end()
 
 
 # ============================================================================
@@ -68,37 +77,15 @@ raw_data_df.printSchema()
 # ============================================================================
 
 print("Step 2: Flattening nested JSON structures...")
+step_span = span('glue.flatten', trace_id=trace_id)
 
 # Explode price_offers array to create one row per price offer
-flattened_df = raw_data_df.select(
-    col("search_id"),
-    col("timestamp"),
-    col("user_id"),
-    col("origin_airport"),
-    col("destination_airport"),
-    col("departure_date"),
-    col("return_date"),
-    col("number_of_passengers"),
-    col("currency"),
-    explode("price_offers").alias("price_offer")
-).select(
-    # Select fields after explode - nested structure becomes flattened
-    col("search_id"),
-    col("timestamp"),
-    col("user_id"),
-    col("origin_airport"),
-    col("destination_airport"),
-    col("departure_date"),
-    col("return_date"),
-    col("number_of_passengers"),
-    col("currency"),
-    col("price_offer.airline").alias("airline"),
-    col("price_offer.flight_number").alias("flight_number"),
-    col("price_offer.price").alias("price"),
-    col("price_offer.stops").alias("stops")
-)
+flattened_df = flatten_price_offers(raw_data_df)
 
-print(f"Flattened data count: {flattened_df.count()}")
+flattened_count = flattened_df.count()
+increment('glue.flattened_records', flattened_count)
+print(f"Flattened data count: {flattened_count}")
+step_span.end()
 
 
 # ============================================================================
@@ -106,30 +93,15 @@ print(f"Flattened data count: {flattened_df.count()}")
 # ============================================================================
 
 print("Step 3: Cleaning data...")
+step_span = span('glue.clean', trace_id=trace_id)
 
-# Handle missing values
-# Calculate mean price for filling nulls
-mean_price = flattened_df.select(avg("price")).collect()[0][0]
-
-cleaned_df = flattened_df.fillna({
-    'stops': 0,
-    'price': mean_price,
-    'return_date': None  # Keep as null for one-way flights
-})
-
-# Remove duplicates
-cleaned_df = cleaned_df.dropDuplicates(['search_id', 'flight_number'])
-
-# Data type conversions
-cleaned_df = cleaned_df.withColumn('price', col('price').cast(DoubleType()))
-cleaned_df = cleaned_df.withColumn('stops', col('stops').cast(IntegerType()))
-cleaned_df = cleaned_df.withColumn('number_of_passengers', col('number_of_passengers').cast(IntegerType()))
+# Handle missing values, remove duplicates, convert types
+cleaned_df = clean_offers(flattened_df)
 
-# Convert date strings to date type
-cleaned_df = cleaned_df.withColumn('departure_date', to_date(col('departure_date')))
-cleaned_df = cleaned_df.withColumn('return_date', to_date(col('return_date')))
-
-print(f"Cleaned data count: {cleaned_df.count()}")
+cleaned_count = cleaned_df.count()
+increment('glue.cleaned_records', cleaned_count)
+print(f"Cleaned data count: {cleaned_count}")
+step_span.end()
 
 
 # ============================================================================
@@ -137,56 +109,14 @@ print(f"Cleaned data count: {cleaned_df.count()}")
 # ============================================================================
 
 print("Step 4: Performing feature engineering...")
+step_span = span('glue.feature_engineering', trace_id=trace_id)
 
-# Temporal features
-cleaned_df = cleaned_df.withColumn('days_until_departure', 
-                                   datediff(col('departure_date'), current_date()))
-cleaned_df = cleaned_df.withColumn('day_of_week', dayofweek(col('departure_date')))
-cleaned_df = cleaned_df.withColumn('week_of_year', weekofyear(col('departure_date')))
-cleaned_df = cleaned_df.withColumn('month', month(col('departure_date')))
-
-# Is weekend
-cleaned_df = cleaned_df.withColumn('is_weekend', 
-                                   when(col('day_of_week').isin([1, 7]), 1).otherwise(0))
-
-# Season (1=Winter, 2=Spring, 3=Summer, 4=Fall)
-cleaned_df = cleaned_df.withColumn('season',
-    when(col('month').isin([12, 1, 2]), 1)
-    .when(col('month').isin([3, 4, 5]), 2)
-    .when(col('month').isin([6, 7, 8]), 3)
-    .otherwise(4)
-)
-
-# Route-based features
-window_spec = Window.partitionBy('origin_airport', 'destination_airport')
-
-# Route popularity (count of searches for this route)
-cleaned_df = cleaned_df.withColumn('route_popularity', 
-                                   count('search_id').over(window_spec))
-
-# Price statistics for route
-cleaned_df = cleaned_df.withColumn('route_avg_price', 
-                                   avg('price').over(window_spec))
-cleaned_df = cleaned_df.withColumn('route_price_volatility', 
-                                   stddev('price').over(window_spec))
-
-# Competitor price difference (your price - average price)
-cleaned_df = cleaned_df.withColumn('price_diff_from_avg', 
-                                   col('price') - col('route_avg_price'))
-
-# Is round trip
-cleaned_df = cleaned_df.withColumn('is_round_trip', 
-                                   when(col('return_date').isNotNull(), 1).otherwise(0))
-
-# Trip duration (for round trips)
-cleaned_df = cleaned_df.withColumn('trip_duration_days',
-    when(col('is_round_trip') == 1, 
-         datediff(col('return_date'), col('departure_date'))
-    ).otherwise(0)
-)
+# Temporal, route-based and trip features
+cleaned_df = engineer_features(cleaned_df)
 
 print("Feature engineering completed!")
 cleaned_df.printSchema()
+step_span.end()
 
 
 # ============================================================================
@@ -194,10 +124,12 @@ cleaned_df.printSchema()
 # ============================================================================
 
 print("Step 5: Writing curated data to S3...")
+step_span = span('glue.write_curated', trace_id=trace_id)
 
 curated_s3_path = "s3://airline-data-lake/curated/flight_searches/"
 
 cleaned_df.write.mode("overwrite").parquet(curated_s3_path)
+step_span.end()
 
 print(f"Glue ETL job completed successfully!")
 print(f"Curated data written to: {curated_s3_path}")
@@ -215,3 +147,6 @@ glueContext.write_dynamic_frame.from_options(
 )
 
 job.commit()
+
+job_span.end()
+flush()
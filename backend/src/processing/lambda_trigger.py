@@ -14,8 +14,13 @@ Date: 2024-01-20
 import json
 import boto3
 import os
+import sys
 from datetime import datetime
 
+# instrumentation.py ships in the deployment zip; in the repo it lives in src/common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from instrumentation import flush, increment, span
+
 # Initialize AWS clients
 glue_client = boto3.client('glue')
 s3_client = boto3.client('s3')
@@ -49,11 +54,13 @@ def lambda_handler(event, context):
             # Check if file is in the raw data path
             if 'raw/' not in key:
                 print(f"Skipping file (not in raw/ path): {key}")
+                increment('lambda.skipped_objects')
                 continue
             
-            # Check if file is JSON or GZIP
-            if not (key.endswith('.json') or key.endswith('.json.gz')):
+            # Check if file is JSON, GZIP or ZSTD (lake_writer.py --compression zstd)
+            if not (key.endswith('.json') or key.endswith('.json.gz') or key.endswith('.json.zst')):
                 print(f"Skipping file (not JSON): {key}")
+                increment('lambda.skipped_objects')
                 continue
             
             # Extract date partitions from key
@@ -73,11 +80,14 @@ def lambda_handler(event, context):
                     if k in date_partitions:
                         output_path += f"{k}={date_partitions[k]}/"
             
-            # Start Glue ETL job
-            response = start_glue_job(
-                input_path=f"s3://{bucket}/{key}",
-                output_path=output_path
-            )
+            # Start Glue ETL job; the object key traces this batch into Glue
+            with span('lambda.start_glue_job', trace_id=key, bucket=bucket):
+                response = start_glue_job(
+                    input_path=f"s3://{bucket}/{key}",
+                    output_path=output_path,
+                    trace_id=key
+                )
+            increment('lambda.glue_jobs_started')
             
             print(f"Glue job started: {response}")
         
@@ -91,6 +101,7 @@ def lambda_handler(event, context):
     
     except Exception as e:
         print(f"Error: {str(e)}")
+        increment('lambda.errors')
         return {
             'statusCode': 500,
             'body': json.dumps({
@@ -99,27 +110,36 @@ def lambda_handler(event, context):
             })
         }
 
+    finally:
+        # The execution environment may be frozen after returning
+        flush()
+
 
-def start_glue_job(input_path, output_path):
+def start_glue_job(input_path, output_path, trace_id=None):
     """
     Start AWS Glue ETL job
     
     Args:
         input_path: S3 path to input data
         output_path: S3 path for output data
+        trace_id: Trace ID handed to the Glue job (--TRACE_ID)
     
     Returns:
         Glue job run response
     """
     try:
+        arguments = {
+            '--S3_INPUT_PATH': input_path,
+            '--S3_OUTPUT_PATH': output_path,
+            '--enable-metrics': 'true',
+            '--enable-continuous-cloudwatch-log': 'true'
+        }
+        if trace_id:
+            arguments['--TRACE_ID'] = trace_id
+
         response = glue_client.start_job_run(
             JobName=GLUE_JOB_NAME,
-            Arguments={
-                '--S3_INPUT_PATH': input_path,
-                '--S3_OUTPUT_PATH': output_path,
-                '--enable-metrics': 'true',
-                '--enable-continuous-cloudwatch-log': 'true'
-            }
+            Arguments=arguments
         )
         
         job_run_id = response['JobRunId']
@@ -0,0 +1,343 @@
+"""
+Rolling-Origin Backtesting for the Price Prediction Model
+
+This script measures how the XGBoost price model performs over time instead
+of on a single static validation set. For every forecast origin it trains on
+the preceding window of data and evaluates on the window that follows.
+
+Features:
+- Rolling time windows (train window, test horizon, step) over the data
+- Windows trained and evaluated in parallel worker processes
+- Vectorized per-segment metrics (route, days-until-departure bucket, airline)
+- Compact metrics table written to CSV or Parquet
+
+Author: Ratnesh ML Engineering Team
+Date: 2024-01-20
+"""
+
+import argparse
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+import xgboost as xgb
+
+from train_xgboost import load_data, train_model
+
+
+# Identifiers and raw dates that must not be used as model features
+NON_FEATURE_COLUMNS = [
+    'search_id', 'user_id', 'flight_number', 'timestamp',
+    'departure_date', 'return_date'
+]
+
+# Days-until-departure buckets (right-inclusive edges)
+DTD_BUCKET_EDGES = [-1, 7, 14, 30, 60, 90, np.inf]
+DTD_BUCKET_LABELS = ['0-7', '8-14', '15-30', '31-60', '61-90', '90+']
+
+# Worker-process globals, populated once per worker by _init_worker
+_WORKER_DATA = None
+_WORKER_CONFIG = None
+
+
+def build_windows(timestamps, train_days, test_days, step_days, max_windows=None):
+    """
+    Build rolling-origin (train, test) time windows
+
+    Args:
+        timestamps: Series of event timestamps
+        train_days: Length of each training window in days
+        test_days: Length of each test horizon in days
+        step_days: Distance between consecutive forecast origins in days
+        max_windows: Optional cap on the number of windows (latest kept)
+
+    Returns:
+        List of dicts with train_start, test_start and test_end timestamps
+    """
+    start = timestamps.min().normalize()
+    end = timestamps.max()
+
+    train_delta = pd.Timedelta(days=train_days)
+    test_delta = pd.Timedelta(days=test_days)
+    step_delta = pd.Timedelta(days=step_days)
+
+    windows = []
+    origin = start + train_delta
+    while origin < end:
+        windows.append({
+            'train_start': origin - train_delta,
+            'test_start': origin,
+            'test_end': origin + test_delta
+        })
+        origin += step_delta
+
+    if max_windows is not None:
+        windows = windows[-max_windows:]
+
+    for i, window in enumerate(windows):
+        window['window'] = i
+
+    return windows
+
+
+def add_segments(df):
+    """Add the segment columns used for per-segment metrics"""
+    segments = pd.DataFrame(index=df.index)
+    segments['route'] = df['origin_airport'].astype(str) + '-' + df['destination_airport'].astype(str)
+    segments['airline'] = df['airline'].astype(str)
+    segments['dtd_bucket'] = pd.cut(
+        df['days_until_departure'], bins=DTD_BUCKET_EDGES, labels=DTD_BUCKET_LABELS
+    ).astype(str)
+    return segments
+
+
+def encode_features(df, target_column):
+    """
+    One-hot encode the whole dataset once, before it is sliced into windows
+
+    Every window then shares one fixed column set, and no category is dropped
+    (with drop_first the reference category would depend on the window).
+    Missing values are left in place: run_window fills them with the means of
+    its training range only.
+
+    Returns:
+        Tuple of (X, y) aligned with df's index
+    """
+    feature_frame = df.drop(columns=[c for c in NON_FEATURE_COLUMNS + [target_column]
+                                     if c in df.columns])
+    categorical_cols = feature_frame.select_dtypes(include=['object']).columns.tolist()
+    X = pd.get_dummies(feature_frame, columns=categorical_cols)
+    return X, df[target_column]
+
+
+def segment_metrics(y_true, y_pred, segments, segment_columns):
+    """
+    Compute RMSE, MAE, bias and R² per segment with grouped operations
+
+    Args:
+        y_true: Array of actual prices
+        y_pred: Array of predicted prices
+        segments: DataFrame of segment labels aligned with y_true
+        segment_columns: Segment columns to group by (plus an overall row)
+
+    Returns:
+        Long-format DataFrame with one row per (segment_type, segment)
+    """
+    error = y_pred - y_true
+    frame = pd.DataFrame({
+        'n': 1,
+        'err': error,
+        'abs_err': np.abs(error),
+        'sq_err': error ** 2,
+        'y': y_true,
+        'y_sq': y_true ** 2
+    })
+
+    sums = [frame.sum().to_frame().T.assign(segment_type='overall', segment='all')]
+    for column in segment_columns:
+        grouped = frame.groupby(segments[column].values, sort=False).sum()
+        sums.append(grouped.assign(segment_type=column).rename_axis('segment').reset_index())
+    sums = pd.concat(sums, ignore_index=True)
+
+    # Metrics from sufficient statistics: SS_tot = sum(y²) - n·mean(y)²
+    n = sums['n'].to_numpy(dtype=np.float64)
+    ss_tot = sums['y_sq'] - sums['y'] ** 2 / n
+    with np.errstate(divide='ignore', invalid='ignore'):
+        r2 = np.where(ss_tot > 0, 1.0 - sums['sq_err'] / ss_tot, np.nan)
+
+    return pd.DataFrame({
+        'segment_type': sums['segment_type'],
+        'segment': sums['segment'].astype(str),
+        'n': sums['n'].astype(np.int64),
+        'rmse': np.sqrt(sums['sq_err'] / n),
+        'mae': sums['abs_err'] / n,
+        'bias': sums['err'] / n,
+        'r2': r2
+    })
+
+
+def _init_worker(data, config):
+    """Store the shared (encoded) dataset and configuration in the worker process"""
+    global _WORKER_DATA, _WORKER_CONFIG
+    _WORKER_DATA = data
+    _WORKER_CONFIG = config
+
+
+def run_window(window):
+    """
+    Train on one window's training range and evaluate on its test horizon
+
+    Args:
+        window: Dict produced by build_windows
+
+    Returns:
+        Per-segment metrics DataFrame for the window, or None if the window
+        has no training or test data
+    """
+    data = _WORKER_DATA
+    config = _WORKER_CONFIG
+
+    timestamps = data['timestamps']
+    train_mask = (timestamps >= window['train_start']) & (timestamps < window['test_start'])
+    test_mask = (timestamps >= window['test_start']) & (timestamps < window['test_end'])
+
+    if not train_mask.any() or not test_mask.any():
+        return None
+
+    X, y = data['X'], data['y']
+    X_train, y_train = X[train_mask], y[train_mask]
+    X_test, y_test = X[test_mask], y[test_mask]
+
+    # Fill with training-range means only, so the test horizon never leaks
+    train_means = X_train.mean()
+    X_train = X_train.fillna(train_means)
+    X_test = X_test.fillna(train_means)
+
+    # Early stopping (off by default) would watch the test horizon, so keep it
+    # disabled for a strictly out-of-sample evaluation
+    model = train_model(
+        X_train, y_train, X_test, y_test, config['params'], config['num_round'],
+        early_stopping_rounds=config['early_stopping_rounds']
+    )
+
+    y_pred = model.predict(xgb.DMatrix(X_test))
+
+    metrics = segment_metrics(
+        y_test.to_numpy(dtype=np.float64),
+        y_pred.astype(np.float64),
+        data['segments'][test_mask],
+        config['segment_columns']
+    )
+    metrics.insert(0, 'window', window['window'])
+    metrics.insert(1, 'train_start', window['train_start'])
+    metrics.insert(2, 'test_start', window['test_start'])
+    return metrics
+
+
+def compact_metrics(metrics):
+    """Shrink the metrics table: categorical labels and float32 values"""
+    metrics = metrics.copy()
+    metrics['window'] = metrics['window'].astype(np.int32)
+    metrics['n'] = metrics['n'].astype(np.int32)
+    for column in ['segment_type', 'segment']:
+        metrics[column] = metrics[column].astype('category')
+    for column in ['rmse', 'mae', 'bias', 'r2']:
+        metrics[column] = metrics[column].astype(np.float32)
+    return metrics
+
+
+def run_backtest(df, config, windows, workers=None):
+    """
+    Run all backtest windows in parallel worker processes
+
+    Args:
+        df: Curated dataset including the time and target columns
+        config: Backtest configuration dict
+        windows: Windows produced by build_windows
+        workers: Number of worker processes (defaults to CPU count)
+
+    Returns:
+        Compact metrics DataFrame across all windows
+    """
+    workers = workers or os.cpu_count()
+
+    X, y = encode_features(df, config['target_column'])
+    print(f"Encoded features: {X.shape}")
+    data = {
+        'timestamps': df[config['time_column']],
+        'X': X,
+        'y': y,
+        'segments': add_segments(df)
+    }
+
+    print(f"Running {len(windows)} backtest windows on {workers} workers")
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(data, config)) as executor:
+        for window, metrics in zip(windows, executor.map(run_window, windows)):
+            if metrics is None:
+                print(f"Window {window['window']}: skipped (no data)")
+                continue
+            overall = metrics[metrics['segment_type'] == 'overall'].iloc[0]
+            print(f"Window {window['window']} ({window['test_start'].date()}): "
+                  f"RMSE {overall['rmse']:.2f}, MAE {overall['mae']:.2f}, n={overall['n']}")
+            results.append(metrics)
+
+    if not results:
+        raise ValueError("No backtest window contained both training and test data")
+
+    return compact_metrics(pd.concat(results, ignore_index=True))
+
+
+def parse_args():
+    """Parse command-line arguments"""
+    parser = argparse.ArgumentParser(description='Rolling-origin backtest of the price model')
+
+    parser.add_argument('--data', type=str, required=True,
+                        help='Directory of curated CSV files')
+    parser.add_argument('--output', type=str, default='backtest_metrics.csv',
+                        help='Metrics table path (.csv or .parquet)')
+    parser.add_argument('--time-column', type=str, default='timestamp')
+    parser.add_argument('--target-column', type=str, default='price')
+    parser.add_argument('--train-days', type=int, default=28)
+    parser.add_argument('--test-days', type=int, default=7)
+    parser.add_argument('--step-days', type=int, default=7)
+    parser.add_argument('--max-windows', type=int, default=None)
+    parser.add_argument('--workers', type=int, default=None)
+
+    # Hyperparameters (same defaults as train_xgboost)
+    parser.add_argument('--objective', type=str, default='reg:squarederror')
+    parser.add_argument('--num_round', type=int, default=100)
+    parser.add_argument('--max_depth', type=int, default=6)
+    parser.add_argument('--eta', type=float, default=0.3)
+    parser.add_argument('--subsample', type=float, default=0.8)
+    parser.add_argument('--colsample_bytree', type=float, default=0.8)
+    parser.add_argument('--early_stopping_rounds', type=int, default=None)
+
+    return parser.parse_args()
+
+
+def main():
+    """Main backtest function"""
+    args = parse_args()
+
+    df = load_data(args.data)
+    df[args.time_column] = pd.to_datetime(df[args.time_column], utc=True)
+
+    windows = build_windows(df[args.time_column], args.train_days, args.test_days,
+                            args.step_days, args.max_windows)
+
+    config = {
+        'time_column': args.time_column,
+        'target_column': args.target_column,
+        'segment_columns': ['route', 'dtd_bucket', 'airline'],
+        'num_round': args.num_round,
+        'early_stopping_rounds': args.early_stopping_rounds,
+        'params': {
+            'objective': args.objective,
+            'max_depth': args.max_depth,
+            'eta': args.eta,
+            'subsample': args.subsample,
+            'colsample_bytree': args.colsample_bytree,
+            'eval_metric': 'rmse',
+            'seed': 42,
+            # One thread per worker: parallelism comes from the process pool
+            'nthread': 1
+        }
+    }
+
+    metrics = run_backtest(df, config, windows, workers=args.workers)
+
+    if args.output.endswith('.parquet'):
+        metrics.to_parquet(args.output, index=False)
+    else:
+        metrics.to_csv(args.output, index=False)
+
+    print(f"\nBacktest completed: {metrics['window'].nunique()} windows, {len(metrics)} metric rows")
+    print(f"Metrics written to: {args.output}")
+
+
+if __name__ == '__main__':
+    main()
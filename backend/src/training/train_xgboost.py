@@ -7,6 +7,7 @@ Features:
 - Loads training and validation data from S3
 - Trains XGBoost model with specified hyperparameters
 - Evaluates model performance (RMSE, MAE, R²)
+- Periodically checkpoints the booster so interrupted runs can resume
 - Saves trained model artifacts to S3
 
 Author:Ratnesh ML Engineering Team
@@ -16,12 +17,179 @@ Date: 2024-01-20
 import argparse
 import os
 import json
+import sys
+import time
 import pandas as pd
 import numpy as np
 import xgboost as xgb
 from sklearn.metrics import mean_squared_error, mean_absolute_error, r2_score
 import joblib
 
+# instrumentation.py ships with the estimator (dependencies=[...instrumentation.py],
+# see SYSTEM_DESIGN.md); in the repo it lives in src/common
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'common'))
+from instrumentation import configure, enabled, record_latency, span
+
+
+CHECKPOINT_MODEL_FILE = 'xgboost-checkpoint.json'
+
+# Booster attribute holding the early-stopping state, so booster and state
+# live in one file and are replaced together
+CHECKPOINT_STATE_ATTR = 'checkpoint_state'
+
+# Row / column sampling parameters. XGBoost does not expose its sampling RNG
+# state, so a resumed run draws different samples than an uninterrupted one
+SAMPLING_PARAMS = ['subsample', 'colsample_bytree', 'colsample_bylevel', 'colsample_bynode']
+
+
+def sampling_params(params):
+    """Sampling parameters below 1.0 (these make resumed training diverge)"""
+    return {name: params[name] for name in SAMPLING_PARAMS if params.get(name, 1.0) < 1.0}
+
+
+class CheckpointCallback(xgb.callback.TrainingCallback):
+    """
+    XGBoost callback that checkpoints the booster every N rounds.
+    
+    The callback also performs early stopping itself so that the best score
+    and the rounds-without-improvement counter can be saved alongside the
+    booster and restored on resume. Without row / column sampling the resumed
+    run continues exactly where the run stopped; with sampling it would not
+    (see SAMPLING_PARAMS), so train_model refuses to resume in that case.
+    """
+    
+    def __init__(self, checkpoint_dir, interval=10, early_stopping_rounds=10,
+                 data_name='validation', metric_name='rmse', state=None):
+        """
+        Initialize checkpoint callback
+        
+        Args:
+            checkpoint_dir: Local directory for checkpoint files
+            interval: Save a checkpoint every `interval` rounds
+            early_stopping_rounds: Stop after this many rounds without improvement
+                (None disables early stopping)
+            data_name: Name of the evaluation set used for early stopping
+            metric_name: Metric used for early stopping (lower is better)
+            state: Checkpoint state restored by `load_checkpoint` (for resume)
+        """
+        super().__init__()
+        self.checkpoint_dir = checkpoint_dir
+        self.interval = interval
+        self.early_stopping_rounds = early_stopping_rounds
+        self.data_name = data_name
+        self.metric_name = metric_name
+        
+        state = state or {}
+        self.best_score = state.get('best_score')
+        self.best_iteration = state.get('best_iteration')
+        self.rounds_without_improvement = state.get('rounds_without_improvement', 0)
+        self.stopped = False
+        self.starting_round = 0
+        self.last_saved_round = None
+        
+        os.makedirs(checkpoint_dir, exist_ok=True)
+    
+    def before_training(self, model):
+        # xgb.train restarts `epoch` at 0 when continuing from a saved booster
+        self.starting_round = model.num_boosted_rounds()
+        return model
+    
+    def after_iteration(self, model, epoch, evals_log):
+        epoch += self.starting_round
+        score = evals_log[self.data_name][self.metric_name][-1]
+        
+        if self.best_score is None or score < self.best_score:
+            self.best_score = float(score)
+            self.best_iteration = epoch
+            self.rounds_without_improvement = 0
+        else:
+            self.rounds_without_improvement += 1
+        
+        if (self.early_stopping_rounds is not None
+                and self.rounds_without_improvement >= self.early_stopping_rounds):
+            self.stopped = True
+        
+        if self.stopped or (epoch + 1) % self.interval == 0:
+            self.save(model, epoch + 1)
+        
+        return self.stopped
+    
+    def after_training(self, model):
+        if self.last_saved_round != model.num_boosted_rounds():
+            self.save(model, model.num_boosted_rounds())
+        return model
+    
+    def save(self, model, completed_rounds):
+        """Atomically write the booster and training state to the checkpoint directory"""
+        model_path = os.path.join(self.checkpoint_dir, CHECKPOINT_MODEL_FILE)
+        
+        state = {
+            'best_score': self.best_score,
+            'best_iteration': self.best_iteration,
+            'rounds_without_improvement': self.rounds_without_improvement,
+            'stopped': self.stopped
+        }
+        
+        # Write to a temporary file first so an interruption mid-write never
+        # leaves a truncated checkpoint behind (the model keeps its .json
+        # extension, which XGBoost uses to pick the serialization format).
+        # The state travels inside the booster: one os.replace swaps both.
+        tmp_model_path = os.path.join(self.checkpoint_dir, 'tmp-' + CHECKPOINT_MODEL_FILE)
+        # Best round travels with every checkpoint, so a booster restored from
+        # a finished (early-stopped) run still carries it
+        if self.best_iteration is not None:
+            model.set_attr(best_score=str(self.best_score),
+                           best_iteration=str(self.best_iteration))
+        model.set_attr(**{CHECKPOINT_STATE_ATTR: json.dumps(state)})
+        try:
+            model.save_model(tmp_model_path)
+        finally:
+            # Keep the state out of the final model artifact
+            model.set_attr(**{CHECKPOINT_STATE_ATTR: None})
+        os.replace(tmp_model_path, model_path)
+        self.last_saved_round = completed_rounds
+        
+        print(f"Checkpoint saved at round {completed_rounds} to {self.checkpoint_dir}")
+
+
+class RoundTimingCallback(xgb.callback.TrainingCallback):
+    """Record the duration of every boosting round (train.boost_round histogram)"""
+
+    def before_iteration(self, model, epoch, evals_log):
+        self.round_start = time.perf_counter()
+        return False
+
+    def after_iteration(self, model, epoch, evals_log):
+        record_latency('train.boost_round', time.perf_counter() - self.round_start)
+        return False
+
+
+def load_checkpoint(checkpoint_dir):
+    """
+    Load the latest checkpoint from a directory
+    
+    Args:
+        checkpoint_dir: Directory written by CheckpointCallback
+    
+    Returns:
+        Tuple of (booster, state), or (None, None) if no checkpoint exists;
+        state['round'] is the booster's own number of boosted rounds
+    """
+    model_path = os.path.join(checkpoint_dir, CHECKPOINT_MODEL_FILE)
+    
+    if not os.path.exists(model_path):
+        return None, None
+    
+    booster = xgb.Booster()
+    booster.load_model(model_path)
+    
+    state = json.loads(booster.attr(CHECKPOINT_STATE_ATTR) or '{}')
+    booster.set_attr(**{CHECKPOINT_STATE_ATTR: None})
+    state['round'] = booster.num_boosted_rounds()
+    
+    print(f"Loaded checkpoint from {checkpoint_dir} (round {state['round']})")
+    return booster, state
+
 
 def parse_args():
     """Parse command-line arguments"""
@@ -36,6 +204,21 @@ def parse_args():
     parser.add_argument('--colsample_bytree', type=float, default=0.8)
     parser.add_argument('--min_child_weight', type=int, default=1)
     parser.add_argument('--gamma', type=float, default=0)
+    parser.add_argument('--early_stopping_rounds', type=int, default=10)
+    
+    # Checkpointing (for spot / interruptible training capacity)
+    parser.add_argument('--checkpoint-dir', type=str, default=None,
+                        help='Local directory for periodic booster checkpoints')
+    parser.add_argument('--checkpoint-interval', type=int, default=10,
+                        help='Save a checkpoint every N boosting rounds')
+    parser.add_argument('--resume', action='store_true',
+                        help='Resume training from the checkpoint in --checkpoint-dir '
+                             '(requires --subsample 1 and --colsample_bytree 1: sampled '
+                             'rounds cannot be replayed exactly after an interruption)')
+    
+    # Tracing (spans, per-round timings) as JSON lines
+    parser.add_argument('--trace-file', type=str, default=None,
+                        help='Write pipeline trace records to this file')
     
     # SageMaker specific arguments
     parser.add_argument('--model-dir', type=str, default=os.environ.get('SM_MODEL_DIR'))
@@ -43,7 +226,13 @@ def parse_args():
     parser.add_argument('--validation', type=str, default=os.environ.get('SM_CHANNEL_VALIDATION'))
     parser.add_argument('--output-data-dir', type=str, default=os.environ.get('SM_OUTPUT_DATA_DIR'))
     
-    return parser.parse_args()
+    args = parser.parse_args()
+    if args.resume and args.checkpoint_dir is None:
+        parser.error('--resume requires --checkpoint-dir')
+    sampling = sampling_params(vars(args))
+    if args.resume and sampling:
+        parser.error(f'--resume requires no row / column sampling, got {sampling}')
+    return args
 
 
 def load_data(data_path):
@@ -86,8 +275,28 @@ def prepare_features(df, target_column='price'):
     return X, y
 
 
-def train_model(X_train, y_train, X_val, y_val, params, num_round):
-    """Train XGBoost model"""
+def train_model(X_train, y_train, X_val, y_val, params, num_round,
+                early_stopping_rounds=10, checkpoint_dir=None,
+                checkpoint_interval=10, resume=False):
+    """
+    Train XGBoost model
+    
+    Args:
+        X_train, y_train: Training features and target
+        X_val, y_val: Validation features and target
+        params: XGBoost parameters
+        num_round: Total number of boosting rounds
+        early_stopping_rounds: Rounds without improvement before stopping
+        checkpoint_dir: Local directory for periodic checkpoints (None disables)
+        checkpoint_interval: Save a checkpoint every N rounds
+        resume: Continue from the checkpoint in `checkpoint_dir` if one exists
+    
+    Returns:
+        Trained XGBoost Booster
+    
+    Raises:
+        ValueError: If resuming with row / column sampling below 1.0
+    """
     print("Training XGBoost model...")
     
     # Create DMatrix for XGBoost
@@ -97,14 +306,56 @@ def train_model(X_train, y_train, X_val, y_val, params, num_round):
     # Watchlist for monitoring
     watchlist = [(dtrain, 'train'), (dval, 'validation')]
     
-    # Train model
+    # Per-round timings only when tracing is on
+    timing_callbacks = [RoundTimingCallback()] if enabled() else []
+    
+    if checkpoint_dir is None:
+        # Train model
+        model = xgb.train(
+            params=params,
+            dtrain=dtrain,
+            num_boost_round=num_round,
+            evals=watchlist,
+            early_stopping_rounds=early_stopping_rounds,
+            verbose_eval=10,
+            callbacks=timing_callbacks
+        )
+        
+        print("Training completed!")
+        return model
+    
+    # Restore booster and early-stopping state from the last checkpoint
+    initial_model, state = None, None
+    if resume:
+        sampling = sampling_params(params)
+        if sampling:
+            raise ValueError(f"Cannot resume exactly with row / column sampling {sampling}: "
+                             "XGBoost's sampling RNG state is not checkpointed")
+        initial_model, state = load_checkpoint(checkpoint_dir)
+        if initial_model is None:
+            print(f"No checkpoint found in {checkpoint_dir}, starting from scratch")
+    
+    completed_rounds = state['round'] if state else 0
+    if state and (state.get('stopped') or completed_rounds >= num_round):
+        print(f"Checkpoint already finished training at round {completed_rounds}")
+        return initial_model
+    
+    checkpoint_callback = CheckpointCallback(
+        checkpoint_dir=checkpoint_dir,
+        interval=checkpoint_interval,
+        early_stopping_rounds=early_stopping_rounds,
+        state=state
+    )
+    
+    # Train model (num_boost_round counts the additional rounds when resuming)
     model = xgb.train(
         params=params,
         dtrain=dtrain,
-        num_boost_round=num_round,
+        num_boost_round=num_round - completed_rounds,
         evals=watchlist,
-        early_stopping_rounds=10,
-        verbose_eval=10
+        verbose_eval=10,
+        xgb_model=initial_model,
+        callbacks=[checkpoint_callback] + timing_callbacks
     )
     
     print("Training completed!")
@@ -159,14 +410,21 @@ def save_model(model, model_dir, feature_names):
 def main():
     """Main training function"""
     args = parse_args()
+    if args.trace_file:
+        configure(args.trace_file, service='train_xgboost')
+    
+    # All spans of this run share the SageMaker training job name as trace ID
+    trace_id = os.environ.get('TRAINING_JOB_NAME')
     
     # Load training data
-    train_df = load_data(args.train)
-    val_df = load_data(args.validation)
+    with span('train.load_data', trace_id=trace_id):
+        train_df = load_data(args.train)
+        val_df = load_data(args.validation)
     
     # Prepare features
-    X_train, y_train = prepare_features(train_df)
-    X_val, y_val = prepare_features(val_df)
+    with span('train.prepare_features', trace_id=trace_id):
+        X_train, y_train = prepare_features(train_df)
+        X_val, y_val = prepare_features(val_df)
     
     # Ensure same columns in train and validation
     # (important after one-hot encoding)
@@ -188,10 +446,19 @@ def main():
     print(f"Training with parameters: {params}")
     
     # Train model
-    model = train_model(X_train, y_train, X_val, y_val, params, args.num_round)
+    with span('train.fit', trace_id=trace_id, rows=len(X_train)) as fit_span:
+        model = train_model(
+            X_train, y_train, X_val, y_val, params, args.num_round,
+            early_stopping_rounds=args.early_stopping_rounds,
+            checkpoint_dir=args.checkpoint_dir,
+            checkpoint_interval=args.checkpoint_interval,
+            resume=args.resume
+        )
+        fit_span.set(rounds=model.num_boosted_rounds())
     
     # Evaluate model
-    metrics = evaluate_model(model, X_val, y_val)
+    with span('train.evaluate', trace_id=trace_id):
+        metrics = evaluate_model(model, X_val, y_val)
     
     # Save metrics
     metrics_path = os.path.join(args.output_data_dir, 'metrics.json')
@@ -199,7 +466,8 @@ def main():
         json.dump(metrics, f)
     
     # Save model
-    save_model(model, args.model_dir, X_train.columns.tolist())
+    with span('train.save_model', trace_id=trace_id):
+        save_model(model, args.model_dir, X_train.columns.tolist())
     
     print("Training pipeline completed successfully!")
 